@@ -0,0 +1,246 @@
+'''Быстрый путь чтения списков: строки выбираются через values_list(), а
+словари ответа собираются заранее подготовленными функциями доступа -
+без создания экземпляров моделей и без обхода полей DRF на каждой строке.
+
+`compile_serializer` разбирает поля сериализатора (уже суженные
+`?fields=`, `?omit=` и `?expand=`) и возвращает `CompiledSerializer` или
+`None`, если какое-то поле нельзя прочитать из столбцов, - тогда список
+строит обычный сериализатор. Вывод совпадает с выводом сериализатора
+побайтно:
+
+* столбец модели выводится как есть, если его поле DRF не меняет значение
+  из базы (строки, целые и дробные числа, булевы значения); остальные
+  значения (даты, аннотации) проходят через `to_representation` того же
+  поля, None выводится как None;
+* SlugRelatedField читает столбец связанной модели через JOIN, а для
+  объектов, подставленных менеджером (title.reviews), берёт значение из
+  уже загруженного объекта;
+* вложенный сериализатор внешнего ключа собирается из столбцов JOIN,
+  вложенный список «многие ко многим» - одним запросом на страницу, в
+  порядке prefetch_related.
+'''
+from operator import itemgetter
+
+from django.core.exceptions import FieldDoesNotExist
+from django.db import connections
+from django.db.models import F, Window
+from django.db.models.functions import RowNumber
+from rest_framework import serializers
+
+PASS_THROUGH = {
+    serializers.BooleanField.to_representation,
+    serializers.CharField.to_representation,
+    serializers.FloatField.to_representation,
+    serializers.IntegerField.to_representation,
+}
+
+
+def plain_serializer(serializer):
+    return (type(serializer).to_representation
+            is serializers.Serializer.to_representation)
+
+
+def converted(index, convert):
+    def get(row):
+        value = row[index]
+        return None if value is None else convert(value)
+    return get
+
+
+def record(accessors):
+    def get(row):
+        return {name: accessor(row) for name, accessor in accessors}
+    return get
+
+
+class Rows:
+    '''Строки values_list() для пагинатора. Число строк считается по
+    исходному запросу: JOIN столбцов вывода не попадают в COUNT(*).'''
+
+    def __init__(self, queryset, rows):
+        self.queryset = queryset
+        self.rows = rows
+        self.ordered = rows.ordered
+
+    def count(self):
+        return self.queryset.count()
+
+    def __getitem__(self, key):
+        return self.rows[key]
+
+    def __iter__(self):
+        return iter(self.rows)
+
+    def __len__(self):
+        return len(self.rows)
+
+    def iterator(self, chunk_size):
+        return self.rows.iterator(chunk_size)
+
+
+class CompiledSerializer:
+    '''Столбцы `lookups` для values_list() и функции доступа полей.'''
+
+    def __init__(self, queryset):
+        self.queryset = queryset
+        self.model = queryset.model
+        self.lookups = []
+        self.positions = {}
+        self.accessors = []
+        self.fetchers = []
+
+    def column(self, lookup):
+        if lookup not in self.positions:
+            self.positions[lookup] = len(self.lookups)
+            self.lookups.append(lookup)
+        return self.positions[lookup]
+
+    def rows(self, queryset=None):
+        queryset = self.queryset if queryset is None else queryset
+        rows = queryset.prefetch_related(None).values_list(*self.lookups)
+        if queryset.query.group_by is True:
+            # values() группирует по всем столбцам модели; как и при
+            # выборке экземпляров, достаточно выбранных столбцов.
+            rows.query.group_by = True
+        return Rows(queryset, rows)
+
+    def serialize(self, rows):
+        rows = list(rows)
+        for fetch in self.fetchers:
+            fetch(rows)
+        get = record(self.accessors)
+        return [get(row) for row in rows]
+
+    def compile(self, serializer):
+        if self.queryset.query.group_by is True:
+            self.column(self.model._meta.pk.attname)
+        for field in serializer._readable_fields:
+            accessor = self.accessor(field, self.model)
+            if accessor is None:
+                return False
+            self.accessors.append((field.field_name, accessor))
+        return True
+
+    def accessor(self, field, model, prefix=''):
+        source = field.source
+        if not prefix and source in self.queryset.query.annotations:
+            return converted(self.column(source), field.to_representation)
+        if source == '*' or '.' in source:
+            return None
+        try:
+            model_field = model._meta.get_field(source)
+        except FieldDoesNotExist:
+            # Свойство модели.
+            return None
+        if isinstance(field, serializers.ListSerializer):
+            return None if prefix else self.many(field, model_field)
+        if isinstance(field, serializers.BaseSerializer):
+            return None if prefix else self.nested(field, model_field)
+        if isinstance(field, serializers.SlugRelatedField):
+            return self.slug(field, model_field, prefix)
+        if model_field.is_relation or not model_field.concrete:
+            return None
+        index = self.column(prefix + model_field.attname)
+        if type(field).to_representation in PASS_THROUGH:
+            return itemgetter(index)
+        return converted(index, field.to_representation)
+
+    def slug(self, field, model_field, prefix):
+        if not (model_field.many_to_one or model_field.one_to_one):
+            return None
+        known = (self.queryset._known_related_objects.get(model_field)
+                 if not prefix else None)
+        if known:
+            values = {pk: getattr(instance, field.slug_field)
+                      for pk, instance in known.items()}
+            index = self.column(model_field.attname)
+            return lambda row: values.get(row[index])
+        return itemgetter(self.column(
+            f'{prefix}{model_field.name}__{field.slug_field}'))
+
+    def nested(self, field, model_field):
+        if (not (model_field.many_to_one or model_field.one_to_one)
+                or not plain_serializer(field)):
+            return None
+        prefix = f'{model_field.name}__'
+        accessors = []
+        for child in field._readable_fields:
+            accessor = self.accessor(child, model_field.related_model, prefix)
+            if accessor is None:
+                return None
+            accessors.append((child.field_name, accessor))
+        key = self.column(model_field.attname)
+        get = record(accessors)
+        return lambda row: None if row[key] is None else get(row)
+
+    def many(self, field, model_field):
+        if (not model_field.many_to_many or not model_field.concrete
+                or not plain_serializer(field.child)
+                or self.custom_prefetch(model_field.name)):
+            return None
+        related = CompiledSerializer(
+            model_field.related_model._default_manager.all())
+        if not related.compile(field.child):
+            return None
+        owner = related.column(model_field.related_query_name())
+        key = self.column(self.model._meta.pk.attname)
+        groups = {}
+
+        def fetch(rows):
+            groups.clear()
+            if not rows:
+                return
+            queryset = related.queryset.filter(**{
+                f'{model_field.related_query_name()}__in':
+                    {row[key] for row in rows}
+            })
+            get = record(related.accessors)
+            for row in related.rows(queryset):
+                groups.setdefault(row[owner], []).append(get(row))
+
+        self.fetchers.append(fetch)
+        return lambda row: groups.get(row[key], [])
+
+    def custom_prefetch(self, name):
+        return any(
+            getattr(lookup, 'prefetch_to', name) == name
+            and getattr(lookup, 'queryset', None) is not None
+            for lookup in self.queryset._prefetch_related_lookups
+        )
+
+
+def compile_serializer(serializer, queryset):
+    '''Быстрый путь для `serializer` над `queryset` или `None`.'''
+    if not plain_serializer(serializer):
+        return None
+    compiled = CompiledSerializer(queryset)
+    return compiled if compiled.compile(serializer) else None
+
+
+def top_rows(compiled, partition_by, order_by, limit, queryset=None):
+    '''Строки запроса `compiled` (или `queryset` той же модели) - не
+    больше `limit` первых по `order_by` в каждой группе `partition_by` -
+    одним запросом. К строке добавляется её номер в группе.
+
+    Django 3.2 не умеет фильтровать по оконным функциям, поэтому
+    ROW_NUMBER() считается в подзапросе, а отбор - во внешнем SELECT.'''
+    queryset = compiled.rows(queryset).rows.annotate(
+        position=Window(RowNumber(), partition_by=[F(partition_by)],
+                        order_by=order_by)
+    ).order_by()
+    compiler = queryset.query.get_compiler(queryset.db)
+    sql, params = compiler.as_sql()
+    connection = connections[queryset.db]
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'SELECT * FROM ({sql}) ranked '
+            f'WHERE ranked.{connection.ops.quote_name("position")} <= %s',
+            (*params, limit))
+        rows = cursor.fetchall()
+    # Те же преобразования значений из базы, что и у values_list().
+    converters = compiler.get_converters(
+        [column for column, _, _ in compiler.select])
+    if converters:
+        rows = [tuple(row) for row
+                in compiler.apply_converters(rows, converters)]
+    return rows
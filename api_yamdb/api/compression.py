@@ -0,0 +1,112 @@
+'''Сжатие ответов gzip и заранее сжатые статические файлы.
+
+* `CompressionMiddleware` (api.middleware) сжимает ответы с типом из
+  `COMPRESSION['CONTENT_TYPES']` не короче `MIN_SIZE` байт, потоковые - по
+  частям, не дожидаясь конца потока.
+* Команда `compress_static` после `collectstatic` кладёт рядом с каждым
+  подходящим файлом в STATIC_ROOT его сжатую копию `<файл>.gz`;
+  представление `serve_static` отдаёт её с `Content-Encoding: gzip`, не
+  тратя процессор на сжатие при каждом запросе.
+'''
+import gzip
+import mimetypes
+import os
+
+from django.conf import settings
+from django.http import FileResponse, HttpResponseNotModified
+from django.utils._os import safe_join
+from django.utils.cache import patch_vary_headers
+from django.utils.http import http_date
+from django.views.static import serve, was_modified_since
+
+GZIP_SUFFIX = '.gz'
+
+mimetypes.add_type('application/yaml', '.yaml')
+
+
+def accepts_gzip(request):
+    '''Принимает ли клиент gzip, с учётом `q=0` в Accept-Encoding.'''
+    codings = {}
+    for coding in request.headers.get('Accept-Encoding', '').split(','):
+        name, *params = coding.split(';')
+        quality = 1.0
+        for param in params:
+            key, _, value = param.strip().partition('=')
+            if key == 'q':
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        codings[name.strip().lower()] = quality
+    return codings.get('gzip', codings.get('*', 0.0)) > 0
+
+
+def compressible_type(content_type):
+    if not content_type:
+        return False
+    base = content_type.split(';')[0].strip().lower()
+    return base in settings.COMPRESSION['CONTENT_TYPES']
+
+
+def precompress(path):
+    '''Сжимает файл в `<path>.gz`, если он подходит по типу и размеру и
+    сжатие его уменьшает. Возвращает (исходный размер, сжатый) или None.'''
+    if (path.endswith(GZIP_SUFFIX)
+            or not compressible_type(mimetypes.guess_type(path)[0])):
+        return None
+    with open(path, 'rb') as source:
+        content = source.read()
+    if len(content) < settings.COMPRESSION['MIN_SIZE']:
+        return None
+    compressed = gzip.compress(content, compresslevel=9, mtime=0)
+    target = path + GZIP_SUFFIX
+    if len(compressed) >= len(content):
+        if os.path.exists(target):
+            os.remove(target)
+        return None
+    temporary = f'{target}.tmp'
+    with open(temporary, 'wb') as output:
+        output.write(compressed)
+    os.replace(temporary, target)
+    stat = os.stat(path)
+    # Сжатая копия считается актуальной, пока совпадает время изменения.
+    os.utime(target, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+    return len(content), len(compressed)
+
+
+def precompress_directory(root):
+    '''Сжатые копии всех подходящих файлов каталога: {путь: размеры}.'''
+    results = {}
+    for directory, _, names in os.walk(root):
+        for name in sorted(names):
+            path = os.path.join(directory, name)
+            sizes = precompress(path)
+            if sizes is not None:
+                results[os.path.relpath(path, root)] = sizes
+    return results
+
+
+def serve_static(request, path):
+    '''Файл из STATIC_ROOT; сжатая копия - клиентам, принимающим gzip.'''
+    root = settings.STATIC_ROOT
+    fullpath = safe_join(root, path)
+    compressed = fullpath + GZIP_SUFFIX
+    if (not os.path.isfile(fullpath) or not os.path.isfile(compressed)
+            or os.stat(compressed).st_mtime_ns
+            != os.stat(fullpath).st_mtime_ns):
+        return serve(request, path, document_root=root)
+    stat = os.stat(fullpath)
+    if not was_modified_since(request.META.get('HTTP_IF_MODIFIED_SINCE'),
+                              stat.st_mtime, stat.st_size):
+        response = HttpResponseNotModified()
+    elif accepts_gzip(request):
+        content_type, _ = mimetypes.guess_type(fullpath)
+        response = FileResponse(
+            open(compressed, 'rb'), filename=os.path.basename(fullpath),
+            content_type=content_type or 'application/octet-stream')
+        response['Content-Encoding'] = 'gzip'
+        response['Last-Modified'] = http_date(stat.st_mtime)
+    else:
+        response = serve(request, path, document_root=root)
+    patch_vary_headers(response, ('Accept-Encoding',))
+    return response
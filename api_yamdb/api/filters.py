@@ -1,6 +1,8 @@
+from django.db.models import F
 from django_filters import rest_framework
+from rest_framework import filters
 
-from reviews.models import Title
+from reviews.models import Genre, ReviewRollup, Title
 
 
 class TitlesFilter(rest_framework.FilterSet):
@@ -14,9 +16,53 @@ class TitlesFilter(rest_framework.FilterSet):
     )
     genre = rest_framework.CharFilter(
         field_name='genre__slug',
-        lookup_expr='icontains'
+        method='filter_genre'
     )
 
     class Meta:
         model = Title
         fields = ('name', 'year', 'genre', 'category')
+
+    def filter_genre(self, queryset, name, value):
+        '''Фильтрация по маске жанров без JOIN с GenreTitle.'''
+        bits = list(Genre.objects.filter(slug__icontains=value)
+                    .values_list('bit', flat=True))
+        if not bits:
+            return queryset.none()
+        if None in bits:
+            return queryset.filter(genre__slug__icontains=value).distinct()
+        mask = 0
+        for bit in bits:
+            mask |= 1 << bit
+        return queryset.alias(
+            genre_match=F('genre_mask').bitand(mask)
+        ).filter(genre_match__gt=0)
+
+
+class ReviewRollupFilter(rest_framework.FilterSet):
+    '''Сводки отзывов за период (`?period=day|month`, по умолчанию -
+    месяцы) с началом в интервале `?since=`/`?until=`.'''
+    period = rest_framework.ChoiceFilter(choices=ReviewRollup.PERIODS)
+    since = rest_framework.DateFilter(field_name='bucket', lookup_expr='gte')
+    until = rest_framework.DateFilter(field_name='bucket', lookup_expr='lte')
+    title = rest_framework.NumberFilter(field_name='title')
+    category = rest_framework.CharFilter(field_name='category__slug')
+    genre = rest_framework.CharFilter(field_name='genre__slug')
+
+    class Meta:
+        model = ReviewRollup
+        fields = ('period', 'since', 'until', 'title', 'category', 'genre')
+
+    def __init__(self, data=None, *args, **kwargs):
+        if data is not None and not data.get('period'):
+            data = data.copy()
+            data['period'] = ReviewRollup.MONTH
+        super().__init__(data, *args, **kwargs)
+
+
+class TitleOrderingFilter(filters.OrderingFilter):
+    '''Сортировка `?ordering=` с id в конце для стабильной пагинации.'''
+
+    def get_ordering(self, request, queryset, view):
+        ordering = super().get_ordering(request, queryset, view)
+        return [*ordering, 'id'] if ordering else ordering
@@ -0,0 +1,200 @@
+import io
+import random
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models import Avg
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+
+from api import serializers
+from api.compiled import compile_serializer
+from api.parsers import FastJSONParser, MessagePackParser
+from api.renderers import FastJSONRenderer, MessagePackRenderer
+from reviews.models import Comment, Review, Title
+
+
+def measure(func, args, repeat):
+    '''Среднее время вызова `func` в миллисекундах.'''
+    started = time.perf_counter()
+    for _ in range(repeat):
+        for arg in args:
+            func(arg)
+    return (time.perf_counter() - started) * 1000 / (repeat * len(args))
+
+
+def execute_sql(statement):
+    '''Выполняет заранее скомпилированный SQL без создания моделей,
+    чтобы замер отражал работу базы данных.'''
+    with connection.cursor() as cursor:
+        cursor.execute(*statement)
+        return cursor.fetchall()
+
+
+def query_plan(queryset, label):
+    # Метка делает текст запроса уникальным: SQLite не перестраивает
+    # закэшированный план EXPLAIN после изменения схемы.
+    sql, params = queryset.query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute(f'EXPLAIN QUERY PLAN /* {label} */ {sql}', params)
+        return '; '.join(row[-1] for row in cursor.fetchall())
+
+
+class Command(BaseCommand):
+    help = ('Замеры производительности на сгенерированном наборе данных '
+            '(см. generate_dataset).')
+    scenarios = ('indexes', 'serializers', 'renderers')
+
+    def add_arguments(self, parser):
+        parser.add_argument('scenario', choices=self.scenarios)
+        parser.add_argument('--repeat', type=int, default=5)
+        parser.add_argument('--samples', type=int, default=200)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--rows', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        if not Review.objects.exists():
+            raise CommandError('Нет данных: выполните generate_dataset.')
+        self.rng = random.Random(options['seed'])
+        getattr(self, f'bench_{options["scenario"]}')(options)
+
+    def sample_ids(self, model, field, count):
+        ids = list(model.objects.order_by().values_list(field, flat=True)
+                   .distinct())
+        return self.rng.sample(ids, min(count, len(ids)))
+
+    def report(self, rows, headers):
+        widths = [max(len(str(row[col])) for row in [headers, *rows])
+                  for col in range(len(headers))]
+        for row in [headers, *rows]:
+            self.stdout.write('  '.join(
+                str(value).ljust(width) for value, width in zip(row, widths)
+            ))
+
+    def bench_indexes(self, options):
+        '''Составные индексы отзывов и комментариев: сравнение с их
+        временным удалением внутри откатываемой транзакции.'''
+        title_ids = self.sample_ids(Review, 'title_id', options['samples'])
+        review_ids = self.sample_ids(Review, 'id', options['samples'])
+        author_ids = self.sample_ids(Review, 'author_id', options['samples'])
+        queries = (
+            ('reviews by title', title_ids, lambda pk: Review.objects.filter(
+                title_id=pk).select_related('author')[:10]),
+            ('comments by review', review_ids,
+             lambda pk: Comment.objects.filter(
+                 review_id=pk).select_related('author')[:10]),
+            ('reviews by author', author_ids,
+             lambda pk: Review.objects.filter(
+                 author_id=pk).order_by('-pub_date')[:10]),
+            ('comments by author', author_ids,
+             lambda pk: Comment.objects.filter(
+                 author_id=pk).order_by('-pub_date')[:10]),
+        )
+        indexes = [index.name for model in (Review, Comment)
+                   for index in model._meta.indexes]
+
+        def run(stage):
+            return {
+                label: (measure(execute_sql,
+                                [build(pk).query.sql_with_params()
+                                 for pk in ids], options['repeat']),
+                        query_plan(build(ids[0]), stage))
+                for label, ids, build in queries
+            }
+
+        with_indexes = run('after')
+        with transaction.atomic():
+            with connection.cursor() as cursor:
+                for name in indexes:
+                    cursor.execute(f'DROP INDEX "{name}"')
+            without_indexes = run('before')
+            transaction.set_rollback(True)
+
+        self.stdout.write(
+            f'Отзывов: {Review.objects.count()}, комментариев: '
+            f'{Comment.objects.count()}, выборок на запрос: '
+            f'{len(title_ids)} x {options["repeat"]}.'
+        )
+        self.report(
+            [(label, f'{without_indexes[label][0]:.3f}',
+              f'{with_indexes[label][0]:.3f}',
+              f'x{without_indexes[label][0] / with_indexes[label][0]:.1f}')
+             for label, _, _ in queries],
+            ('query', 'before, ms', 'after, ms', 'speedup'),
+        )
+        for label, _, _ in queries:
+            self.stdout.write(f'\n{label}:\n  before: '
+                              f'{without_indexes[label][1]}\n  after:  '
+                              f'{with_indexes[label][1]}')
+
+    def lists(self, rows):
+        '''Списки для замеров: (название, сериализатор, запрос).'''
+        return (
+            ('titles', serializers.ReadOnlyTitleSerializer,
+             Title.objects.annotate(Avg('reviews__score')).select_related(
+                 'category').prefetch_related('genre').order_by(
+                 'name')[:rows]),
+            ('reviews', serializers.ReviewSerializer,
+             Review.objects.select_related('title', 'author')[:rows]),
+            ('comments', serializers.CommentSerializer,
+             Comment.objects.select_related('review', 'author')[:rows]),
+        )
+
+    def bench_serializers(self, options):
+        '''Списки через сериализаторы DRF и через api.compiled: время на
+        1000 строк, включая запросы, и побайтное сравнение JSON.'''
+        rows = options['rows']
+        results = []
+        for label, serializer_class, queryset in self.lists(rows):
+            compiled = compile_serializer(serializer_class(), queryset)
+
+            def drf(queryset, serializer_class=serializer_class):
+                return serializer_class(queryset.all(), many=True).data
+
+            def fast(queryset, compiled=compiled):
+                return compiled.serialize(compiled.rows(queryset))
+
+            renderer = JSONRenderer()
+            if (renderer.render(drf(queryset))
+                    != renderer.render(fast(queryset))):
+                raise CommandError(f'{label}: ответы различаются.')
+            count = queryset.count()
+            before = measure(drf, [queryset], options['repeat'])
+            after = measure(fast, [queryset], options['repeat'])
+            results.append((label, f'{before * 1000 / count:.1f}',
+                            f'{after * 1000 / count:.1f}',
+                            f'x{before / after:.1f}'))
+        self.stdout.write(f'Строк в списке: до {rows}, повторов: '
+                          f'{options["repeat"]}.')
+        self.report(results, ('list', 'drf, ms/1000', 'compiled, ms/1000',
+                              'speedup'))
+
+    def bench_renderers(self, options):
+        '''Кодирование и разбор списков в форматах ответа: размер и время
+        на 1000 строк.'''
+        formats = (
+            ('json', JSONRenderer(), JSONParser()),
+            ('fast json', FastJSONRenderer(), FastJSONParser()),
+            ('msgpack', MessagePackRenderer(), MessagePackParser()),
+        )
+        results = []
+        for label, serializer_class, queryset in self.lists(options['rows']):
+            data = serializer_class(queryset, many=True).data
+            scale = 1000 / max(len(data), 1)
+            for name, renderer, parser in formats:
+                content = renderer.render(data)
+                if parser.parse(io.BytesIO(content)) != JSONParser().parse(
+                        io.BytesIO(JSONRenderer().render(data))):
+                    raise CommandError(f'{label}, {name}: данные после '
+                                       'разбора различаются.')
+                render = measure(renderer.render, [data], options['repeat'])
+                parse = measure(lambda content: parser.parse(
+                    io.BytesIO(content)), [content], options['repeat'])
+                results.append((label, name, f'{len(content) / 1024:.1f}',
+                                f'{render * scale:.2f}',
+                                f'{parse * scale:.2f}'))
+        self.stdout.write(f'Строк в списке: до {options["rows"]}, '
+                          f'повторов: {options["repeat"]}.')
+        self.report(results, ('list', 'format', 'size, KB',
+                              'render, ms/1000', 'parse, ms/1000'))
@@ -0,0 +1,34 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from api.catalog import get_shared_version
+from api.snapshot import build_snapshot
+
+
+class Command(BaseCommand):
+    help = ('Собирает снимок каталога для бэкенда `snapshot` '
+            '(CATALOG_INDEX["SNAPSHOT_PATH"]).')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--watch', action='store_true',
+            help='Пересобирать снимок при изменении версии каталога.')
+        parser.add_argument('--interval', type=float, default=1.0)
+
+    def handle(self, *args, **options):
+        path = settings.CATALOG_INDEX['SNAPSHOT_PATH']
+        version = self.build(path)
+        while options['watch']:
+            time.sleep(options['interval'])
+            if get_shared_version() != version:
+                version = self.build(path)
+
+    def build(self, path):
+        started = time.perf_counter()
+        version, count = build_snapshot(path)
+        self.stdout.write(
+            f'{path}: версия {version}, произведений {count}, '
+            f'{(time.perf_counter() - started) * 1000:.0f} мс')
+        return version
@@ -0,0 +1,32 @@
+import time
+
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+
+from api.compression import precompress_directory
+
+
+class Command(BaseCommand):
+    help = ('Сжимает статические файлы в STATIC_ROOT: рядом с каждым '
+            'подходящим файлом появляется копия `<файл>.gz`.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--collect', action='store_true',
+            help='Сначала выполнить collectstatic --noinput.')
+
+    def handle(self, *args, **options):
+        if options['collect']:
+            call_command('collectstatic', interactive=False,
+                         verbosity=options['verbosity'], stdout=self.stdout)
+        started = time.perf_counter()
+        results = precompress_directory(settings.STATIC_ROOT)
+        if options['verbosity'] > 1:
+            for path, (size, compressed) in results.items():
+                self.stdout.write(f'{path}: {size} -> {compressed} байт')
+        total = sum(size for size, _ in results.values())
+        compressed = sum(size for _, size in results.values())
+        self.stdout.write(
+            f'Сжато файлов: {len(results)}, {total} -> {compressed} байт, '
+            f'{(time.perf_counter() - started) * 1000:.0f} мс')
@@ -0,0 +1,97 @@
+import random
+
+from django.conf import settings
+from django.middleware.gzip import GZipMiddleware
+from django.utils.cache import patch_vary_headers
+from rest_framework.exceptions import APIException
+from rest_framework.request import Request
+from rest_framework.settings import api_settings
+
+from api import profiling
+from api.compression import accepts_gzip, compressible_type
+from api.permissions import IsAuthenticatedAdmin
+
+
+class ProfilingMiddleware:
+    '''Профилирование запроса по требованию администратора.
+
+    Профиль включается заголовком `X-Profile` или параметром `?profile=`
+    со значением `cprofile` или `sampling` и доступен только
+    администраторам. Дополнительно доля `SAMPLE_RATE` всех запросов
+    профилируется семплирующим профайлером.
+    '''
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        mode = self.get_requested_mode(request)
+        if mode is None:
+            return self.get_response(request)
+
+        profiler = profiling.get_profiler(mode)
+        profiler.start()
+        try:
+            response = self.get_response(request)
+        finally:
+            profiler.stop()
+        response[settings.PROFILING['RESPONSE_HEADER']] = (
+            profiling.save_profile(profiler, request)
+        )
+        return response
+
+    def get_requested_mode(self, request):
+        config = settings.PROFILING
+        mode = (request.headers.get(config['HEADER'])
+                or request.GET.get(config['QUERY_PARAM']))
+        if mode:
+            if mode not in profiling.EXTENSIONS:
+                mode = profiling.CPROFILE
+            return mode if self.is_admin(request) else None
+        sample_rate = config['SAMPLE_RATE']
+        if sample_rate and random.random() < sample_rate:
+            return config['SAMPLE_MODE']
+        return None
+
+    @staticmethod
+    def is_admin(request):
+        drf_request = Request(request, authenticators=[
+            auth() for auth in api_settings.DEFAULT_AUTHENTICATION_CLASSES
+        ])
+        try:
+            return IsAuthenticatedAdmin().has_permission(drf_request, None)
+        except APIException:
+            return False
+
+
+class CompressionMiddleware(GZipMiddleware):
+    '''GZipMiddleware Django с настройками из `COMPRESSION` (см.
+    api.compression).
+
+    Сжимаются только ответы с типом из `COMPRESSION['CONTENT_TYPES']`:
+    обычные - не короче `MIN_SIZE` байт, потоковые - по мере чтения потока.
+    Ответы без тела (304, 204), уже сжатые и запросы, где gzip запрещён
+    `q=0`, пропускаются; остальное (Vary, ETag, сжатие только с
+    выигрышем) делает GZipMiddleware.
+    '''
+    skipped_statuses = (204, 304)
+
+    def process_response(self, request, response):
+        if (response.status_code in self.skipped_statuses
+                or response.status_code < 200
+                or response.has_header('Content-Encoding')
+                or not compressible_type(response.get('Content-Type'))
+                or self.too_short(response)):
+            return response
+        if not accepts_gzip(request):
+            patch_vary_headers(response, ('Accept-Encoding',))
+            return response
+        return super().process_response(request, response)
+
+    @staticmethod
+    def too_short(response):
+        minimum = settings.COMPRESSION['MIN_SIZE']
+        if response.streaming:
+            length = response.get('Content-Length')
+            return length is not None and int(length) < minimum
+        return len(response.content) < minimum
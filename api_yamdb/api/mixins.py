@@ -1,4 +1,20 @@
-from rest_framework import mixins, viewsets
+from itertools import islice
+
+from django.core.exceptions import FieldDoesNotExist
+from django.db import transaction
+from django.db.models import prefetch_related_objects
+from django.http import StreamingHttpResponse
+from rest_framework import mixins, permissions, viewsets
+from rest_framework.decorators import action
+from rest_framework.exceptions import NotAcceptable
+from rest_framework.response import Response
+
+from api import catalog, serializers
+from api.compiled import compile_serializer
+from api.permissions import IsAuthenticatedAdmin
+from api.renderers import FastJSONRenderer
+from reviews import services
+from reviews.models import Title
 
 
 class ListCreateDestroyMixin(
@@ -8,3 +24,214 @@ class ListCreateDestroyMixin(
     viewsets.GenericViewSet,
 ):
     pass
+
+
+class AtomicWriteMixin:
+    '''Создание, изменение и удаление выполняются в одной транзакции с
+    обновлениями счётчиков и сводок в сигналах (reviews.signals): в
+    режиме autocommit Django фиксирует строку до отправки post_save.
+    Чтение транзакцией не оборачивается.'''
+
+    def create(self, request, *args, **kwargs):
+        with transaction.atomic():
+            return super().create(request, *args, **kwargs)
+
+    def update(self, request, *args, **kwargs):
+        with transaction.atomic():
+            return super().update(request, *args, **kwargs)
+
+    def destroy(self, request, *args, **kwargs):
+        with transaction.atomic():
+            return super().destroy(request, *args, **kwargs)
+
+
+def model_sources(serializer, queryset):
+    '''Столбцы и связи «ко многим» модели, из которых строятся поля
+    сериализатора; None, если поле строится из неизвестного атрибута.'''
+    columns, many = set(), set()
+    for name, field in serializer.fields.items():
+        for source in serializer.field_sources.get(name, (field.source,)):
+            attribute = source.split('.')[0]
+            if attribute in queryset.query.annotations:
+                continue
+            try:
+                model_field = queryset.model._meta.get_field(attribute)
+            except FieldDoesNotExist:
+                # Свойство модели или source='*' без field_sources.
+                return None
+            if model_field.many_to_many or model_field.one_to_many:
+                many.add(attribute)
+            else:
+                columns.add(model_field.name)
+    return columns, many
+
+
+class SparseQuerysetMixin:
+    '''Запрос сужается под поля сериализатора, оставленные `?fields=` и
+    `?omit=`: в SELECT попадают только нужные столбцы (only()), лишние
+    select_related и prefetch_related отбрасываются. Аннотации из
+    `sparse_annotations` (имя поля сериализатора -> аннотации)
+    добавляются, только если поле выводится.'''
+    sparse_annotations = {}
+
+    def filter_queryset(self, queryset):
+        return super().filter_queryset(self.narrow_queryset(queryset))
+
+    def narrow_queryset(self, queryset):
+        serializer = self.get_serializer()
+        for name, annotations in self.sparse_annotations.items():
+            if name in serializer.fields:
+                queryset = queryset.annotate(**{
+                    alias: annotation
+                    for alias, annotation in annotations.items()
+                    if alias not in queryset.query.annotations
+                })
+        params = self.request.query_params
+        if (self.request.method not in permissions.SAFE_METHODS
+                or not ('fields' in params or 'omit' in params)):
+            return queryset
+        sources = model_sources(serializer, queryset)
+        if sources is None:
+            return queryset
+        columns, many = sources
+        # Связи, подставляемые менеджером (title.reviews), читаются по id.
+        columns.update(field.name for field in queryset._known_related_objects)
+        queryset = queryset.only(*columns)
+        if isinstance(queryset.query.select_related, dict):
+            related = [name for name in queryset.query.select_related
+                       if name in columns]
+            queryset = queryset.select_related(None)
+            if related:
+                queryset = queryset.select_related(*related)
+        lookups = [
+            lookup for lookup in queryset._prefetch_related_lookups
+            if getattr(lookup, 'prefetch_to', lookup).split('__')[0] in many
+        ]
+        return queryset.prefetch_related(None).prefetch_related(*lookups)
+
+
+class CompiledListMixin:
+    '''Списки строятся из values_list() через api.compiled, если все
+    поля сериализатора читаются из столбцов, иначе - сериализатором.'''
+
+    def list(self, request, *args, **kwargs):
+        return self.list_response(self.filter_queryset(self.get_queryset()))
+
+    def list_response(self, queryset):
+        compiled = compile_serializer(self.get_serializer(), queryset)
+        if compiled is None:
+            page = self.paginate_queryset(queryset)
+            if page is not None:
+                serializer = self.get_serializer(page, many=True)
+                return self.get_paginated_response(serializer.data)
+            return Response(self.get_serializer(queryset, many=True).data)
+        rows = compiled.rows()
+        page = self.paginate_queryset(rows)
+        if page is not None:
+            return self.get_paginated_response(compiled.serialize(page))
+        return Response(compiled.serialize(rows))
+
+    def serialize_by_pk(self, queryset):
+        '''{первичный ключ: данные сериализатора} для всех строк запроса.'''
+        compiled = compile_serializer(self.get_serializer(), queryset)
+        if compiled is None:
+            instances = list(queryset)
+            return dict(zip(
+                (instance.pk for instance in instances),
+                self.get_serializer(instances, many=True).data
+            ))
+        key = compiled.column(queryset.model._meta.pk.attname)
+        rows = list(compiled.rows())
+        return dict(zip((row[key] for row in rows),
+                        compiled.serialize(rows)))
+
+
+def chunked(rows, size):
+    rows = iter(rows)
+    while True:
+        chunk = list(islice(rows, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+class StreamingListMixin:
+    '''`?stream=1` (только для администраторов): весь список без
+    пагинации - JSON-массив, который пишется в StreamingHttpResponse по мере
+    чтения строк из базы через iterator() пачками по `stream_chunk_size`.
+    Первый байт уходит до выполнения запроса, а память не зависит от длины
+    списка. Массив MessagePack начинается с числа элементов, которое до
+    чтения строк неизвестно, поэтому на другие форматы в Accept - 406.'''
+    stream_param = 'stream'
+    stream_chunk_size = 500
+
+    def list(self, request, *args, **kwargs):
+        if request.query_params.get(self.stream_param) not in ('1', 'true'):
+            return super().list(request, *args, **kwargs)
+        if not IsAuthenticatedAdmin().has_permission(request, self):
+            self.permission_denied(
+                request, message='Потоковый список доступен только '
+                                 'администраторам.')
+        if request.accepted_renderer.media_type != (
+                FastJSONRenderer.media_type):
+            raise NotAcceptable('Потоковый список отдаётся только в JSON.')
+        queryset = self.filter_queryset(self.get_queryset())
+        return StreamingHttpResponse(
+            self.stream_json(queryset),
+            content_type=FastJSONRenderer.media_type)
+
+    def stream_json(self, queryset):
+        renderer = FastJSONRenderer()
+        separator = b'['
+        for records in self.stream_records(queryset):
+            # Пачка кодируется массивом, скобки заменяются разделителями.
+            yield separator + renderer.render(records)[1:-1]
+            separator = b','
+        yield b']' if separator == b',' else b'[]'
+
+    def stream_records(self, queryset):
+        size = self.stream_chunk_size
+        compiled = compile_serializer(self.get_serializer(), queryset)
+        if compiled is not None:
+            for chunk in chunked(compiled.rows().iterator(size), size):
+                yield compiled.serialize(chunk)
+            return
+        # iterator() не выполняет prefetch_related - он делается по пачкам.
+        lookups = queryset._prefetch_related_lookups
+        for chunk in chunked(queryset.iterator(size), size):
+            prefetch_related_objects(chunk, *lookups)
+            yield self.get_serializer(chunk, many=True).data
+
+
+class CatalogListMixin:
+    '''Список из индекса каталога, если он включён (`catalog_kind`).'''
+    catalog_kind = None
+
+    def list(self, request, *args, **kwargs):
+        index = catalog.get_index()
+        records = (index.list_dictionary(self.catalog_kind,
+                                         request.query_params)
+                   if index is not None else None)
+        if records is None:
+            return super().list(request, *args, **kwargs)
+        page = self.paginate_queryset(records)
+        return self.get_paginated_response(page)
+
+
+class LeaderboardMixin:
+    '''Рейтинг произведений категории или жанра (`leaderboard_field`)
+    из заранее рассчитанной таблицы LeaderboardEntry.'''
+    leaderboard_field = None
+
+    @action(detail=True, methods=('get',))
+    def leaderboard(self, request, *args, **kwargs):
+        group = self.get_object()
+        titles = Title.objects.filter(**{
+            f'leaderboard_entries__{self.leaderboard_field}': group
+        }).annotate(
+            reviews__score__avg=services.average_score()
+        ).select_related('category').prefetch_related('genre').order_by(
+            'leaderboard_entries__position'
+        )
+        return Response(serializers.ReadOnlyTitleSerializer(
+            titles, many=True, context=self.get_serializer_context()).data)
@@ -0,0 +1,9 @@
+from rest_framework.pagination import CursorPagination
+
+
+class AuthorFeedPagination(CursorPagination):
+    '''Постраничный вывод публикаций автора по ключу (pub_date, id): новая
+    страница - поиск по индексу (author, pub_date) от последней строки
+    предыдущей, без OFFSET и без COUNT(*).'''
+    ordering = ('-pub_date', '-id')
+    page_size_query_param = None
@@ -0,0 +1,150 @@
+import cProfile
+import os
+import re
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from datetime import datetime, timezone
+
+from django.conf import settings
+
+CPROFILE = 'cprofile'
+SAMPLING = 'sampling'
+
+EXTENSIONS = {
+    CPROFILE: '.prof',
+    SAMPLING: '.collapsed',
+}
+
+PATTERN_PROFILE_NAME = re.compile(r'^[\w.-]+\.(prof|collapsed)\Z')
+
+
+class CProfileProfiler:
+    '''Детерминированный профайлер, результат - файл pstats.'''
+    mode = CPROFILE
+
+    def __init__(self):
+        self.profile = cProfile.Profile()
+
+    def start(self):
+        self.profile.enable()
+
+    def stop(self):
+        self.profile.disable()
+
+    def dump(self, path):
+        self.profile.dump_stats(path)
+
+
+class StackSamplingProfiler:
+    '''Семплирующий профайлер: фоновый поток раз в `interval` секунд
+    снимает стек потока, обрабатывающего запрос. Результат - файл
+    в формате collapsed stacks (flamegraph.pl, speedscope).'''
+    mode = SAMPLING
+
+    def __init__(self, interval):
+        self.interval = interval
+        self.stacks = Counter()
+        self._thread_id = None
+        self._stopped = threading.Event()
+        self._sampler = None
+
+    def start(self):
+        self._thread_id = threading.get_ident()
+        self._sampler = threading.Thread(target=self._run, daemon=True)
+        self._sampler.start()
+
+    def stop(self):
+        self._stopped.set()
+        self._sampler.join()
+
+    def _run(self):
+        while not self._stopped.wait(self.interval):
+            frame = sys._current_frames().get(self._thread_id)
+            if frame is not None:
+                self.stacks[self._collapse(frame)] += 1
+
+    @staticmethod
+    def _collapse(frame):
+        stack = []
+        while frame is not None:
+            code = frame.f_code
+            stack.append(f'{code.co_name} ({code.co_filename}:'
+                         f'{frame.f_lineno})')
+            frame = frame.f_back
+        return ';'.join(reversed(stack))
+
+    def dump(self, path):
+        with open(path, 'w') as file:
+            for stack, count in self.stacks.most_common():
+                file.write(f'{stack} {count}\n')
+
+
+def get_profiler(mode):
+    if mode == SAMPLING:
+        return StackSamplingProfiler(settings.PROFILING['SAMPLING_INTERVAL'])
+    return CProfileProfiler()
+
+
+def get_profile_dir():
+    profile_dir = settings.PROFILING['DIR']
+    os.makedirs(profile_dir, exist_ok=True)
+    return profile_dir
+
+
+def save_profile(profiler, request):
+    '''Сохраняет профиль на диск и возвращает имя файла.'''
+    path_slug = re.sub(r'[^\w-]+', '_', request.path).strip('_')
+    name = (f'{time.strftime("%Y%m%d-%H%M%S")}-{request.method.lower()}-'
+            f'{path_slug}-{uuid.uuid4().hex[:8]}{EXTENSIONS[profiler.mode]}')
+    profile_dir = get_profile_dir()
+    profiler.dump(os.path.join(profile_dir, name))
+    prune_profiles(profile_dir)
+    return name
+
+
+def prune_profiles(profile_dir):
+    '''Удаляет профили сверх `MAX_FILES` последних и старше
+    `MAX_AGE_DAYS` дней.'''
+    config = settings.PROFILING
+    oldest = time.time() - config['MAX_AGE_DAYS'] * 24 * 60 * 60
+    profiles = []
+    for entry in os.scandir(profile_dir):
+        if PATTERN_PROFILE_NAME.match(entry.name):
+            try:
+                profiles.append((entry.stat().st_mtime, entry.path))
+            except FileNotFoundError:
+                continue
+    profiles.sort(reverse=True)
+    for position, (modified, path) in enumerate(profiles):
+        if position >= config['MAX_FILES'] or modified < oldest:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                # Профиль уже удалил другой воркер.
+                pass
+
+
+def get_profile_path(name):
+    if not PATTERN_PROFILE_NAME.match(name):
+        return None
+    path = os.path.join(get_profile_dir(), name)
+    return path if os.path.isfile(path) else None
+
+
+def list_profiles():
+    profile_dir = get_profile_dir()
+    result = []
+    for name in sorted(os.listdir(profile_dir), reverse=True):
+        if not PATTERN_PROFILE_NAME.match(name):
+            continue
+        stat = os.stat(os.path.join(profile_dir, name))
+        result.append({
+            'name': name,
+            'size': stat.st_size,
+            'created': datetime.fromtimestamp(
+                stat.st_mtime, tz=timezone.utc).isoformat(),
+        })
+    return result
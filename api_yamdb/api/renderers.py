@@ -0,0 +1,61 @@
+'''Рендереры ответов API.
+
+`FastJSONRenderer` кодирует JSON через orjson, если он установлен, иначе
+(и для JSON с отступами) - как JSONRenderer через модуль json. Вывод
+совпадает с JSONRenderer при настройках DRF по умолчанию (компактный
+JSON в UTF-8): даты и время, Decimal, ленивые строки переводов и прочие
+типы, которых нет в JSON, приводятся тем же `encoder_class`. Отличие одно:
+NaN и бесконечности orjson выводит как null, а JSONRenderer отказывается
+их кодировать.
+
+`MessagePackRenderer` - компактный двоичный формат для внутренних
+клиентов (`Accept: application/msgpack`). Структура ответа та же, что в
+JSON, значения приводятся тем же `encoder_class`.
+'''
+import msgpack
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+if orjson is not None:
+    # Даты - через encoder_class, как в JSONRenderer (UTC с 'Z').
+    ORJSON_OPTIONS = orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS
+
+
+class FastJSONRenderer(JSONRenderer):
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if (orjson is None or self.ensure_ascii or not self.compact
+                or not self.strict or self.get_indent(
+                    accepted_media_type, renderer_context or {}) is not None):
+            return super().render(data, accepted_media_type,
+                                  renderer_context)
+        if data is None:
+            return b''
+        try:
+            rendered = orjson.dumps(data, default=self.encoder_class().default,
+                                    option=ORJSON_OPTIONS)
+        except orjson.JSONEncodeError:
+            # Например, целые больше 64 бит.
+            return super().render(data, accepted_media_type,
+                                  renderer_context)
+        # Как JSONRenderer: JSON остаётся подмножеством JavaScript.
+        return rendered.replace(
+            '\u2028'.encode(), b'\\u2028'
+        ).replace('\u2029'.encode(), b'\\u2029')
+
+
+class MessagePackRenderer(BaseRenderer):
+    media_type = 'application/msgpack'
+    format = 'msgpack'
+    charset = None
+    render_style = 'binary'
+    encoder_class = JSONRenderer.encoder_class
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        return msgpack.packb(data, default=self.encoder_class().default)
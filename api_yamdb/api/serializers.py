@@ -1,14 +1,41 @@
 from api_yamdb.settings import CONST
 
-from rest_framework import serializers
+from rest_framework import permissions, serializers
 from rest_framework.exceptions import ValidationError
 from rest_framework.generics import get_object_or_404
 from rest_framework.validators import UniqueValidator
 
-from reviews.models import Category, Comment, Genre, Review, Title, User
+from reviews.models import (SCORE_FIELDS, Category, Comment, Genre, Review,
+                            ReviewRollup, Title, User)
 
 
-class CategorySerializer(serializers.ModelSerializer):
+def split_param(request, name):
+    return {value for value in request.query_params.get(name, '').split(',')
+            if value}
+
+
+class SparseFieldsMixin:
+    '''В ответе на GET-запрос остаются только поля, перечисленные через
+    запятую в `?fields=`, кроме перечисленных в `?omit=`.
+
+    `field_sources` - атрибуты модели, из которых строятся поля с
+    `source='*'` или свойства модели; по ним представление сужает запрос
+    (см. api.mixins.SparseQuerysetMixin).'''
+    field_sources = {}
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        request = self.context.get('request')
+        if request is None or request.method not in permissions.SAFE_METHODS:
+            return
+        selected = split_param(request, 'fields')
+        omitted = split_param(request, 'omit')
+        for name in list(self.fields):
+            if (selected and name not in selected) or name in omitted:
+                self.fields.pop(name)
+
+
+class CategorySerializer(SparseFieldsMixin, serializers.ModelSerializer):
 
     class Meta:
         model = Category
@@ -19,7 +46,7 @@ class CategorySerializer(serializers.ModelSerializer):
         }
 
 
-class CommentSerializer(serializers.ModelSerializer):
+class CommentSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     review = serializers.SlugRelatedField(
         slug_field='text',
         read_only=True
@@ -34,28 +61,63 @@ class CommentSerializer(serializers.ModelSerializer):
         model = Comment
 
 
-class GenreSerializer(serializers.ModelSerializer):
+class AuthorCommentSerializer(CommentSerializer):
+    title = serializers.SlugRelatedField(
+        source='review.title',
+        slug_field='name',
+        read_only=True
+    )
+
+    class Meta(CommentSerializer.Meta):
+        fields = ('id', 'title', 'review', 'author', 'text', 'pub_date')
+
+
+class GenreSerializer(SparseFieldsMixin, serializers.ModelSerializer):
 
     class Meta:
         model = Genre
-        exclude = ('id',)
+        fields = ('name', 'slug')
         lookup_field = 'slug'
         extra_kwargs = {
             'url': {'lookup_field': 'slug'}
         }
 
 
-class ReadOnlyTitleSerializer(serializers.ModelSerializer):
+class ExpandableFieldsMixin:
+    '''Поля из `expandable_fields` выводятся, только если они перечислены
+    через запятую в параметре запроса `?expand=`.'''
+    expandable_fields = ()
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        request = self.context.get('request')
+        expand = set(request.query_params.get('expand', '').split(',')
+                     if request is not None else ())
+        for name in self.expandable_fields:
+            if name not in expand:
+                self.fields.pop(name)
+
+
+class ReadOnlyTitleSerializer(SparseFieldsMixin, ExpandableFieldsMixin,
+                              serializers.ModelSerializer):
     rating = serializers.IntegerField(
         source='reviews__score__avg', read_only=True
     )
     genre = GenreSerializer(many=True)
     category = CategorySerializer()
+    score_histogram = serializers.DictField(
+        child=serializers.IntegerField(), read_only=True
+    )
+    expandable_fields = ('score_histogram', 'normalized_rating',
+                         'review_count')
+    field_sources = {'score_histogram': SCORE_FIELDS}
 
     class Meta:
         model = Title
         fields = (
-            'id', 'name', 'year', 'rating', 'description', 'genre', 'category'
+            'id', 'name', 'year', 'rating', 'description', 'genre',
+            'category', 'score_histogram', 'normalized_rating',
+            'review_count'
         )
 
 
@@ -92,7 +154,7 @@ class RegisterDataSerializer(serializers.ModelSerializer):
         model = User
 
 
-class TitleSerializer(serializers.ModelSerializer):
+class TitleSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     genre = serializers.SlugRelatedField(
         slug_field='slug', many=True, queryset=Genre.objects.all()
     )
@@ -110,7 +172,8 @@ class TokenSerializer(serializers.Serializer):
     confirmation_code = serializers.CharField()
 
 
-class ReviewSerializer(serializers.ModelSerializer):
+class ReviewSerializer(SparseFieldsMixin, ExpandableFieldsMixin,
+                       serializers.ModelSerializer):
     title = serializers.SlugRelatedField(
         slug_field='name',
         read_only=True,
@@ -120,6 +183,7 @@ class ReviewSerializer(serializers.ModelSerializer):
         slug_field='username',
         read_only=True
     )
+    expandable_fields = ('comment_count',)
 
     def validate(self, data):
         request = self.context['request']
@@ -137,10 +201,37 @@ class ReviewSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = Review
-        fields = ('id', 'title', 'text', 'author', 'score', 'pub_date')
+        fields = ('id', 'title', 'text', 'author', 'score', 'pub_date',
+                  'comment_count')
+
+
+class UserStatsField(serializers.Field):
+    '''Статистика активности пользователя из ReviewerStats: число отзывов
+    и комментариев, средняя выставленная оценка и время последнего отзыва
+    или комментария.'''
+    last_activity = serializers.DateTimeField()
+
+    def __init__(self, **kwargs):
+        kwargs.update(source='*', read_only=True)
+        super().__init__(**kwargs)
+
+    def to_representation(self, user):
+        stats = getattr(user, 'reviewer_stats', None)
+        if stats is None:
+            return {'review_count': 0, 'comment_count': 0,
+                    'average_score': None, 'last_activity': None}
+        return {
+            'review_count': stats.review_count,
+            'comment_count': stats.comment_count,
+            'average_score': stats.mean if stats.review_count else None,
+            'last_activity': (
+                self.last_activity.to_representation(stats.last_activity)
+                if stats.last_activity else None),
+        }
 
 
-class UserSerializer(serializers.ModelSerializer):
+class UserSerializer(SparseFieldsMixin, ExpandableFieldsMixin,
+                     serializers.ModelSerializer):
     username = serializers.CharField(
         max_length=CONST['USERNAME_MAX_LENGTH'],
         validators=[
@@ -154,16 +245,57 @@ class UserSerializer(serializers.ModelSerializer):
             UniqueValidator(queryset=User.objects.all())
         ]
     )
+    stats = UserStatsField()
+    expandable_fields = ('stats',)
+    field_sources = {'stats': ('reviewer_stats',)}
 
     class Meta:
         fields = ('username', 'email', 'first_name',
-                  'last_name', 'bio', 'role')
+                  'last_name', 'bio', 'role', 'stats')
         model = User
 
 
-class UserEditSerializer(serializers.ModelSerializer):
+class UserEditSerializer(SparseFieldsMixin, ExpandableFieldsMixin,
+                         serializers.ModelSerializer):
+    stats = UserStatsField()
+    expandable_fields = ('stats',)
+    field_sources = {'stats': ('reviewer_stats',)}
+
     class Meta:
         fields = ('username', 'email', 'first_name',
-                  'last_name', 'bio', 'role')
+                  'last_name', 'bio', 'role', 'stats')
         model = User
         read_only_fields = ('role',)
+
+
+class ReviewRollupSerializer(SparseFieldsMixin,
+                             serializers.ModelSerializer):
+    average_score = serializers.SerializerMethodField()
+    field_sources = {'average_score': ('score_sum', 'review_count')}
+
+    class Meta:
+        model = ReviewRollup
+        fields = ('period', 'bucket', 'review_count', 'average_score')
+
+    def get_average_score(self, rollup):
+        return round(rollup.score_sum / rollup.review_count, 2)
+
+
+class TitleRollupSerializer(ReviewRollupSerializer):
+
+    class Meta(ReviewRollupSerializer.Meta):
+        fields = ('title', *ReviewRollupSerializer.Meta.fields)
+
+
+class CategoryRollupSerializer(ReviewRollupSerializer):
+    category = serializers.SlugRelatedField(slug_field='slug', read_only=True)
+
+    class Meta(ReviewRollupSerializer.Meta):
+        fields = ('category', *ReviewRollupSerializer.Meta.fields)
+
+
+class GenreRollupSerializer(ReviewRollupSerializer):
+    genre = serializers.SlugRelatedField(slug_field='slug', read_only=True)
+
+    class Meta(ReviewRollupSerializer.Meta):
+        fields = ('genre', *ReviewRollupSerializer.Meta.fields)
@@ -0,0 +1,238 @@
+'''Снимок каталога в файле, отображённом в память всеми воркерами.
+
+Формат (little-endian, все поля по 8 байт):
+
+* заголовок `HEADER`: сигнатура, версия формата, признак поддержки
+  битовых масок жанров, версия каталога, число произведений, категорий,
+  жанров и строк, размер пула строк;
+* столбцы произведений по `TITLE_COLUMNS`, каждый - массив int64;
+* столбцы категорий и жанров по `CATEGORY_COLUMNS` и `GENRE_COLUMNS`
+  в порядке названий;
+* смещения строк (число строк + 1) и пул строк в UTF-8. Строка задаётся
+  номером в пуле, `-1` - `None`.
+
+Столбцы читаются через `memoryview.cast` прямо из отображения без
+копирования, поэтому страницы файла делят все процессы через кэш ОС.
+Новый снимок пишется во временный файл и атомарно подменяет старый
+через `os.replace`; процессы замечают подмену по `stat` и переключаются
+на новый файл. Снимок, собранный для старой версии каталога, не
+используется: чтение идёт из базы данных, пока снимок не пересоберут
+(`manage.py build_catalog_snapshot --watch`).
+
+Счётчики отзывов (рейтинг) в снимок не входят: отзывы пишутся часто, и
+снимок устаревал бы почти сразу. Рейтинг строк страницы читается одним
+запросом по первичному ключу, а версия каталога меняется только при
+изменении произведений, их жанров, категорий и жанров.
+'''
+import mmap
+import os
+import struct
+from array import array
+
+from django.conf import settings
+
+from api.catalog import (CatalogBackend, CatalogReader, ascii_lower,
+                         dictionary_rows, get_shared_version, title_rows)
+from reviews.models import Category, Genre, Title
+
+MAGIC = b'YAMDBCAT'
+FORMAT_VERSION = 2
+HEADER = struct.Struct('<8sqqqqqqqq')
+TITLE_COLUMNS = (
+    'ids', 'years', 'category_ids', 'genre_masks', 'name_refs',
+    'name_lower_refs', 'description_refs', 'name_order',
+)
+CATEGORY_COLUMNS = ('ids', 'name_refs', 'slug_refs')
+GENRE_COLUMNS = ('masks', 'name_refs', 'slug_refs')
+
+
+class StringPool:
+    '''Пул строк без повторов для записи снимка.'''
+
+    def __init__(self):
+        self.refs = {}
+        self.offsets = array('q', [0])
+        self.chunks = []
+
+    def add(self, value):
+        if value is None:
+            return -1
+        ref = self.refs.get(value)
+        if ref is None:
+            encoded = value.encode()
+            ref = self.refs[value] = len(self.offsets) - 1
+            self.offsets.append(self.offsets[-1] + len(encoded))
+            self.chunks.append(encoded)
+        return ref
+
+
+class StringColumn:
+    '''Строковый столбец снимка: строки декодируются при обращении.'''
+
+    def __init__(self, pool, offsets, refs):
+        self.pool = pool
+        self.offsets = offsets
+        self.refs = refs
+
+    def __getitem__(self, position):
+        ref = self.refs[position]
+        if ref < 0:
+            return None
+        return str(self.pool[self.offsets[ref]:self.offsets[ref + 1]],
+                   'utf-8')
+
+
+def build_snapshot(path):
+    '''Записывает снимок каталога и возвращает (версия, число записей).'''
+    version = get_shared_version()
+    strings = StringPool()
+    titles = {column: array('q') for column in TITLE_COLUMNS}
+    for (title_id, name, year, description, category_id, genre_mask,
+         *_) in title_rows(Title.objects.order_by('id')).iterator():
+        titles['ids'].append(title_id)
+        titles['years'].append(year)
+        titles['category_ids'].append(category_id or 0)
+        titles['genre_masks'].append(genre_mask)
+        titles['name_refs'].append(strings.add(name))
+        titles['name_lower_refs'].append(strings.add(ascii_lower(name)))
+        titles['description_refs'].append(strings.add(description))
+    names = titles['name_refs']
+    titles['name_order'] = array('q', sorted(
+        range(len(titles['ids'])),
+        key=lambda position: (strings.chunks[names[position]],
+                              titles['ids'][position])
+    ))
+    categories = {column: array('q') for column in CATEGORY_COLUMNS}
+    for category_id, name, slug in dictionary_rows(Category):
+        categories['ids'].append(category_id)
+        categories['name_refs'].append(strings.add(name))
+        categories['slug_refs'].append(strings.add(slug))
+    genres = {column: array('q') for column in GENRE_COLUMNS}
+    supported = True
+    for genre in Genre.objects.order_by('name', 'id'):
+        supported = supported and genre.bit is not None
+        genres['masks'].append(genre.mask or 0)
+        genres['name_refs'].append(strings.add(genre.name))
+        genres['slug_refs'].append(strings.add(genre.slug))
+
+    temporary = f'{path}.{os.getpid()}.tmp'
+    with open(temporary, 'wb') as file:
+        file.write(HEADER.pack(
+            MAGIC, FORMAT_VERSION, supported, version,
+            len(titles['ids']), len(categories['ids']), len(genres['masks']),
+            len(strings.offsets) - 1, strings.offsets[-1],
+        ))
+        for columns, order in ((titles, TITLE_COLUMNS),
+                               (categories, CATEGORY_COLUMNS),
+                               (genres, GENRE_COLUMNS)):
+            for column in order:
+                file.write(columns[column].tobytes())
+        file.write(strings.offsets.tobytes())
+        for chunk in strings.chunks:
+            file.write(chunk)
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(temporary, path)
+    return version, len(titles['ids'])
+
+
+class CatalogSnapshot(CatalogReader):
+    '''Снимок, открытый только для чтения.'''
+
+    def __init__(self, path):
+        with open(path, 'rb') as file:
+            self.mmap = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        view = memoryview(self.mmap)
+        (magic, format_version, supported, self.version, titles, categories,
+         genres, strings, pool_size) = HEADER.unpack_from(view)
+        if magic != MAGIC or format_version != FORMAT_VERSION:
+            raise ValueError(f'{path}: неизвестный формат снимка каталога.')
+        self.supported = bool(supported)
+        offset = HEADER.size
+
+        def columns(names, count):
+            nonlocal offset
+            result = {}
+            for name in names:
+                end = offset + 8 * count
+                result[name] = view[offset:end].cast('q')
+                offset = end
+            return result
+
+        title_columns = columns(TITLE_COLUMNS, titles)
+        category_columns = columns(CATEGORY_COLUMNS, categories)
+        genre_columns = columns(GENRE_COLUMNS, genres)
+        self.offsets = columns(('offsets',), strings + 1)['offsets']
+        self.pool = view[offset:offset + pool_size]
+
+        self.ids = title_columns['ids']
+        self.years = title_columns['years']
+        self.category_ids = title_columns['category_ids']
+        self.genre_masks = title_columns['genre_masks']
+        self.name_order = title_columns['name_order']
+        self.names = self.strings(title_columns['name_refs'])
+        self.names_lower = self.strings(title_columns['name_lower_refs'])
+        self.descriptions = self.strings(title_columns['description_refs'])
+
+        category_names = self.strings(category_columns['name_refs'])
+        category_slugs = self.strings(category_columns['slug_refs'])
+        self.category_list = [
+            {'name': category_names[position],
+             'slug': category_slugs[position]}
+            for position in range(categories)
+        ]
+        self.categories = dict(zip(category_columns['ids'].tolist(),
+                                   self.category_list))
+        genre_names = self.strings(genre_columns['name_refs'])
+        genre_slugs = self.strings(genre_columns['slug_refs'])
+        self.genres = [
+            (genre_columns['masks'][position], genre_slugs[position],
+             {'name': genre_names[position],
+              'slug': genre_slugs[position]})
+            for position in range(genres)
+        ]
+
+    def strings(self, refs):
+        return StringColumn(self.pool, self.offsets, refs)
+
+    def title_counters(self, positions):
+        '''Счётчики отзывов меняются чаще каталога и в снимок не входят:
+        для страницы они читаются одним запросом по первичному ключу.'''
+        ids = [self.ids[position] for position in positions]
+        if not ids:
+            return []
+        counters = {
+            title_id: (score_sum, review_count)
+            for title_id, score_sum, review_count in Title.objects.filter(
+                id__in=ids).values_list('id', 'score_sum', 'review_count')
+        }
+        return [counters.get(title_id, (0, 0)) for title_id in ids]
+
+
+class SnapshotCatalog(CatalogBackend):
+    '''Текущий снимок процесса; подменяется, когда файл заменён.'''
+
+    def __init__(self):
+        super().__init__()
+        self.snapshot = None
+        self.identity = None
+
+    def ready(self):
+        path = settings.CATALOG_INDEX['SNAPSHOT_PATH']
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            return None
+        identity = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+        if identity != self.identity:
+            with self.lock:
+                if identity != self.identity:
+                    self.snapshot = CatalogSnapshot(path)
+                    self.identity = identity
+        snapshot = self.snapshot
+        if not snapshot.supported or snapshot.version != get_shared_version():
+            return None
+        return snapshot
+
+
+snapshot_catalog = SnapshotCatalog()
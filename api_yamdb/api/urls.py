@@ -12,6 +12,13 @@ router.register(r'titles/(?P<title_id>\d+)/reviews',
 router.register(r'titles/(?P<title_id>\d+)/reviews/(?P<review_id>\d+)'
                 r'/comments', views.CommentViewSet, basename='comments')
 router.register(r'users', views.UserViewSet)
+router.register(r'profiles', views.ProfileViewSet, basename='profiles')
+router.register(r'analytics/titles', views.TitleRollupViewSet,
+                basename='title-analytics')
+router.register(r'analytics/categories', views.CategoryRollupViewSet,
+                basename='category-analytics')
+router.register(r'analytics/genres', views.GenreRollupViewSet,
+                basename='genre-analytics')
 
 urlpatterns = [
     path('v1/', include(router.urls)),
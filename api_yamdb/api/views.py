@@ -1,27 +1,39 @@
 import re
+from operator import itemgetter
 
 from django.shortcuts import get_object_or_404
 from django.contrib.auth.tokens import default_token_generator
 from django.core.mail import send_mail
-from django.db.models import Avg
+from django.db.models import F
+from django.http import FileResponse
+from django.urls import reverse
 from django_filters.rest_framework import DjangoFilterBackend
 
-from rest_framework import filters, permissions, status, viewsets
+from rest_framework import filters, mixins, permissions, status, viewsets
 from rest_framework.decorators import action
+from rest_framework.exceptions import NotFound, ValidationError
 from rest_framework.pagination import PageNumberPagination
 from rest_framework.response import Response
 from rest_framework.views import APIView
 from rest_framework_simplejwt.tokens import AccessToken
 
 from api_yamdb.settings import CONST
-from api import serializers
-from api.filters import TitlesFilter
-from api.mixins import ListCreateDestroyMixin
+from api import catalog, profiling, serializers
+from api.compiled import compile_serializer, top_rows
+from api.filters import ReviewRollupFilter, TitleOrderingFilter, TitlesFilter
+from api.mixins import (AtomicWriteMixin, CatalogListMixin,
+                        CompiledListMixin, LeaderboardMixin,
+                        ListCreateDestroyMixin, SparseQuerysetMixin,
+                        StreamingListMixin)
+from api.pagination import AuthorFeedPagination
 from api.permissions import (IsAuthenticatedAdmin,
                              IsAuthenticatedAndAdminOrReadOnly,
-                             IsAuthenticatedAdminModeratorOwnerOrReadOnly)
+                             IsAuthenticatedAdminModeratorOwnerOrReadOnly,
+                             IsAuthenticatedModerator)
 
-from reviews.models import Category, Genre, Review, Title, User
+from reviews import services
+from reviews.models import (Category, Comment, Genre, Review, ReviewRollup,
+                            Title, User)
 
 
 METHODS = ('get', 'post', 'head', 'delete', 'patch', 'options')
@@ -31,41 +43,191 @@ PATTERN_EMAIL = re.compile('^[a-zA-Z0-9_.+-]+@[a-zA-Z0-9-]+.[a-zA-Z0-9-.]+$')
 
 
 # Представление для работы с категориями
-class CategoryViewSet(ListCreateDestroyMixin):
+class CategoryViewSet(SparseQuerysetMixin, CatalogListMixin,
+                      LeaderboardMixin, ListCreateDestroyMixin):
     queryset = Category.objects.all()
     serializer_class = serializers.CategorySerializer
     permission_classes = (IsAuthenticatedAndAdminOrReadOnly,)
     filter_backends = (filters.SearchFilter,)
     search_fields = ('name',)
     lookup_field = 'slug'
+    catalog_kind = 'categories'
+    leaderboard_field = 'category'
 
 
 # Представление для работы с жанрами
-class GenreViewSet(ListCreateDestroyMixin):
+class GenreViewSet(SparseQuerysetMixin, CatalogListMixin, LeaderboardMixin,
+                   ListCreateDestroyMixin):
     queryset = Genre.objects.all()
     serializer_class = serializers.GenreSerializer
     permission_classes = (IsAuthenticatedAndAdminOrReadOnly,)
     filter_backends = (filters.SearchFilter,)
     search_fields = ('name',)
     lookup_field = 'slug'
+    catalog_kind = 'genres'
+    leaderboard_field = 'genre'
 
 
 # Представления для работы с тайтлами
-class TitleViewSet(viewsets.ModelViewSet):
-    queryset = Title.objects.all().annotate(
-        Avg('reviews__score')
+class TitleViewSet(SparseQuerysetMixin, CompiledListMixin, AtomicWriteMixin,
+                   viewsets.ModelViewSet):
+    queryset = Title.objects.select_related('category').prefetch_related(
+        'genre'
     ).order_by('name')
     serializer_class = serializers.TitleSerializer
     permission_classes = (IsAuthenticatedAndAdminOrReadOnly,)
-    filter_backends = (DjangoFilterBackend,)
+    filter_backends = (DjangoFilterBackend, TitleOrderingFilter)
     filterset_class = TitlesFilter
+    ordering_fields = ('name', 'year', 'weighted_rating',
+                       'normalized_rating')
     http_method_names = METHODS
+    sparse_annotations = {
+        'rating': {'reviews__score__avg': services.average_score()},
+    }
 
     def get_serializer_class(self):
-        if self.action in ('retrieve', 'list'):
+        if self.action in ('retrieve', 'list', 'trending', 'batch',
+                           'overview'):
             return serializers.ReadOnlyTitleSerializer
         return serializers.TitleSerializer
 
+    def list(self, request, *args, **kwargs):
+        index = catalog.get_index()
+        titles = (index.list_titles(request.query_params)
+                  if index is not None else None)
+        if titles is None:
+            return super().list(request, *args, **kwargs)
+        page = self.paginate_queryset(titles)
+        return self.get_paginated_response(page)
+
+    @action(detail=False, methods=('get',),
+            filter_backends=(DjangoFilterBackend,))
+    def trending(self, request):
+        # Популярность и средняя оценка поддерживаются при записи отзывов
+        # (см. services.trending_weight), список читается по индексу.
+        titles = self.filter_queryset(Title.objects.filter(
+            trending_score__isnull=False
+        ).annotate(
+            reviews__score__avg=services.average_score()
+        ).select_related('category').prefetch_related('genre').order_by(
+            '-trending_score', 'id'
+        ))
+        return self.list_response(titles)
+
+    @action(detail=False, methods=('get',), filter_backends=())
+    def batch(self, request):
+        # Два запроса при любом числе id: произведения и их жанры.
+        ids = self.batch_ids(request)
+        titles = self.serialize_by_pk(self.filter_queryset(
+            Title.objects.filter(pk__in=ids).annotate(
+                reviews__score__avg=services.average_score()
+            ).select_related('category').prefetch_related('genre').order_by()
+        ))
+        return Response({
+            'results': [titles[pk] for pk in ids if pk in titles],
+            'missing': [pk for pk in ids if pk not in titles],
+        })
+
+    @staticmethod
+    def batch_ids(request):
+        limit = CONST['TITLES_BATCH_MAX_IDS']
+        values = [value.strip() for value
+                  in request.query_params.get('ids', '').split(',')
+                  if value.strip()]
+        if not values or not all(value.isdigit() and len(value) <= 18
+                                 for value in values):
+            raise ValidationError(
+                {'ids': ['Comma-separated title ids are required.']})
+        ids = list(dict.fromkeys(int(value) for value in values))
+        if len(ids) > limit:
+            raise ValidationError(
+                {'ids': [f'No more than {limit} ids per request.']})
+        return ids
+
+    @action(detail=True, methods=('get',))
+    def overview(self, request, pk=None):
+        # Четыре запроса при любом размере страницы (если сериализаторы
+        # компилируются): произведение, его жанры, первая страница отзывов
+        # и последние комментарии к ним.
+        title = self.get_object()
+        page_size = self.paginator.page_size
+        context = {'view': self}
+        reviews = compile_serializer(
+            serializers.ReviewSerializer(context=context),
+            title.reviews.all()
+        )
+        comments = compile_serializer(
+            serializers.CommentSerializer(context=context),
+            Comment.objects.all()
+        )
+        if reviews is None or comments is None:
+            results = self.overview_results(title, page_size, context)
+        else:
+            results = self.compiled_overview_results(reviews, comments,
+                                                     page_size)
+        next_page = None
+        if title.review_count > page_size:
+            next_page = request.build_absolute_uri(reverse(
+                'reviews-list', kwargs={'title_id': title.pk}
+            ) + '?page=2')
+        return Response({
+            'title': self.get_serializer(title).data,
+            'reviews': {
+                'count': title.review_count,
+                'next': next_page,
+                'previous': None,
+                'results': results,
+            },
+        })
+
+    def compiled_overview_results(self, reviews, comments, page_size):
+        review_key = reviews.column('id')
+        count_key = reviews.column('comment_count')
+        review_rows = list(reviews.rows()[:page_size])
+        comment_key = comments.column('review_id')
+        latest = {}
+        # Строки - последние по дате; в ответе комментарии идут по порядку.
+        for row in sorted(top_rows(
+                comments, 'review_id', [F('pub_date').desc(), F('id').desc()],
+                CONST['TITLE_OVERVIEW_COMMENTS'],
+                Comment.objects.filter(
+                    review_id__in=[row[review_key] for row in review_rows])),
+                key=itemgetter(-1), reverse=True):
+            latest.setdefault(row[comment_key], []).append(row)
+        results = reviews.serialize(review_rows)
+        for row, review in zip(review_rows, results):
+            review['comment_count'] = row[count_key]
+            review['comments'] = comments.serialize(
+                latest.get(row[review_key], ()))
+        return results
+
+    def overview_results(self, title, page_size, context):
+        '''Те же данные через сериализаторы DRF, если их нельзя
+        скомпилировать; комментарии читаются отдельным запросом на отзыв.'''
+        reviews = list(title.reviews.all()[:page_size])
+        results = serializers.ReviewSerializer(
+            reviews, many=True, context=context).data
+        for review, data in zip(reviews, results):
+            latest = review.comments.order_by('-pub_date', '-id')[
+                :CONST['TITLE_OVERVIEW_COMMENTS']]
+            data['comment_count'] = review.comment_count
+            data['comments'] = serializers.CommentSerializer(
+                list(latest)[::-1], many=True, context=context).data
+        return results
+
+    @action(detail=True, methods=('get',))
+    def similar(self, request, pk=None):
+        titles = Title.objects.filter(similar_to__title_id=pk).annotate(
+            reviews__score__avg=services.average_score()
+        ).select_related('category').prefetch_related('genre').order_by(
+            '-similar_to__score', 'id'
+        )
+        serializer = serializers.ReadOnlyTitleSerializer(
+            titles, many=True, context=self.get_serializer_context())
+        if not serializer.data and not Title.objects.filter(pk=pk).exists():
+            raise NotFound()
+        return Response(serializer.data)
+
 
 class RegistrationView(APIView):
     permission_classes = [permissions.AllowAny]
@@ -138,7 +300,8 @@ class TokenView(APIView):
 
 
 # Представление для работы с пользователями
-class UserViewSet(viewsets.ModelViewSet):
+class UserViewSet(SparseQuerysetMixin, StreamingListMixin,
+                  viewsets.ModelViewSet):
     lookup_field = 'username'
     queryset = User.objects.all()
     serializer_class = serializers.UserSerializer
@@ -148,6 +311,11 @@ class UserViewSet(viewsets.ModelViewSet):
     search_fields = ('username',)
     http_method_names = METHODS
 
+    def get_queryset(self):
+        if 'stats' in self.get_serializer().fields:
+            return self.queryset.select_related('reviewer_stats')
+        return self.queryset.all()
+
     @action(
         methods=['get', 'patch', ],
         detail=False,
@@ -169,6 +337,57 @@ class UserViewSet(viewsets.ModelViewSet):
             return Response(serializer.data, status=status.HTTP_200_OK)
         return Response(status=status.HTTP_405_METHOD_NOT_ALLOWED)
 
+    @action(
+        methods=['get', ],
+        detail=False,
+        url_path='me/recommendations',
+        permission_classes=[permissions.IsAuthenticated],
+        serializer_class=serializers.ReadOnlyTitleSerializer,
+    )
+    def recommendations(self, request):
+        # Рекомендации пересчитывает команда build_recommendations;
+        # произведения с отзывом, оставленным после пересчёта, скрываются.
+        titles = Title.objects.filter(
+            recommended_to__user=request.user
+        ).exclude(reviews__author=request.user).annotate(
+            reviews__score__avg=services.average_score()
+        ).select_related('category').prefetch_related('genre').order_by(
+            '-recommended_to__score', 'id'
+        )
+        serializer = self.get_serializer(titles, many=True)
+        return Response(serializer.data, status=status.HTTP_200_OK)
+
+    @action(
+        methods=['get', ],
+        detail=True,
+        permission_classes=[IsAuthenticatedModerator],
+        serializer_class=serializers.ReviewSerializer,
+        pagination_class=AuthorFeedPagination,
+    )
+    def reviews(self, request, username=None):
+        author = get_object_or_404(User, username=username)
+        return self.author_feed(author.reviews.select_related('title'))
+
+    @action(
+        methods=['get', ],
+        detail=True,
+        permission_classes=[IsAuthenticatedModerator],
+        serializer_class=serializers.AuthorCommentSerializer,
+        pagination_class=AuthorFeedPagination,
+    )
+    def comments(self, request, username=None):
+        author = get_object_or_404(User, username=username)
+        return self.author_feed(
+            author.comments.select_related('review__title'))
+
+    def author_feed(self, queryset):
+        # Один запрос на страницу: строки автора по индексу
+        # (author, pub_date) с названиями произведений через JOIN; автор
+        # уже загружен и подставляется менеджером.
+        page = self.paginate_queryset(queryset)
+        return self.get_paginated_response(
+            self.get_serializer(page, many=True).data)
+
     def create(self, request, *args, **kwargs):
         email = request.data.get('email')
         username = request.data.get('username')
@@ -187,13 +406,15 @@ class UserViewSet(viewsets.ModelViewSet):
 
 
 # Представление для работы с отзывами
-class ReviewViewSet(viewsets.ModelViewSet):
+class ReviewViewSet(SparseQuerysetMixin, StreamingListMixin,
+                    CompiledListMixin, AtomicWriteMixin,
+                    viewsets.ModelViewSet):
     serializer_class = serializers.ReviewSerializer
     permission_classes = [IsAuthenticatedAdminModeratorOwnerOrReadOnly]
 
     def get_queryset(self):
         title = get_object_or_404(Title, pk=self.kwargs.get('title_id'))
-        return title.reviews.all()
+        return title.reviews.select_related('author')
 
     def perform_create(self, serializer):
         title_id = self.kwargs.get('title_id')
@@ -207,13 +428,14 @@ class ReviewViewSet(viewsets.ModelViewSet):
 
 
 # Представление для работы с комментариями
-class CommentViewSet(viewsets.ModelViewSet):
+class CommentViewSet(SparseQuerysetMixin, CompiledListMixin,
+                     AtomicWriteMixin, viewsets.ModelViewSet):
     serializer_class = serializers.CommentSerializer
     permission_classes = [IsAuthenticatedAdminModeratorOwnerOrReadOnly]
 
     def get_queryset(self):
         review = get_object_or_404(Review, pk=self.kwargs.get('review_id'))
-        return review.comments.all()
+        return review.comments.select_related('author')
 
     def perform_create(self, serializer):
         title_id = self.kwargs.get('title_id')
@@ -225,3 +447,52 @@ class CommentViewSet(viewsets.ModelViewSet):
         if request.method == 'PUT':
             return Response(status=status.HTTP_405_METHOD_NOT_ALLOWED)
         return super().update(request, *args, **kwargs)
+
+
+# Представления для аналитики по сводкам отзывов
+class ReviewRollupViewSet(SparseQuerysetMixin, mixins.ListModelMixin,
+                          viewsets.GenericViewSet):
+    permission_classes = (IsAuthenticatedAdmin,)
+    filter_backends = (DjangoFilterBackend,)
+    filterset_class = ReviewRollupFilter
+    rollup_field = None
+
+    def get_queryset(self):
+        rollups = ReviewRollup.objects.filter(
+            **{f'{self.rollup_field}__isnull': False}
+        ).order_by('bucket', f'{self.rollup_field}_id')
+        if self.rollup_field != 'title':
+            rollups = rollups.select_related(self.rollup_field)
+        return rollups
+
+
+class TitleRollupViewSet(ReviewRollupViewSet):
+    serializer_class = serializers.TitleRollupSerializer
+    rollup_field = 'title'
+
+
+class CategoryRollupViewSet(ReviewRollupViewSet):
+    serializer_class = serializers.CategoryRollupSerializer
+    rollup_field = 'category'
+
+
+class GenreRollupViewSet(ReviewRollupViewSet):
+    serializer_class = serializers.GenreRollupSerializer
+    rollup_field = 'genre'
+
+
+# Представление для скачивания сохранённых профилей запросов
+class ProfileViewSet(viewsets.ViewSet):
+    permission_classes = (IsAuthenticatedAdmin,)
+    lookup_field = 'name'
+    lookup_value_regex = r'[^/]+'
+
+    def list(self, request):
+        return Response(profiling.list_profiles())
+
+    def retrieve(self, request, name=None):
+        path = profiling.get_profile_path(name)
+        if path is None:
+            raise NotFound('Profile not found.')
+        return FileResponse(open(path, 'rb'), as_attachment=True,
+                            filename=name)
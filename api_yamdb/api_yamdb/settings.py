@@ -30,12 +30,14 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'api.middleware.CompressionMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'api.middleware.ProfilingMiddleware',
 ]
 
 ROOT_URLCONF = 'api_yamdb.urls'
@@ -107,6 +109,11 @@ STATIC_URL = '/static/'
 
 STATICFILES_DIRS = (os.path.join(BASE_DIR, 'static/'),)
 
+# collectstatic и compress_static собирают и сжимают файлы сюда;
+# в боевом окружении их отдаёт nginx, при DEBUG = True -
+# api.compression.serve_static.
+STATIC_ROOT = env.str('STATIC_ROOT', os.path.join(BASE_DIR, 'static_root'))
+
 AUTH_USER_MODEL = 'users.User'
 
 EMAIL_BACKEND = 'django.core.mail.backends.filebased.EmailBackend'
@@ -125,6 +132,20 @@ REST_FRAMEWORK = {
     'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.'
                                 'PageNumberPagination',
     'PAGE_SIZE': 10,
+    # JSON через orjson (api.renderers); стандартные классы DRF -
+    # rest_framework.renderers.JSONRenderer и parsers.JSONParser.
+    # MessagePack - по Accept и Content-Type: application/msgpack.
+    'DEFAULT_RENDERER_CLASSES': [
+        'api.renderers.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+        'api.renderers.MessagePackRenderer',
+    ],
+    'DEFAULT_PARSER_CLASSES': [
+        'api.parsers.FastJSONParser',
+        'api.parsers.MessagePackParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+    ],
 }
 
 SIMPLE_JWT = {
@@ -134,10 +155,87 @@ SIMPLE_JWT = {
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
+# Профилирование запросов: `X-Profile: cprofile|sampling` от администратора
+# или случайная выборка доли SAMPLE_RATE всех запросов.
+PROFILING = {
+    'DIR': env.str('PROFILING_DIR', os.path.join(BASE_DIR, 'profiles')),
+    'HEADER': 'X-Profile',
+    'QUERY_PARAM': 'profile',
+    'RESPONSE_HEADER': 'X-Profile-Id',
+    'SAMPLE_RATE': env.float('PROFILING_SAMPLE_RATE', 0.0),
+    'SAMPLE_MODE': 'sampling',
+    'SAMPLING_INTERVAL': env.float('PROFILING_SAMPLING_INTERVAL', 0.005),
+    # Хранение: не больше MAX_FILES последних профилей и не старше
+    # MAX_AGE_DAYS дней; лишние удаляются при сохранении нового.
+    'MAX_FILES': env.int('PROFILING_MAX_FILES', 500),
+    'MAX_AGE_DAYS': env.float('PROFILING_MAX_AGE_DAYS', 7),
+}
+
+# Индекс каталога в памяти процесса для `/titles/` (api/catalog.py).
+# Счётчик версий каталога хранится в файле VERSION_PATH: через него
+# воркеры узнают об изменениях. Все веб-процессы и build_catalog_snapshot
+# должны работать с одним файлом - на одной машине или на общей файловой
+# системе с поддержкой flock.
+CATALOG_INDEX = {
+    # None, 'memory' или 'snapshot' (см. api/catalog.py).
+    'BACKEND': env.str('CATALOG_INDEX_BACKEND', None),
+    'VERSION_PATH': env.str('CATALOG_VERSION_PATH',
+                            os.path.join(BASE_DIR, 'catalog.version')),
+    'SNAPSHOT_PATH': env.str('CATALOG_SNAPSHOT_PATH',
+                             os.path.join(BASE_DIR, 'catalog.snapshot')),
+}
+
+# Похожие произведения (`/titles/{id}/similar/`): сходство жанров по
+# Жаккару, смешанное со сходством средних оценок с весом RATING_WEIGHT.
+SIMILAR_TITLES = {
+    'TOP_K': 10,
+    'RATING_WEIGHT': 0.3,
+}
+
+# Взвешенный рейтинг (S + m * C) / (v + m): C - средняя оценка всех
+# отзывов, m - квантиль числа отзывов у произведений с отзывами.
+WEIGHTED_RATING = {
+    'MIN_VOTES_QUANTILE': 0.5,
+    'LEADERBOARD_SIZE': 10,
+}
+
+# Каталог колоночной выгрузки отзывов (команда export_review_columns).
+REVIEW_COLUMNS_DIR = env.str('REVIEW_COLUMNS_DIR',
+                             os.path.join(BASE_DIR, 'review_columns'))
+
+# Сжатие ответов gzip (api.middleware.CompressionMiddleware) и заранее
+# сжатые копии статических файлов (команда compress_static).
+COMPRESSION = {
+    'MIN_SIZE': 1024,
+    # text/html не сжимается: страницы админки и browsable API содержат
+    # CSRF-токен, а сжатие рядом с данными из запроса открывает BREACH.
+    'CONTENT_TYPES': (
+        'application/javascript',
+        'application/json',
+        'application/msgpack',
+        'application/yaml',
+        'image/svg+xml',
+        'text/css',
+        'text/csv',
+        'text/javascript',
+        'text/plain',
+    ),
+}
+
+# Популярные произведения (`/titles/trending/`): вклад отзыва - его оценка,
+# убывающая вдвое за HALF_LIFE_DAYS. Вклады отсчитываются от EPOCH, а в базе
+# хранится логарифм их суммы, поэтому старые значения не переписываются.
+TRENDING = {
+    'HALF_LIFE_DAYS': 7,
+    'EPOCH': '2020-01-01T00:00:00+00:00',
+}
+
 # CONSTANTS
 CONST = {
     'USERNAME_VALIDATED': 'me',
     'USERNAME_MAX_LENGTH': 150,
     'EMAIL_MAX_LENGTH': 254,
+    'TITLES_BATCH_MAX_IDS': 100,
+    'TITLE_OVERVIEW_COMMENTS': 3,
     'FROM_EMAIL': env.str('FROM_EMAIL', 'from_email'),
 }
@@ -1,7 +1,10 @@
+from django.conf import settings
 from django.contrib import admin
-from django.urls import include, path
+from django.urls import include, path, re_path
 from django.views.generic import TemplateView
 
+from api.compression import serve_static
+
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('api/', include('api.urls')),
@@ -11,3 +14,11 @@ urlpatterns = [
         name='redoc'
     ),
 ]
+
+# Как и django.conf.urls.static.static(), только для разработки: в боевом
+# окружении STATIC_ROOT отдаёт веб-сервер (nginx с `gzip_static on`).
+if settings.DEBUG:
+    urlpatterns += [
+        re_path(rf'^{settings.STATIC_URL.lstrip("/")}(?P<path>.+)$',
+                serve_static),
+    ]
@@ -0,0 +1,81 @@
+'''Пересчёты по всем отзывам на NumPy - только для команд управления.
+
+Веб-процессы модуль не импортируют: NumPy загружается только в командах
+`update_reviewer_stats`, `build_recommendations` и `generate_dataset`.
+'''
+import numpy as np
+from django.db import transaction
+from django.db.models import Max
+
+from reviews import normalization
+from reviews.models import ReviewerStats, Review, Title
+from reviews.services import CHUNK_SIZE, user_activity
+
+
+def review_arrays(chunk_size):
+    '''Автор, произведение и оценка всех отзывов, прочитанные пачками
+    по id в заранее выделенные массивы.'''
+    fields = ('id', 'author_id', 'title_id', 'score')
+    last_id = Review.objects.aggregate(Max('id'))['id__max'] or 0
+    total = Review.objects.filter(id__lte=last_id).count()
+    users = np.empty(total, dtype=np.int64)
+    titles = np.empty(total, dtype=np.int64)
+    scores = np.empty(total, dtype=np.int8)
+    position, after = 0, 0
+    while position < total:
+        rows = np.array(
+            Review.objects.filter(id__gt=after, id__lte=last_id)
+            .order_by('id').values_list(*fields)[:chunk_size],
+            dtype=np.int64
+        ).reshape(-1, len(fields))[:total - position]
+        if not len(rows):
+            break
+        end = position + len(rows)
+        users[position:end] = rows[:, 1]
+        titles[position:end] = rows[:, 2]
+        scores[position:end] = rows[:, 3]
+        position, after = end, rows[-1, 0]
+    return users[:position], titles[:position], scores[:position]
+
+
+def update_reviewer_stats(chunk_size=CHUNK_SIZE * 100):
+    '''Пересчитывает статистику оценок и активности всех пользователей и
+    нормированный рейтинг всех произведений; возвращает число
+    пользователей и произведений с отзывами.'''
+    users, titles, scores = review_arrays(chunk_size)
+    (user_ids, rows, counts, sums, squares,
+     means, stds) = normalization.user_statistics(users, scores)
+    normalized = normalization.normalized_scores(
+        scores, means[rows], stds[rows])
+    title_ids, title_counts, title_sums = normalization.title_sums(
+        titles, normalized)
+    with transaction.atomic():
+        activity = user_activity()
+        stats = [
+            ReviewerStats(user_id=user_id, review_count=count,
+                          score_sum=total, score_square_sum=square,
+                          mean=mean, std=std)
+            for user_id, count, total, square, mean, std in zip(
+                user_ids.tolist(), counts.tolist(), sums.tolist(),
+                squares.tolist(), means.tolist(), stds.tolist())
+        ]
+        # Пользователи только с комментариями.
+        reviewers = set(user_ids.tolist())
+        stats.extend(ReviewerStats(user_id=user_id)
+                     for user_id in activity if user_id not in reviewers)
+        for user_stats in stats:
+            user_stats.comment_count, user_stats.last_activity = activity[
+                user_stats.user_id]
+        ReviewerStats.objects.all().delete()
+        ReviewerStats.objects.bulk_create(stats, batch_size=CHUNK_SIZE // 4)
+        Title.objects.update(normalized_score_sum=0, normalized_rating=None)
+        Title.objects.bulk_update(
+            [Title(id=title_id, normalized_score_sum=total,
+                   normalized_rating=total / count)
+             for title_id, count, total in zip(
+                 title_ids.tolist(), title_counts.tolist(),
+                 title_sums.tolist())],
+            ('normalized_score_sum', 'normalized_rating'),
+            batch_size=CHUNK_SIZE // 4
+        )
+    return len(user_ids), len(title_ids)
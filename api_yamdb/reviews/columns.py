@@ -0,0 +1,172 @@
+'''Колоночная выгрузка отзывов в .npy-файлы для офлайн-аналитики.
+
+Модуль не зависит от Django: строки из базы читает команда
+`export_review_columns`, а аналитики открывают выгрузку через
+`load_columns` без установки проекта.
+
+* Каждая колонка - отдельный одномерный .npy-файл в каталоге выгрузки:
+  `reviews/<колонка>.npy` (строки упорядочены по id отзыва) и
+  `titles/<колонка>.npy` (категория произведения, перезаписывается
+  целиком).
+* Новые отзывы дописываются в конец файлов: размер в заголовке .npy
+  обновляется на месте (NumPy оставляет в заголовке место под рост
+  размерности), поэтому уже выгруженные данные не переписываются.
+* `load_columns` открывает файлы через `mmap_mode='r'`: массивы
+  ссылаются на страницы файлов без копирования.
+'''
+import os
+
+import numpy as np
+
+# Первичные ключи - BigAutoField, поэтому все id хранятся в int64.
+REVIEW_COLUMNS = {
+    'id': np.int64,
+    'title_id': np.int64,
+    'author_id': np.int64,
+    'score': np.int8,
+    # Время публикации, секунды от 1970-01-01 UTC.
+    'pub_date': np.int64,
+}
+TITLE_COLUMNS = {
+    'id': np.int64,
+    # -1 - произведение без категории.
+    'category_id': np.int64,
+}
+
+
+def column_path(directory, table, name):
+    return os.path.join(directory, table, f'{name}.npy')
+
+
+def column_length(path):
+    if not os.path.exists(path):
+        return 0
+    return len(np.load(path, mmap_mode='r'))
+
+
+def truncate_column(path, length):
+    '''Обрезает колонку до `length` строк (после прерванной дозаписи).'''
+    with open(path, 'r+b') as column:
+        version = np.lib.format.read_magic(column)
+        shape, fortran_order, dtype = read_header(column, version)
+        offset = column.tell()
+        write_header(column, version, dtype, length, offset)
+        column.truncate(offset + length * dtype.itemsize)
+
+
+def read_header(column, version):
+    if version == (1, 0):
+        return np.lib.format.read_array_header_1_0(column)
+    return np.lib.format.read_array_header_2_0(column)
+
+
+def write_header(column, version, dtype, length, offset):
+    '''Записывает заголовок с новым размером поверх старого. Возвращает
+    False, если заголовок не помещается на прежнее место.'''
+    header = {'descr': np.lib.format.dtype_to_descr(dtype),
+              'fortran_order': False, 'shape': (length,)}
+    column.seek(0)
+    if version == (1, 0):
+        np.lib.format.write_array_header_1_0(column, header)
+    else:
+        np.lib.format.write_array_header_2_0(column, header)
+    return column.tell() == offset
+
+
+def append_column(path, values):
+    '''Дописывает `values` в конец колонки, создавая её при
+    необходимости.'''
+    if not os.path.exists(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        np.save(path, values)
+        return
+    with open(path, 'r+b') as column:
+        version = np.lib.format.read_magic(column)
+        shape, fortran_order, dtype = read_header(column, version)
+        offset = column.tell()
+        if values.dtype != dtype:
+            raise ValueError(f'{path}: тип {dtype}, дописывается '
+                             f'{values.dtype}; выгрузите колонки заново.')
+        if write_header(column, version, dtype, shape[0] + len(values),
+                        offset):
+            column.seek(offset + shape[0] * dtype.itemsize)
+            column.truncate()
+            column.write(values.tobytes())
+            return
+    # Размер не поместился в заголовок - файл переписывается целиком.
+    existing = np.load(path)
+    np.save(path, np.concatenate((existing, values)))
+
+
+def exported_reviews(directory):
+    '''Число выгруженных отзывов и id последнего из них. Колонки разной
+    длины после прерванной дозаписи обрезаются до общей длины.'''
+    paths = [column_path(directory, 'reviews', name)
+             for name in REVIEW_COLUMNS]
+    lengths = [column_length(path) for path in paths]
+    length = min(lengths)
+    for path, column_size in zip(paths, lengths):
+        if column_size > length:
+            truncate_column(path, length)
+    if not length:
+        return 0, 0
+    ids = np.load(paths[0], mmap_mode='r')
+    return length, int(ids[length - 1])
+
+
+def append_reviews(directory, rows):
+    '''Дописывает пачку отзывов - массив строк в порядке REVIEW_COLUMNS,
+    упорядоченный по id.'''
+    rows = np.asarray(rows, dtype=np.int64).reshape(-1, len(REVIEW_COLUMNS))
+    for position, (name, dtype) in enumerate(REVIEW_COLUMNS.items()):
+        append_column(column_path(directory, 'reviews', name),
+                      rows[:, position].astype(dtype))
+
+
+def save_titles(directory, rows):
+    '''Перезаписывает колонки произведений (id, id категории).'''
+    rows = np.asarray(rows, dtype=np.int64).reshape(-1, len(TITLE_COLUMNS))
+    for position, (name, dtype) in enumerate(TITLE_COLUMNS.items()):
+        path = column_path(directory, 'titles', name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temporary = f'{path}.tmp.npy'
+        np.save(temporary, rows[:, position].astype(dtype))
+        os.replace(temporary, path)
+
+
+def load_columns(directory, table='reviews'):
+    '''Колонки таблицы `reviews` или `titles` в виде массивов, отображённых
+    в память (без копирования данных).'''
+    columns = REVIEW_COLUMNS if table == 'reviews' else TITLE_COLUMNS
+    arrays = {name: np.load(column_path(directory, table, name),
+                            mmap_mode='r')
+              for name in columns}
+    # Колонки дописываются по одной: читаются только полные строки.
+    length = min(len(array) for array in arrays.values())
+    return {name: array[:length] for name, array in arrays.items()}
+
+
+def average_score_by_category(directory):
+    '''Средняя оценка отзывов по категориям: {id категории: средняя}.'''
+    reviews = load_columns(directory)
+    titles = load_columns(directory, 'titles')
+    if not len(titles['id']):
+        return {}
+    order = np.argsort(titles['id'])
+    title_ids = titles['id'][order]
+    positions = np.minimum(np.searchsorted(title_ids, reviews['title_id']),
+                           len(title_ids) - 1)
+    # Отзывы удалённых после выгрузки произведений не учитываются.
+    known = title_ids[positions] == reviews['title_id']
+    categories = titles['category_id'][order][positions[known]]
+    scores = reviews['score'][known]
+    with_category = categories >= 0
+    categories = categories[with_category]
+    scores = scores[with_category]
+    if not len(categories):
+        return {}
+    counts = np.bincount(categories)
+    sums = np.bincount(categories, weights=scores)
+    present = np.flatnonzero(counts)
+    return dict(zip(present.tolist(),
+                    (sums[present] / counts[present]).tolist()))
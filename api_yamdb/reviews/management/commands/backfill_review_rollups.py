@@ -0,0 +1,39 @@
+import os
+import time
+
+from django.core.management.base import BaseCommand
+
+from reviews import services
+from reviews.models import Review
+from reviews.parallel import id_ranges, run_chunks
+
+
+def merge_totals(totals, other):
+    for key, (count, total) in other.items():
+        merged = totals.setdefault(key, [0, 0])
+        merged[0] += count
+        merged[1] += total
+    return totals
+
+
+class Command(BaseCommand):
+    help = ('Пересчитывает сводки отзывов по дням и месяцам (ReviewRollup) '
+            'по всем отзывам.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=os.cpu_count())
+        parser.add_argument('--chunk-size', type=int, default=50_000)
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        # Процессы только читают отзывы; сводки записывает основной процесс.
+        totals = {}
+        for part in run_chunks(services.review_day_totals,
+                               id_ranges(Review, options['chunk_size']),
+                               options['workers']):
+            merge_totals(totals, part)
+        rows = services.rebuild_review_rollups(totals)
+        self.stdout.write(
+            f'Отзывов: {sum(count for count, _ in totals.values())}, '
+            f'строк сводок: {rows}, '
+            f'{time.perf_counter() - started:.1f} с')
@@ -0,0 +1,43 @@
+import os
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from reviews import services
+from reviews.models import Title
+from reviews.parallel import id_ranges, run_chunks
+
+
+def trending_range(start, end):
+    '''Популярность произведений с id из [start, end).'''
+    return services.trending_scores(
+        Title.objects.filter(id__gte=start, id__lt=end)
+        .values_list('id', flat=True))
+
+
+class Command(BaseCommand):
+    help = ('Заполняет гистограммы оценок, число отзывов, сумму оценок '
+            'и популярность произведений по существующим отзывам.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=os.cpu_count())
+        parser.add_argument('--chunk-size', type=int,
+                            default=services.CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        # Процессы только читают отзывы и считают популярность; пишет
+        # основной процесс. Счётчики считаются в самом UPDATE подзапросами
+        # и не теряют отзывы, записанные во время работы команды.
+        done = 0
+        for scores in run_chunks(
+                trending_range, id_ranges(Title, options['chunk_size']),
+                options['workers']):
+            with transaction.atomic():
+                services.repair_counters(scores)
+                services.save_trending_scores(scores)
+            done += len(scores)
+        self.stdout.write(
+            f'Произведений: {done}, '
+            f'{time.perf_counter() - started:.1f} с')
@@ -0,0 +1,55 @@
+import os
+import tempfile
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from reviews import batch, recommender
+from reviews.models import Recommendation
+
+
+class Command(BaseCommand):
+    help = ('Пересчитывает рекомендации пользователям по оценкам отзывов '
+            '(см. reviews/recommender.py).')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rank', type=int, default=32)
+        parser.add_argument('--top-n', type=int, default=20)
+        parser.add_argument('--chunk-size', type=int, default=200_000)
+        parser.add_argument('--workers', type=int, default=os.cpu_count())
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        matrix = recommender.RatingMatrix(
+            *batch.review_arrays(options['chunk_size']),
+            options['chunk_size'])
+        loaded = time.perf_counter()
+        users, titles = matrix.shape
+        count = 0
+        with tempfile.TemporaryDirectory() as directory:
+            if len(matrix.values):
+                matrix.save(directory, options['rank'], options['seed'])
+            factorized = time.perf_counter()
+            with transaction.atomic():
+                Recommendation.objects.all().delete()
+                for user_rows, title_columns, scores in recommender.recommend(
+                        directory, users, titles, options['top_n'],
+                        options['workers']):
+                    Recommendation.objects.bulk_create(
+                        Recommendation(user_id=user_id, title_id=title_id,
+                                       score=score)
+                        for user_id, title_id, score in zip(
+                            matrix.user_ids[user_rows].tolist(),
+                            matrix.title_ids[title_columns].tolist(),
+                            scores.tolist())
+                    )
+                    count += len(scores)
+        self.stdout.write(
+            f'Отзывов {len(matrix.values)}, пользователей {users}, '
+            f'произведений {titles}, рекомендаций {count}. Загрузка '
+            f'{loaded - started:.1f} с, факторизация '
+            f'{factorized - loaded:.1f} с, top-N '
+            f'{time.perf_counter() - factorized:.1f} с.'
+        )
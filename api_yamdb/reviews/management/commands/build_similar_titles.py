@@ -0,0 +1,18 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from reviews import services
+from reviews.models import SimilarTitle
+
+
+class Command(BaseCommand):
+    help = ('Пересчитывает таблицу похожих произведений целиком, в том '
+            'числе с учётом изменившихся оценок.')
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        services.rebuild_similar_titles()
+        self.stdout.write(
+            f'Похожих пар: {SimilarTitle.objects.count()}, '
+            f'{time.perf_counter() - started:.1f} с')
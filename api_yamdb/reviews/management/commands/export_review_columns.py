@@ -0,0 +1,48 @@
+import shutil
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db.models import F, Value
+from django.db.models.functions import Coalesce
+
+from reviews import columns
+from reviews.models import Review, Title
+
+
+class Command(BaseCommand):
+    help = ('Дописывает новые отзывы в колоночную выгрузку .npy '
+            '(см. reviews/columns.py).')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--output', default=settings.REVIEW_COLUMNS_DIR)
+        parser.add_argument('--chunk-size', type=int, default=200_000)
+        parser.add_argument(
+            '--full', action='store_true',
+            help='Выгрузить заново: учесть изменённые и удалённые отзывы.')
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        directory = options['output']
+        if options['full']:
+            shutil.rmtree(directory, ignore_errors=True)
+        exported, after = columns.exported_reviews(directory)
+        added = 0
+        while True:
+            rows = [
+                (pk, title_id, author_id, score, int(pub_date.timestamp()))
+                for pk, title_id, author_id, score, pub_date in
+                Review.objects.filter(id__gt=after).order_by('id')
+                .values_list(*columns.REVIEW_COLUMNS)[:options['chunk_size']]
+            ]
+            if not rows:
+                break
+            columns.append_reviews(directory, rows)
+            added += len(rows)
+            after = rows[-1][0]
+        columns.save_titles(directory, list(
+            Title.objects.order_by('id').values_list(
+                'id', Coalesce(F('category_id'), Value(-1)))))
+        self.stdout.write(
+            f'{directory}: выгружено отзывов {exported + added} '
+            f'(новых {added}), {time.perf_counter() - started:.1f} с')
@@ -0,0 +1,176 @@
+import random
+from contextlib import contextmanager
+from datetime import timedelta
+from itertools import islice
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from reviews import batch, services
+from reviews.models import (Category, Comment, Genre, GenreTitle, Review,
+                            Title, User)
+
+CATEGORIES = (('Фильм', 'movie'), ('Книга', 'book'), ('Музыка', 'music'))
+GENRES = (
+    ('Драма', 'drama'), ('Комедия', 'comedy'), ('Вестерн', 'western'),
+    ('Фэнтези', 'fantasy'), ('Фантастика', 'sci-fi'),
+    ('Детектив', 'detective'), ('Триллер', 'thriller'), ('Сказка', 'tale'),
+    ('Гонзо', 'gonzo'), ('Роман', 'roman'), ('Баллада', 'ballad'),
+    ('Рок-н-ролл', 'rock-n-roll'), ('Классика', 'classical'),
+    ('Рок', 'rock'), ('Шансон', 'chanson'),
+)
+WORDS = ('отличный', 'фильм', 'книга', 'сюжет', 'герой', 'финал', 'музыка',
+         'скучно', 'смешно', 'шедевр', 'рекомендую', 'пересматривал')
+BATCH_SIZE = 5000
+
+
+@contextmanager
+def explicit_pub_date(*models):
+    '''Позволяет задать `pub_date` вручную, отключив `auto_now_add`.'''
+    fields = [model._meta.get_field('pub_date') for model in models]
+    for field in fields:
+        field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field in fields:
+            field.auto_now_add = True
+
+
+def bulk_create(model, objs):
+    '''Вставляет объекты пачками, не материализуя весь генератор.'''
+    objs = iter(objs)
+    while True:
+        batch = list(islice(objs, BATCH_SIZE))
+        if not batch:
+            return
+        model.objects.bulk_create(batch)
+
+
+def next_id(model):
+    last = model.objects.order_by('-id').values_list('id', flat=True).first()
+    return (last or 0) + 1
+
+
+class Command(BaseCommand):
+    help = 'Генерирует синтетический каталог для нагрузочных замеров.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=2000)
+        parser.add_argument('--titles', type=int, default=10000)
+        parser.add_argument('--reviews-per-title', type=int, default=20)
+        parser.add_argument('--comments-per-review', type=int, default=2)
+        parser.add_argument('--days', type=int, default=3 * 365)
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        with transaction.atomic():
+            categories = [
+                Category.objects.get_or_create(
+                    slug=slug, defaults={'name': name})[0].id
+                for name, slug in CATEGORIES
+            ]
+            genres = [
+                Genre.objects.get_or_create(
+                    slug=slug, defaults={'name': name})[0].id
+                for name, slug in GENRES
+            ]
+            users = self.create_users(options['users'])
+            titles = self.create_titles(
+                rng, options['titles'], categories, genres)
+            reviews = self.create_reviews(
+                rng, titles, users, options['reviews_per_title'],
+                options['days'])
+            comments = self.create_comments(
+                rng, reviews, users, options['comments_per_review'])
+            services.update_review_stats(titles)
+            services.update_trending_scores(titles)
+            services.rebuild_review_rollups(services.review_day_totals())
+            batch.update_reviewer_stats()
+            services.update_weighted_ratings()
+            services.rebuild_similar_titles()
+        self.stdout.write(
+            f'Создано: пользователей {len(users)}, произведений '
+            f'{len(titles)}, отзывов {len(reviews)}, комментариев '
+            f'{comments}.'
+        )
+
+    def create_users(self, count):
+        start = next_id(User)
+        bulk_create(
+            User,
+            (User(id=user_id, username=f'bench_{user_id}',
+                  email=f'bench_{user_id}@yamdb.fake')
+             for user_id in range(start, start + count)),
+        )
+        return list(range(start, start + count))
+
+    def create_titles(self, rng, count, categories, genres):
+        start = next_id(Title)
+        ids = list(range(start, start + count))
+        bulk_create(
+            Title,
+            (Title(id=title_id, name=f'{rng.choice(WORDS).title()} '
+                                     f'{title_id}',
+                   year=rng.randint(1900, 2023),
+                   description=' '.join(rng.choices(WORDS, k=12)),
+                   category_id=rng.choice(categories))
+             for title_id in ids),
+        )
+        bulk_create(
+            GenreTitle,
+            (GenreTitle(title_id=title_id, genre_id=genre_id)
+             for title_id in ids
+             for genre_id in rng.sample(genres, rng.randint(1, 3))),
+        )
+        services.update_genre_masks(ids)
+        return ids
+
+    def create_reviews(self, rng, titles, users, per_title, days):
+        start = next_id(Review)
+        now = timezone.now()
+        reviews = []
+
+        def generate():
+            review_id = start
+            for title_id in titles:
+                for author_id in rng.sample(users, min(per_title,
+                                                       len(users))):
+                    pub_date = now - timedelta(
+                        seconds=rng.randint(0, days * 86400))
+                    reviews.append((review_id, pub_date))
+                    yield Review(
+                        id=review_id, title_id=title_id,
+                        author_id=author_id,
+                        text=' '.join(rng.choices(WORDS, k=40)),
+                        score=rng.randint(1, 10), pub_date=pub_date,
+                    )
+                    review_id += 1
+
+        with explicit_pub_date(Review):
+            bulk_create(Review, generate())
+        return reviews
+
+    def create_comments(self, rng, reviews, users, per_review):
+        now = timezone.now()
+
+        def generate():
+            for review_id, review_date in reviews:
+                for number in range(per_review):
+                    yield Comment(
+                        review_id=review_id, author_id=rng.choice(users),
+                        text=' '.join(rng.choices(WORDS, k=15)),
+                        pub_date=(review_date + (now - review_date) / 2
+                                  + timedelta(minutes=number)),
+                    )
+
+        with explicit_pub_date(Comment):
+            bulk_create(Comment, generate())
+        if reviews and per_review:
+            # bulk_create не вызывает сигналы: счётчик заполняется сразу.
+            Review.objects.filter(
+                id__gte=reviews[0][0], id__lte=reviews[-1][0]
+            ).update(comment_count=per_review)
+        return len(reviews) * per_review
@@ -0,0 +1,21 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from reviews import batch
+
+
+class Command(BaseCommand):
+    help = ('Пересчитывает статистику оценок пользователей и нормированный '
+            'рейтинг произведений (см. reviews/normalization.py).')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=200_000)
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        users, titles = batch.update_reviewer_stats(
+            options['chunk_size'])
+        self.stdout.write(
+            f'Пользователей {users}, произведений {titles}, '
+            f'{time.perf_counter() - started:.1f} с')
@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+
+from reviews import services
+
+
+class Command(BaseCommand):
+    help = ('Пересчитывает параметры взвешенного рейтинга, рейтинг всех '
+            'произведений и рейтинги категорий и жанров.')
+
+    def handle(self, *args, **options):
+        prior = services.update_weighted_ratings()
+        self.stdout.write(f'Параметры рейтинга: {prior}')
@@ -0,0 +1,48 @@
+import os
+import time
+
+from django.core.management.base import BaseCommand
+
+from reviews import services
+from reviews.models import Review, Title
+from reviews.parallel import id_ranges, run_chunks
+
+
+def counter_drift(kind, start, end):
+    if kind == 'titles':
+        return kind, services.title_counter_drift(start, end)
+    return kind, services.review_counter_drift(start, end)
+
+
+class Command(BaseCommand):
+    help = ('Сверяет счётчики отзывов произведений (Title.review_count) и '
+            'комментариев отзывов (Review.comment_count) с данными; с '
+            '--repair исправляет расхождения.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=os.cpu_count())
+        parser.add_argument('--chunk-size', type=int, default=20_000)
+        parser.add_argument('--repair', action='store_true')
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        chunk = options['chunk_size']
+        tasks = (
+            [('titles', *bounds) for bounds in id_ranges(Title, chunk)]
+            + [('reviews', *bounds) for bounds in id_ranges(Review, chunk)]
+        )
+        # Процессы только читают; исправляет счётчики основной процесс.
+        title_ids, review_ids = [], []
+        for kind, drift in run_chunks(counter_drift, tasks,
+                                      options['workers']):
+            if kind == 'titles':
+                title_ids.extend(drift)
+            else:
+                review_ids.extend(drift)
+        if options['repair']:
+            services.repair_counters(title_ids, review_ids)
+        self.stdout.write(
+            f'Расхождений: произведений {len(title_ids)}, '
+            f'отзывов {len(review_ids)}'
+            f'{", исправлено" if options["repair"] else ""}, '
+            f'{time.perf_counter() - started:.1f} с')
@@ -0,0 +1,43 @@
+# Generated by Django 3.2 on 2026-10-19 07:55
+
+from django.db import migrations, models
+
+GENRE_MASK_BITS = 63
+
+
+def fill_genre_masks(apps, schema_editor):
+    Genre = apps.get_model('reviews', 'Genre')
+    GenreTitle = apps.get_model('reviews', 'GenreTitle')
+    Title = apps.get_model('reviews', 'Title')
+    for bit, genre in enumerate(
+            Genre.objects.order_by('id')[:GENRE_MASK_BITS]):
+        genre.bit = bit
+        genre.save(update_fields=('bit',))
+    masks = {}
+    links = GenreTitle.objects.filter(
+        genre__bit__isnull=False).values_list('title_id', 'genre__bit')
+    for title_id, bit in links.iterator():
+        masks[title_id] = masks.get(title_id, 0) | 1 << bit
+    for title_id, mask in masks.items():
+        Title.objects.filter(id=title_id).update(genre_mask=mask)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reviews', '0003_review_comment_pub_date_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='genre',
+            name='bit',
+            field=models.PositiveSmallIntegerField(editable=False, null=True, unique=True, verbose_name='Бит в маске жанров'),
+        ),
+        migrations.AddField(
+            model_name='title',
+            name='genre_mask',
+            field=models.BigIntegerField(default=0, editable=False, verbose_name='Маска жанров'),
+        ),
+        migrations.RunPython(fill_genre_masks, migrations.RunPython.noop),
+    ]
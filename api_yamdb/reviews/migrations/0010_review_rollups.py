@@ -0,0 +1,47 @@
+# Generated by Django 3.2 on 2026-10-19 08:30
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reviews', '0009_trending_score'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReviewRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('period', models.CharField(choices=[('day', 'День'), ('month', 'Месяц')], max_length=5, verbose_name='Период')),
+                ('bucket', models.DateField(verbose_name='Начало периода')),
+                ('review_count', models.PositiveIntegerField(default=0, verbose_name='Количество отзывов')),
+                ('score_sum', models.PositiveIntegerField(default=0, verbose_name='Сумма оценок')),
+                ('category', models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='rollups', to='reviews.category', verbose_name='Категория')),
+                ('genre', models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='rollups', to='reviews.genre', verbose_name='Жанр')),
+                ('title', models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='rollups', to='reviews.title', verbose_name='Произведение')),
+            ],
+            options={
+                'verbose_name': 'Сводка отзывов',
+                'verbose_name_plural': 'Сводки отзывов',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='reviewrollup',
+            constraint=models.UniqueConstraint(condition=models.Q(title__isnull=False), fields=('title', 'period', 'bucket'), name='rollup_title_bucket_unique'),
+        ),
+        migrations.AddConstraint(
+            model_name='reviewrollup',
+            constraint=models.UniqueConstraint(condition=models.Q(category__isnull=False), fields=('category', 'period', 'bucket'), name='rollup_category_bucket_unique'),
+        ),
+        migrations.AddConstraint(
+            model_name='reviewrollup',
+            constraint=models.UniqueConstraint(condition=models.Q(genre__isnull=False), fields=('genre', 'period', 'bucket'), name='rollup_genre_bucket_unique'),
+        ),
+        migrations.AddConstraint(
+            model_name='reviewrollup',
+            constraint=models.CheckConstraint(check=models.Q(models.Q(('category__isnull', True), ('genre__isnull', True), ('title__isnull', False)), models.Q(('category__isnull', False), ('genre__isnull', True), ('title__isnull', True)), models.Q(('category__isnull', True), ('genre__isnull', False), ('title__isnull', True)), _connector='OR'), name='rollup_single_group'),
+        ),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 3.2 on 2026-10-19 08:37
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0001_initial'),
+        ('reviews', '0010_review_rollups'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReviewerStats',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='reviewer_stats', serialize=False, to='users.user', verbose_name='Пользователь')),
+                ('review_count', models.PositiveIntegerField(default=0, verbose_name='Количество отзывов')),
+                ('score_sum', models.PositiveIntegerField(default=0, verbose_name='Сумма оценок')),
+                ('score_square_sum', models.PositiveIntegerField(default=0, verbose_name='Сумма квадратов оценок')),
+                ('mean', models.FloatField(default=0, verbose_name='Средняя оценка')),
+                ('std', models.FloatField(default=0, verbose_name='Стандартное отклонение')),
+            ],
+            options={
+                'verbose_name': 'Статистика оценок пользователя',
+                'verbose_name_plural': 'Статистика оценок пользователей',
+            },
+        ),
+        migrations.AddField(
+            model_name='title',
+            name='normalized_rating',
+            field=models.FloatField(db_index=True, default=None, editable=False, null=True, verbose_name='Нормированный рейтинг'),
+        ),
+        migrations.AddField(
+            model_name='title',
+            name='normalized_score_sum',
+            field=models.FloatField(default=0, editable=False, verbose_name='Сумма нормированных оценок'),
+        ),
+    ]
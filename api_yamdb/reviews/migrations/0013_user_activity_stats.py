@@ -0,0 +1,23 @@
+# Generated by Django 3.2 on 2026-10-19 09:22
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reviews', '0012_comment_count'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='reviewerstats',
+            name='comment_count',
+            field=models.PositiveIntegerField(default=0, verbose_name='Количество комментариев'),
+        ),
+        migrations.AddField(
+            model_name='reviewerstats',
+            name='last_activity',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='Последний отзыв или комментарий'),
+        ),
+    ]
@@ -1,10 +1,15 @@
 from django.core.validators import (MaxValueValidator,
                                     MinValueValidator)
-from django.db import models
+from django.db import IntegrityError, models, transaction
 
 from reviews.validators import validate_year
 from users.models import User
 
+# Биты маски жанров: BigIntegerField знаковое, старший бит не используем.
+GENRE_MASK_BITS = 63
+SCORES = range(1, 11)
+SCORE_FIELDS = tuple(f'score_{score}' for score in SCORES)
+
 
 class Category(models.Model):
     '''Категории (типы) произведений: «Фильм», «Книга», «Музыка».'''
@@ -38,17 +43,79 @@ class Genre(models.Model):
         max_length=50,
         unique=True
     )
+    bit = models.PositiveSmallIntegerField(
+        verbose_name='Бит в маске жанров',
+        null=True,
+        unique=True,
+        editable=False
+    )
 
     def __str__(self):
         return self.name
 
+    @staticmethod
+    def free_bit():
+        used = set(Genre.objects.exclude(bit=None)
+                   .values_list('bit', flat=True))
+        return next(
+            (bit for bit in range(GENRE_MASK_BITS) if bit not in used), None)
+
+    def save(self, *args, **kwargs):
+        '''Новому жанру достаётся свободный бит маски. Если тот же бит
+        параллельно занял другой жанр, INSERT нарушает уникальность `bit`,
+        и бит выбирается заново. Когда свободных битов нет, жанр остаётся
+        без бита: фильтр по такому жанру идёт через JOIN с GenreTitle,
+        каталог в памяти отключается.'''
+        if self.bit is not None or not self._state.adding:
+            return super().save(*args, **kwargs)
+        for _ in range(GENRE_MASK_BITS):
+            self.bit = self.free_bit()
+            try:
+                with transaction.atomic():
+                    return super().save(*args, **kwargs)
+            except IntegrityError:
+                if (self.bit is None
+                        or not Genre.objects.filter(bit=self.bit).exists()):
+                    raise
+        self.bit = None
+        return super().save(*args, **kwargs)
+
+    @property
+    def mask(self):
+        return None if self.bit is None else 1 << self.bit
+
     class Meta:
         verbose_name = 'Жанр'
         verbose_name_plural = 'Жанры'
         ordering = ('name',)
 
 
-class Title(models.Model):
+class CounterFieldsMixin:
+    '''Сохранение существующей строки записывает только редактируемые
+    поля: счётчики (`editable=False`) меняются UPDATE с F() в
+    reviews.services, и загруженный раньше экземпляр не должен
+    перезаписывать их устаревшими значениями.'''
+
+    def save(self, *args, **kwargs):
+        if (not args and not self._state.adding
+                and not kwargs.get('force_insert')
+                and kwargs.get('update_fields') is None):
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if field.editable and not field.primary_key
+            ]
+        super().save(*args, **kwargs)
+
+
+def score_count_field(score):
+    return models.PositiveIntegerField(
+        verbose_name=f'Оценок {score}',
+        default=0,
+        editable=False
+    )
+
+
+class Title(CounterFieldsMixin, models.Model):
     name = models.CharField(
         verbose_name='Название',
         max_length=256
@@ -79,14 +146,80 @@ class Title(models.Model):
         null=True,
         default=None
     )
+    genre_mask = models.BigIntegerField(
+        verbose_name='Маска жанров',
+        default=0,
+        editable=False
+    )
+    review_count = models.PositiveIntegerField(
+        verbose_name='Количество отзывов',
+        default=0,
+        editable=False
+    )
+    score_sum = models.PositiveIntegerField(
+        verbose_name='Сумма оценок',
+        default=0,
+        editable=False
+    )
+    weighted_rating = models.FloatField(
+        verbose_name='Взвешенный рейтинг',
+        null=True,
+        default=None,
+        editable=False,
+        db_index=True
+    )
+    normalized_score_sum = models.FloatField(
+        verbose_name='Сумма нормированных оценок',
+        default=0,
+        editable=False
+    )
+    normalized_rating = models.FloatField(
+        verbose_name='Нормированный рейтинг',
+        null=True,
+        default=None,
+        editable=False,
+        db_index=True
+    )
+    trending_score = models.FloatField(
+        verbose_name='Популярность',
+        null=True,
+        default=None,
+        editable=False
+    )
+    # Гистограмма оценок: число отзывов с оценкой 1, 2, ..., 10.
+    score_1 = score_count_field(1)
+    score_2 = score_count_field(2)
+    score_3 = score_count_field(3)
+    score_4 = score_count_field(4)
+    score_5 = score_count_field(5)
+    score_6 = score_count_field(6)
+    score_7 = score_count_field(7)
+    score_8 = score_count_field(8)
+    score_9 = score_count_field(9)
+    score_10 = score_count_field(10)
 
     def __str__(self):
         return self.name
 
+    @property
+    def score_histogram(self):
+        return {str(score): getattr(self, field)
+                for score, field in zip(SCORES, SCORE_FIELDS)}
+
     class Meta:
         verbose_name = 'Произведение'
         verbose_name_plural = 'Произведения'
         ordering = ('name',)
+        indexes = [
+            models.Index(
+                fields=('category', '-weighted_rating', 'id'),
+                name='title_category_rating_idx'
+            ),
+            models.Index(
+                fields=('-trending_score', 'id'),
+                name='title_trending_idx'
+            ),
+        ]
 
 
 class GenreTitle(models.Model):
@@ -107,7 +240,7 @@ class GenreTitle(models.Model):
         verbose_name_plural = 'Произведения и жанры'
 
 
-class Review(models.Model):
+class Review(CounterFieldsMixin, models.Model):
     title = models.ForeignKey(
         Title,
         verbose_name='Произведение',
@@ -135,11 +268,26 @@ class Review(models.Model):
         auto_now_add=True,
         db_index=True
     )
+    comment_count = models.PositiveIntegerField(
+        verbose_name='Количество комментариев',
+        default=0,
+        editable=False
+    )
 
     class Meta:
         verbose_name = 'Отзыв'
         verbose_name_plural = 'Отзывы'
-        ordering = ('pub_date',)
+        ordering = ('pub_date', 'id')
+        indexes = [
+            models.Index(
+                fields=('title', 'pub_date', 'id'),
+                name='review_title_pub_date_idx'
+            ),
+            models.Index(
+                fields=('author', 'pub_date'),
+                name='review_author_pub_date_idx'
+            ),
+        ]
         constraints = [
             models.UniqueConstraint(
                 fields=('title', 'author'),
@@ -173,4 +321,296 @@ class Comment(models.Model):
     class Meta:
         verbose_name = 'Комментарий'
         verbose_name_plural = 'Комментарии'
-        ordering = ('pub_date',)
+        ordering = ('pub_date', 'id')
+        indexes = [
+            models.Index(
+                fields=('review', 'pub_date', 'id'),
+                name='comment_review_pub_date_idx'
+            ),
+            models.Index(
+                fields=('author', 'pub_date'),
+                name='comment_author_pub_date_idx'
+            ),
+        ]
+
+
+class SimilarTitle(models.Model):
+    title = models.ForeignKey(
+        Title,
+        verbose_name='Произведение',
+        on_delete=models.CASCADE,
+        related_name='similar_links'
+    )
+    similar = models.ForeignKey(
+        Title,
+        verbose_name='Похожее произведение',
+        on_delete=models.CASCADE,
+        related_name='similar_to'
+    )
+    score = models.FloatField(
+        verbose_name='Сходство'
+    )
+
+    def __str__(self):
+        return f'{self.title} ~ {self.similar}: {self.score:.3f}'
+
+    class Meta:
+        verbose_name = 'Похожее произведение'
+        verbose_name_plural = 'Похожие произведения'
+        indexes = [
+            models.Index(
+                fields=('title', '-score'),
+                name='similar_title_score_idx'
+            ),
+        ]
+        constraints = [
+            models.UniqueConstraint(
+                fields=('title', 'similar'),
+                name='unique_similar_title'
+            ),
+        ]
+
+
+class Recommendation(models.Model):
+    user = models.ForeignKey(
+        User,
+        verbose_name='Пользователь',
+        on_delete=models.CASCADE,
+        related_name='recommendations'
+    )
+    title = models.ForeignKey(
+        Title,
+        verbose_name='Произведение',
+        on_delete=models.CASCADE,
+        related_name='recommended_to'
+    )
+    score = models.FloatField(
+        verbose_name='Прогноз оценки'
+    )
+
+    def __str__(self):
+        return f'{self.user}: {self.title} ({self.score:.1f})'
+
+    class Meta:
+        verbose_name = 'Рекомендация'
+        verbose_name_plural = 'Рекомендации'
+        indexes = [
+            models.Index(
+                fields=('user', '-score'),
+                name='recommendation_user_score_idx'
+            ),
+        ]
+        constraints = [
+            models.UniqueConstraint(
+                fields=('user', 'title'),
+                name='unique_recommendation'
+            ),
+        ]
+
+
+class ReviewerStats(models.Model):
+    '''Число, сумма и сумма квадратов оценок пользователя, средняя оценка
+    и стандартное отклонение - для нормирования его оценок, а также число
+    его комментариев и время последней публикации - для профиля.'''
+    user = models.OneToOneField(
+        User,
+        verbose_name='Пользователь',
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='reviewer_stats'
+    )
+    review_count = models.PositiveIntegerField(
+        verbose_name='Количество отзывов',
+        default=0
+    )
+    score_sum = models.PositiveIntegerField(
+        verbose_name='Сумма оценок',
+        default=0
+    )
+    score_square_sum = models.PositiveIntegerField(
+        verbose_name='Сумма квадратов оценок',
+        default=0
+    )
+    mean = models.FloatField(
+        verbose_name='Средняя оценка',
+        default=0
+    )
+    std = models.FloatField(
+        verbose_name='Стандартное отклонение',
+        default=0
+    )
+    comment_count = models.PositiveIntegerField(
+        verbose_name='Количество комментариев',
+        default=0
+    )
+    last_activity = models.DateTimeField(
+        verbose_name='Последний отзыв или комментарий',
+        null=True,
+        blank=True
+    )
+
+    def __str__(self):
+        return f'{self.user}: {self.mean:.2f} ± {self.std:.2f}'
+
+    class Meta:
+        verbose_name = 'Статистика оценок пользователя'
+        verbose_name_plural = 'Статистика оценок пользователей'
+
+
+class RatingPrior(models.Model):
+    '''Априорные параметры взвешенного рейтинга: средняя оценка по всем
+    отзывам и минимальное число отзывов. Хранится одна запись.'''
+    mean = models.FloatField(
+        verbose_name='Средняя оценка'
+    )
+    min_votes = models.FloatField(
+        verbose_name='Минимальное число отзывов'
+    )
+    updated = models.DateTimeField(
+        verbose_name='Дата расчёта',
+        auto_now=True
+    )
+
+    def __str__(self):
+        return f'C = {self.mean:.3f}, m = {self.min_votes:g}'
+
+    class Meta:
+        verbose_name = 'Параметры рейтинга'
+        verbose_name_plural = 'Параметры рейтинга'
+
+
+class LeaderboardEntry(models.Model):
+    '''Место произведения в рейтинге категории или жанра.'''
+    category = models.ForeignKey(
+        Category,
+        verbose_name='Категория',
+        on_delete=models.CASCADE,
+        null=True,
+        related_name='leaderboard'
+    )
+    genre = models.ForeignKey(
+        Genre,
+        verbose_name='Жанр',
+        on_delete=models.CASCADE,
+        null=True,
+        related_name='leaderboard'
+    )
+    title = models.ForeignKey(
+        Title,
+        verbose_name='Произведение',
+        on_delete=models.CASCADE,
+        related_name='leaderboard_entries'
+    )
+    position = models.PositiveSmallIntegerField(
+        verbose_name='Место'
+    )
+
+    def __str__(self):
+        return f'{self.category or self.genre}: {self.position}. {self.title}'
+
+    class Meta:
+        verbose_name = 'Место в рейтинге'
+        verbose_name_plural = 'Места в рейтинге'
+        indexes = [
+            models.Index(
+                fields=('category', 'position'),
+                name='leaderboard_category_idx'
+            ),
+            models.Index(
+                fields=('genre', 'position'),
+                name='leaderboard_genre_idx'
+            ),
+        ]
+        constraints = [
+            models.CheckConstraint(
+                check=(
+                    models.Q(category__isnull=True, genre__isnull=False)
+                    | models.Q(category__isnull=False, genre__isnull=True)
+                ),
+                name='leaderboard_category_xor_genre'
+            ),
+        ]
+
+
+class ReviewRollup(models.Model):
+    '''Число отзывов и сумма их оценок за день или месяц публикации
+    по произведению, категории или жанру.'''
+    DAY = 'day'
+    MONTH = 'month'
+    PERIODS = (
+        (DAY, 'День'),
+        (MONTH, 'Месяц'),
+    )
+    period = models.CharField(
+        verbose_name='Период',
+        max_length=5,
+        choices=PERIODS
+    )
+    bucket = models.DateField(
+        verbose_name='Начало периода'
+    )
+    title = models.ForeignKey(
+        Title,
+        verbose_name='Произведение',
+        on_delete=models.CASCADE,
+        null=True,
+        related_name='rollups'
+    )
+    category = models.ForeignKey(
+        Category,
+        verbose_name='Категория',
+        on_delete=models.CASCADE,
+        null=True,
+        related_name='rollups'
+    )
+    genre = models.ForeignKey(
+        Genre,
+        verbose_name='Жанр',
+        on_delete=models.CASCADE,
+        null=True,
+        related_name='rollups'
+    )
+    review_count = models.PositiveIntegerField(
+        verbose_name='Количество отзывов',
+        default=0
+    )
+    score_sum = models.PositiveIntegerField(
+        verbose_name='Сумма оценок',
+        default=0
+    )
+
+    def __str__(self):
+        return (f'{self.title or self.category or self.genre}, '
+                f'{self.bucket}: {self.review_count}')
+
+    class Meta:
+        verbose_name = 'Сводка отзывов'
+        verbose_name_plural = 'Сводки отзывов'
+        constraints = [
+            models.UniqueConstraint(
+                fields=('title', 'period', 'bucket'),
+                condition=models.Q(title__isnull=False),
+                name='rollup_title_bucket_unique'
+            ),
+            models.UniqueConstraint(
+                fields=('category', 'period', 'bucket'),
+                condition=models.Q(category__isnull=False),
+                name='rollup_category_bucket_unique'
+            ),
+            models.UniqueConstraint(
+                fields=('genre', 'period', 'bucket'),
+                condition=models.Q(genre__isnull=False),
+                name='rollup_genre_bucket_unique'
+            ),
+            models.CheckConstraint(
+                check=(
+                    models.Q(title__isnull=False, category__isnull=True,
+                             genre__isnull=True)
+                    | models.Q(title__isnull=True, category__isnull=False,
+                               genre__isnull=True)
+                    | models.Q(title__isnull=True, category__isnull=True,
+                               genre__isnull=False)
+                ),
+                name='rollup_single_group'
+            ),
+        ]
@@ -0,0 +1,58 @@
+'''Оценки, нормированные по пользователю (z-оценки).
+
+Модуль не зависит от Django: массивы отзывов загружает команда
+`update_reviewer_stats` (reviews/batch.py).
+
+* Для каждого пользователя считаются число, сумма и сумма квадратов его
+  оценок, средняя и стандартное отклонение (по генеральной совокупности).
+* Нормированная оценка отзыва - (оценка - средняя) / отклонение; у
+  пользователя с одинаковыми оценками (в том числе с единственным
+  отзывом) она равна нулю.
+* Нормированный рейтинг произведения - средняя нормированных оценок его
+  отзывов.
+
+Дисперсия считается в целых числах как (n * Σx² - (Σx)²) / n², поэтому
+одинаковые оценки дают ровно нулевое отклонение - так же, как в SQL при
+обновлении статистики по одному отзыву (см. services).
+'''
+import numpy as np
+
+
+def deviation(counts, sums, squares):
+    '''Стандартное отклонение по числу, сумме и сумме квадратов оценок.'''
+    counts = np.asarray(counts, dtype=np.int64)
+    sums = np.asarray(sums, dtype=np.int64)
+    squares = np.asarray(squares, dtype=np.int64)
+    spread = np.maximum(counts * squares - sums * sums, 0)
+    return np.sqrt(spread) / np.maximum(counts, 1)
+
+
+def user_statistics(users, scores):
+    '''Статистика оценок по пользователям: id пользователей, индекс
+    пользователя каждого отзыва, число, сумма и сумма квадратов оценок,
+    средняя и стандартное отклонение.'''
+    user_ids, rows = np.unique(users, return_inverse=True)
+    scores = np.asarray(scores, dtype=np.int64)
+    counts = np.bincount(rows, minlength=len(user_ids))
+    sums = np.bincount(rows, weights=scores,
+                       minlength=len(user_ids)).astype(np.int64)
+    squares = np.bincount(rows, weights=scores * scores,
+                          minlength=len(user_ids)).astype(np.int64)
+    means = sums / np.maximum(counts, 1)
+    return (user_ids, rows, counts, sums, squares, means,
+            deviation(counts, sums, squares))
+
+
+def normalized_scores(scores, means, stds):
+    '''Нормированные оценки отзывов по средней и отклонению их авторов.'''
+    result = np.zeros(len(scores))
+    varied = stds > 0
+    result[varied] = (scores[varied] - means[varied]) / stds[varied]
+    return result
+
+
+def title_sums(titles, values):
+    '''id произведений, число отзывов и сумма `values` по произведениям.'''
+    title_ids, columns = np.unique(titles, return_inverse=True)
+    return (title_ids, np.bincount(columns, minlength=len(title_ids)),
+            np.bincount(columns, weights=values, minlength=len(title_ids)))
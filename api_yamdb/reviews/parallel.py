@@ -0,0 +1,36 @@
+'''Команды, обрабатывающие таблицу по диапазонам id в нескольких
+процессах.
+
+Рабочие процессы создаются через fork и открывают собственные соединения
+с базой данных: перед запуском пула соединения родителя закрываются,
+иначе потомки унаследуют его сокеты и состояние транзакции.
+'''
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+from django.db import connections
+from django.db.models import Max, Min
+
+
+def id_ranges(model, chunk_size):
+    '''Полуоткрытые диапазоны [start, end) по `chunk_size` id, покрывающие
+    все строки `model`.'''
+    bounds = model.objects.aggregate(Min('id'), Max('id'))
+    first, last = bounds['id__min'] or 0, bounds['id__max'] or -1
+    return [(start, start + chunk_size)
+            for start in range(first, last + 1, chunk_size)]
+
+
+def run_chunks(func, tasks, workers):
+    '''Результаты `func(*task)` для каждого задания в порядке `tasks`:
+    в текущем процессе, если процесс один или задание одно, иначе в
+    пуле из `workers` процессов.'''
+    tasks = list(tasks)
+    if workers <= 1 or len(tasks) <= 1:
+        return [func(*task) for task in tasks]
+    connections.close_all()
+    with ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=multiprocessing.get_context('fork')
+    ) as executor:
+        return list(executor.map(func, *zip(*tasks)))
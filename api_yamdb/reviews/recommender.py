@@ -0,0 +1,157 @@
+'''Рекомендации произведений по матрице оценок «пользователь × произведение».
+
+Модуль не зависит от Django: данные загружает и сохраняет команда
+`build_recommendations`, а рабочие процессы импортируют только NumPy.
+
+* Матрица хранится в координатном виде: индексы пользователя и
+  произведения (int32) и оценка (float32), отсортированные по
+  пользователю, плюс перестановка по произведению (int32) - 16 байт на
+  отзыв.
+* Оценки центрируются по среднему пользователя, и для матрицы строится
+  приближение ранга `rank` рандомизированным SVD (Halko, Martinsson,
+  Tropp). Произведения матрицы на плотные блоки считаются пачками по
+  `chunk_size` отзывов через `np.add.reduceat`, поэтому временная память
+  ограничена размером пачки.
+* Прогноз оценки - среднее пользователя плюс скалярное произведение
+  факторов. Top-N непросмотренных произведений выбирается по блокам
+  пользователей; блоки считаются параллельно, рабочие процессы открывают
+  факторы из .npy-файлов через `mmap_mode='r'` без копирования.
+'''
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+# Ячеек матрицы прогнозов в одном блоке пользователей (float32, ~ 16 МБ).
+BLOCK_CELLS = 4_000_000
+# Дополнительные столбцы и степенные итерации рандомизированного SVD.
+OVERSAMPLING = 8
+POWER_ITERATIONS = 2
+ARRAYS = ('means', 'user_factors', 'title_factors', 'indptr', 'columns')
+
+
+class RatingMatrix:
+    '''Разреженная матрица оценок, центрированных по пользователю.'''
+
+    def __init__(self, users, titles, scores, chunk_size):
+        self.user_ids, rows = np.unique(users, return_inverse=True)
+        self.title_ids, columns = np.unique(titles, return_inverse=True)
+        order = np.argsort(rows, kind='stable')
+        self.rows = rows[order].astype(np.int32)
+        self.columns = columns[order].astype(np.int32)
+        scores = np.asarray(scores, dtype=np.float32)[order]
+        del order
+        counts = np.bincount(self.rows, minlength=len(self.user_ids))
+        self.indptr = np.concatenate(([0], np.cumsum(counts)))
+        self.means = (np.bincount(self.rows, weights=scores,
+                                  minlength=len(self.user_ids))
+                      / np.maximum(counts, 1)).astype(np.float32)
+        self.values = scores - self.means[self.rows]
+        self.by_title = np.argsort(self.columns, kind='stable').astype(
+            np.int32)
+        self.chunk_size = chunk_size
+
+    @property
+    def shape(self):
+        return len(self.user_ids), len(self.title_ids)
+
+    def dot(self, dense):
+        '''Матрица, умноженная на `dense` (произведения × k).'''
+        return self.multiply(self.rows, self.columns, dense, self.shape[0])
+
+    def rdot(self, dense):
+        '''Транспонированная матрица, умноженная на `dense`.'''
+        return self.multiply(self.columns, self.rows, dense, self.shape[1],
+                             self.by_title)
+
+    def multiply(self, rows, columns, dense, size, order=None):
+        # Пачка упорядочена по `rows` - суммы по строкам через reduceat.
+        result = np.zeros((size, dense.shape[1]))
+        for start in range(0, len(self.values), self.chunk_size):
+            chunk = slice(start, start + self.chunk_size)
+            if order is not None:
+                chunk = order[chunk]
+            block = dense[columns[chunk]] * self.values[chunk, None]
+            present, starts = np.unique(rows[chunk], return_index=True)
+            result[present] += np.add.reduceat(block, starts)
+        return result
+
+    def factorize(self, rank, seed):
+        '''Факторы пользователей и произведений ранга `rank`.'''
+        rng = np.random.default_rng(seed)
+        width = min(rank + OVERSAMPLING, *self.shape)
+        basis = orthonormal(self.dot(
+            rng.standard_normal((self.shape[1], width))))
+        for _ in range(POWER_ITERATIONS):
+            basis = orthonormal(self.dot(orthonormal(self.rdot(basis))))
+        small = self.rdot(basis).T
+        left, singular, right = np.linalg.svd(small, full_matrices=False)
+        rank = min(rank, len(singular))
+        user_factors = (basis @ left[:, :rank]) * singular[:rank]
+        return (user_factors.astype(np.float32),
+                right[:rank].T.astype(np.float32))
+
+    def save(self, directory, rank, seed):
+        user_factors, title_factors = self.factorize(rank, seed)
+        arrays = dict(zip(ARRAYS, (self.means, user_factors, title_factors,
+                                   self.indptr, self.columns)))
+        for name, array in arrays.items():
+            np.save(os.path.join(directory, f'{name}.npy'), array)
+
+
+def orthonormal(matrix):
+    return np.linalg.qr(matrix)[0]
+
+
+_arrays = {}
+
+
+def load_arrays(directory):
+    if directory not in _arrays:
+        _arrays.clear()
+        _arrays[directory] = {
+            name: np.load(os.path.join(directory, f'{name}.npy'),
+                          mmap_mode='r')
+            for name in ARRAYS
+        }
+    return _arrays[directory]
+
+
+def top_titles(directory, start, end, top_n):
+    '''Top-N непросмотренных произведений для пользователей [start, end):
+    массивы индексов пользователей, произведений и прогнозов.'''
+    arrays = load_arrays(directory)
+    predicted = (np.asarray(arrays['user_factors'][start:end])
+                 @ np.asarray(arrays['title_factors']).T)
+    predicted += arrays['means'][start:end, None]
+    indptr = arrays['indptr']
+    counts = np.diff(indptr[start:end + 1])
+    predicted[np.repeat(np.arange(end - start), counts),
+              arrays['columns'][indptr[start]:indptr[end]]] = -np.inf
+    top_n = min(top_n, predicted.shape[1])
+    best = np.argpartition(-predicted, top_n - 1, axis=1)[:, :top_n]
+    scores = np.take_along_axis(predicted, best, axis=1)
+    order = np.argsort(-scores, axis=1, kind='stable')
+    best = np.take_along_axis(best, order, axis=1)
+    scores = np.take_along_axis(scores, order, axis=1)
+    users = np.repeat(np.arange(start, end), top_n).reshape(best.shape)
+    # -inf - просмотренные, если непросмотренных меньше top_n.
+    available = np.isfinite(scores)
+    return users[available], best[available], scores[available]
+
+
+def recommend(directory, users, titles, top_n, workers):
+    '''Итератор по блокам рекомендаций (индексы пользователей,
+    произведений, прогнозы) в порядке пользователей.'''
+    block = max(1, BLOCK_CELLS // max(titles, 1))
+    blocks = [(directory, start, min(start + block, users), top_n)
+              for start in range(0, users, block)]
+    if workers <= 1 or len(blocks) <= 1:
+        try:
+            for args in blocks:
+                yield top_titles(*args)
+        finally:
+            _arrays.clear()
+        return
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        yield from executor.map(top_titles, *zip(*blocks))
@@ -0,0 +1,907 @@
+import bisect
+import heapq
+import math
+from collections import defaultdict
+from datetime import datetime
+from functools import reduce
+from operator import or_
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import (Avg, Case, Count, ExpressionWrapper, F,
+                              FloatField, Max, Min, OuterRef, Q, Subquery,
+                              Sum, Value, When)
+from django.db.models.functions import (Abs, Coalesce, Exp, Greatest, Ln,
+                                        Sqrt)
+from django.utils import timezone
+
+from reviews.models import (SCORE_FIELDS, SCORES, Category, Comment, Genre,
+                            GenreTitle, LeaderboardEntry, RatingPrior,
+                            Review, ReviewerStats, ReviewRollup,
+                            SimilarTitle, Title)
+
+CHUNK_SIZE = 2000
+# Наибольшая разница оценок отзывов (1-10).
+SCORE_RANGE = 9
+# Строк сводок в одном условии UPDATE (глубина выражения в SQLite).
+ROLLUP_BATCH = 100
+
+
+class PendingCall:
+    '''Вызов `func(*id_lists)`, отложенный до фиксации транзакции.'''
+
+    def __init__(self, func, size):
+        self.func = func
+        self.id_sets = [set() for _ in range(size)]
+
+    def update(self, id_lists):
+        for ids, added in zip(self.id_sets, id_lists):
+            ids.update(added)
+
+    def __call__(self):
+        self.func(*map(sorted, self.id_sets))
+
+
+def on_commit_ids(func, *id_lists):
+    '''`transaction.on_commit(lambda: func(*id_lists))`, но не больше
+    одного вызова `func` на транзакцию: id из повторных запросов (по отзыву
+    при каскадном удалении, по связи при изменении жанров) объединяются
+    по позициям списков. Вне транзакции `func` вызывается сразу.'''
+    connection = transaction.get_connection()
+    if connection.in_atomic_block:
+        for _, callback in connection.run_on_commit:
+            if isinstance(callback, PendingCall) and callback.func is func:
+                callback.update(id_lists)
+                return
+    pending = PendingCall(func, len(id_lists))
+    pending.update(id_lists)
+    transaction.on_commit(pending)
+
+
+def update_genre_masks(title_ids=None):
+    '''Пересчитывает `Title.genre_mask` по связям `GenreTitle`.
+
+    Без `title_ids` пересчитывает все произведения пачками.
+    '''
+    if title_ids is None:
+        all_ids = list(Title.objects.order_by('id')
+                       .values_list('id', flat=True))
+        for start in range(0, len(all_ids), CHUNK_SIZE):
+            update_genre_masks(all_ids[start:start + CHUNK_SIZE])
+        return
+    masks = dict.fromkeys(title_ids, 0)
+    links = GenreTitle.objects.filter(
+        title_id__in=masks, genre__bit__isnull=False
+    ).values_list('title_id', 'genre__bit')
+    for title_id, bit in links:
+        masks[title_id] |= 1 << bit
+    by_mask = defaultdict(list)
+    for title_id, mask in masks.items():
+        by_mask[mask].append(title_id)
+    for mask, ids in by_mask.items():
+        Title.objects.filter(id__in=ids).update(genre_mask=mask)
+
+
+def popcount(value):
+    return bin(value).count('1')
+
+
+def jaccard(mask, other):
+    '''Коэффициент Жаккара для множеств жанров, заданных масками.'''
+    union = mask | other
+    return popcount(mask & other) / popcount(union) if union else 0.0
+
+
+def title_vectors(queryset):
+    '''Строки (id, маска жанров, средняя оценка) для расчёта сходства.'''
+    return queryset.order_by().annotate(
+        average=average_score()
+    ).values_list('id', 'genre_mask', 'average')
+
+
+def with_genres(queryset, mask, field='genre_mask'):
+    '''Записи, у которых есть хотя бы один жанр из маски.'''
+    return queryset.alias(
+        genre_match=F(field).bitand(mask)
+    ).filter(genre_match__gt=0)
+
+
+class SimilarityIndex:
+    '''Кандидаты в похожие произведения, сгруппированные по маске жанров.
+
+    Матрица «произведение × жанр» сворачивается до различных масок:
+    коэффициент Жаккара считается один раз на пару масок, а внутри группы
+    с одной маской кандидаты упорядочены по средней оценке, и ближайшие по
+    оценке находятся бинарным поиском.
+    '''
+    # Сходство оценок, если у одного из произведений нет отзывов.
+    neutral = 0.5
+
+    def __init__(self, rows):
+        self.top_k = settings.SIMILAR_TITLES['TOP_K']
+        self.weight = settings.SIMILAR_TITLES['RATING_WEIGHT']
+        self.rows = [row for row in rows if row[1]]
+        self.rated = defaultdict(list)
+        self.unrated = defaultdict(list)
+        for title_id, mask, average in self.rows:
+            if average is None:
+                self.unrated[mask].append(title_id)
+            else:
+                self.rated[mask].append((average, title_id))
+        for group in (*self.rated.values(), *self.unrated.values()):
+            group.sort()
+        self.masks = set(self.rated) | set(self.unrated)
+        self.overlaps = {}
+
+    def overlap(self, mask):
+        '''Маски с общими жанрами и коэффициент Жаккара для них
+        по убыванию коэффициента.'''
+        if mask not in self.overlaps:
+            self.overlaps[mask] = sorted(
+                ((other, jaccard(mask, other))
+                 for other in self.masks if mask & other),
+                key=lambda item: -item[1]
+            )
+        return self.overlaps[mask]
+
+    def rating_similarity(self, average, other):
+        if average is None or other is None:
+            return self.neutral
+        return 1 - abs(average - other) / SCORE_RANGE
+
+    def score(self, mask, average, other_mask, other_average):
+        return ((1 - self.weight) * jaccard(mask, other_mask)
+                + self.weight * self.rating_similarity(average,
+                                                       other_average))
+
+    def neighbours(self, title_id, mask, average):
+        '''Top-K похожих: список (сходство, id) по убыванию сходства.'''
+        # С запасом на само произведение в его группе.
+        limit = self.top_k + 1
+        best = []
+        for other_mask, similarity in self.overlap(mask):
+            base = (1 - self.weight) * similarity
+            if len(best) == self.top_k and base + self.weight < best[0][0]:
+                # В остальных группах сходство не выше, даже при
+                # совпадении оценок.
+                break
+            candidates = [
+                (base + self.weight * self.rating_similarity(
+                    average, other_average), other_id)
+                for other_average, other_id in self.nearest(
+                    self.rated.get(other_mask, ()), average, limit)
+            ]
+            candidates.extend(
+                (base + self.weight * self.neutral, other_id)
+                for other_id in self.unrated.get(other_mask, ())[:limit]
+            )
+            for score, other_id in candidates:
+                if other_id == title_id:
+                    continue
+                # Среди равных по сходству выше произведение с меньшим id.
+                item = (score, -other_id)
+                if len(best) < self.top_k:
+                    heapq.heappush(best, item)
+                elif item > best[0]:
+                    heapq.heapreplace(best, item)
+        return [(score, -other_id)
+                for score, other_id in sorted(best, reverse=True)]
+
+    @staticmethod
+    def nearest(group, average, limit):
+        '''`limit` записей группы с оценкой, ближайшей к `average`.'''
+        if average is None:
+            return group[:limit]
+        right = bisect.bisect_left(group, (average,))
+        left = right - 1
+        picked = []
+        while len(picked) < limit and (left >= 0 or right < len(group)):
+            if right >= len(group) or (
+                    left >= 0
+                    and average - group[left][0] <= group[right][0] - average):
+                picked.append(group[left])
+                left -= 1
+            else:
+                picked.append(group[right])
+                right += 1
+        return picked
+
+
+def rebuild_similar_titles():
+    '''Пересчитывает таблицу похожих произведений целиком.'''
+    index = SimilarityIndex(title_vectors(Title.objects.all()))
+    with transaction.atomic():
+        SimilarTitle.objects.all().delete()
+        batch = []
+        for title_id, mask, average in index.rows:
+            batch.extend(
+                SimilarTitle(title_id=title_id, similar_id=other_id,
+                             score=score)
+                for score, other_id in index.neighbours(title_id, mask,
+                                                        average)
+            )
+            if len(batch) >= CHUNK_SIZE:
+                SimilarTitle.objects.bulk_create(batch)
+                batch = []
+        SimilarTitle.objects.bulk_create(batch)
+
+
+def similarity_offers(index, changed, skip):
+    '''Изменённые произведения, которые проходят в чужие списки похожих:
+    id произведения -> [(сходство, id изменённого)].'''
+    changed_mask = reduce(or_, (row[1] for row in changed), 0)
+    thresholds = {
+        title_id: (worst, count)
+        for title_id, worst, count in with_genres(
+            SimilarTitle.objects.all(), changed_mask, 'title__genre_mask'
+        ).values_list('title_id').annotate(Min('score'), Count('id'))
+    }
+    offers = defaultdict(list)
+    for other_id, other_mask, other_average in index.rows:
+        if other_id in skip:
+            continue
+        worst, count = thresholds.get(other_id, (None, 0))
+        for title_id, title_mask, average in changed:
+            if not other_mask & title_mask:
+                continue
+            score = index.score(other_mask, other_average, title_mask,
+                                average)
+            if count < index.top_k or score > worst:
+                offers[other_id].append((score, title_id))
+    return offers
+
+
+def update_similar_titles(title_ids):
+    '''Обновляет похожие произведения после изменения жанров `title_ids`.
+
+    Списки изменённых произведений и тех, из чьих списков они выпали,
+    пересчитываются целиком. В списки остальных произведений с общими
+    жанрами изменённые попадают, если сходство выше худшего в списке.
+    Сигналы вызывают её после фиксации транзакции, один раз на все
+    изменённые в ней произведения; id удалённых пропускаются.
+    '''
+    title_ids = set(title_ids)
+    recompute = title_ids | set(
+        SimilarTitle.objects.filter(similar_id__in=title_ids)
+        .values_list('title_id', flat=True))
+    SimilarTitle.objects.filter(
+        Q(title_id__in=recompute) | Q(similar_id__in=title_ids)).delete()
+    targets = list(title_vectors(Title.objects.filter(id__in=recompute)))
+    mask = reduce(or_, (row[1] for row in targets), 0)
+    if not mask:
+        return
+    index = SimilarityIndex(title_vectors(
+        with_genres(Title.objects.all(), mask)))
+    created = [
+        SimilarTitle(title_id=title_id, similar_id=other_id, score=score)
+        for title_id, title_mask, average in targets
+        for score, other_id in index.neighbours(title_id, title_mask,
+                                                average)
+    ]
+
+    changed = [row for row in targets if row[0] in title_ids and row[1]]
+    offers = similarity_offers(index, changed, recompute)
+    obsolete = []
+    offered = list(offers)
+    for start in range(0, len(offered), CHUNK_SIZE):
+        chunk = offered[start:start + CHUNK_SIZE]
+        current = defaultdict(list)
+        for link in SimilarTitle.objects.filter(title_id__in=chunk):
+            current[link.title_id].append((link.score, link.similar_id,
+                                           link.pk))
+        for other_id in chunk:
+            ranked = sorted(current[other_id] + offers[other_id],
+                            key=lambda item: (-item[0], item[1]))
+            # У существующих строк третий элемент - pk.
+            obsolete.extend(item[2] for item in ranked[index.top_k:]
+                            if len(item) == 3)
+            created.extend(
+                SimilarTitle(title_id=other_id, similar_id=similar_id,
+                             score=score)
+                for score, similar_id, *pk in ranked[:index.top_k] if not pk
+            )
+    for start in range(0, len(obsolete), CHUNK_SIZE):
+        SimilarTitle.objects.filter(
+            pk__in=obsolete[start:start + CHUNK_SIZE]).delete()
+    SimilarTitle.objects.bulk_create(created, batch_size=CHUNK_SIZE)
+
+
+def update_review_stats(title_ids=None):
+    '''Пересчитывает по отзывам гистограмму оценок, `review_count` и
+    `score_sum` произведений.'''
+    if title_ids is None:
+        all_ids = list(Title.objects.order_by('id')
+                       .values_list('id', flat=True))
+        for start in range(0, len(all_ids), CHUNK_SIZE):
+            update_review_stats(all_ids[start:start + CHUNK_SIZE])
+        return
+    histograms = {title_id: dict.fromkeys(SCORES, 0)
+                  for title_id in title_ids}
+    for title_id, score, count in Review.objects.filter(
+            title_id__in=histograms
+    ).order_by().values_list('title_id', 'score').annotate(Count('id')):
+        histograms[title_id][score] = count
+    titles = []
+    for title_id, histogram in histograms.items():
+        title = Title(id=title_id)
+        for score, field in zip(SCORES, SCORE_FIELDS):
+            setattr(title, field, histogram[score])
+        title.review_count = sum(histogram.values())
+        title.score_sum = sum(score * count
+                              for score, count in histogram.items())
+        titles.append(title)
+    Title.objects.bulk_update(
+        titles, ('review_count', 'score_sum', *SCORE_FIELDS),
+        batch_size=CHUNK_SIZE // 4)
+
+
+def review_comments_changed(review_id, delta):
+    '''Учитывает `delta` добавленных (или удалённых, если delta < 0)
+    комментариев в счётчике отзыва.'''
+    Review.objects.filter(pk=review_id).update(
+        comment_count=F('comment_count') + delta)
+
+
+def title_counter_drift(start, end):
+    '''id произведений из [start, end), у которых `review_count` не
+    совпадает с числом отзывов.'''
+    return list(Title.objects.filter(id__gte=start, id__lt=end).annotate(
+        actual=Count('reviews')
+    ).exclude(review_count=F('actual')).order_by().values_list(
+        'id', flat=True))
+
+
+def review_counter_drift(start, end):
+    '''id отзывов из [start, end), у которых `comment_count` не совпадает
+    с числом комментариев.'''
+    return list(Review.objects.filter(id__gte=start, id__lt=end).annotate(
+        actual=Count('comments')
+    ).exclude(comment_count=F('actual')).order_by().values_list(
+        'id', flat=True))
+
+
+def counted(queryset, owner, aggregate):
+    '''Коррелированный подзапрос: `aggregate` по строкам `queryset`,
+    отобранным по `owner=OuterRef('pk')`; 0, если строк нет.'''
+    return Coalesce(Subquery(
+        queryset.filter(**{owner: OuterRef('pk')}).order_by().values(owner)
+        .annotate(value=aggregate).values('value')
+    ), Value(0))
+
+
+def repair_counters(title_ids=(), review_ids=()):
+    '''Исправляет счётчики, найденные `title_counter_drift` и
+    `review_counter_drift` (и заполняет их в `backfill_review_stats`).
+    Значения считаются в том же UPDATE коррелированными подзапросами,
+    поэтому отзывы и комментарии, записанные после сверки, не теряются.
+    У произведений пересчитываются гистограмма, число отзывов, сумма
+    оценок и взвешенный рейтинг.'''
+    title_ids, review_ids = list(title_ids), list(review_ids)
+    reviews = Review.objects.all()
+    with transaction.atomic():
+        for start in range(0, len(title_ids), CHUNK_SIZE):
+            titles = Title.objects.filter(
+                pk__in=title_ids[start:start + CHUNK_SIZE])
+            titles.update(
+                review_count=counted(reviews, 'title', Count('id')),
+                score_sum=counted(reviews, 'title', Sum('score')),
+                **{field: counted(reviews.filter(score=score), 'title',
+                                  Count('id'))
+                   for score, field in zip(SCORES, SCORE_FIELDS)}
+            )
+            titles.update(weighted_rating=weighted_rating(rating_prior()))
+        for start in range(0, len(review_ids), CHUNK_SIZE):
+            Review.objects.filter(
+                pk__in=review_ids[start:start + CHUNK_SIZE]
+            ).update(comment_count=counted(Comment.objects.all(), 'review',
+                                           Count('id')))
+
+
+def weighted_rating(prior, score_delta=0, count_delta=0):
+    '''Выражение взвешенного рейтинга (S + m * C) / (v + m) после
+    изменения суммы оценок и числа отзывов на указанные величины.'''
+    return Case(
+        When(review_count=-count_delta, then=Value(None)),
+        default=ExpressionWrapper(
+            (F('score_sum') + score_delta + prior.mean * prior.min_votes)
+            / (F('review_count') + count_delta + prior.min_votes),
+            output_field=FloatField()
+        ),
+        output_field=FloatField()
+    )
+
+
+def average_score():
+    '''Средняя оценка произведения по счётчикам отзывов - то же, что
+    Avg('reviews__score'), но без JOIN и GROUP BY.'''
+    return Case(
+        When(review_count=0, then=Value(None)),
+        default=ExpressionWrapper(F('score_sum') * 1.0 / F('review_count'),
+                                  output_field=FloatField()),
+        output_field=FloatField()
+    )
+
+
+def rating_prior():
+    '''Текущие параметры взвешенного рейтинга.'''
+    prior = RatingPrior.objects.first()
+    if prior is None:
+        prior = calculate_rating_prior()
+    return prior
+
+
+def calculate_rating_prior():
+    '''Пересчитывает C - среднюю оценку по всем отзывам - и m - квантиль
+    `WEIGHTED_RATING['MIN_VOTES_QUANTILE']` числа отзывов у произведений.'''
+    mean = Review.objects.aggregate(mean=Avg('score'))['mean'] or 0
+    counts = Title.objects.filter(review_count__gt=0)
+    total = counts.count()
+    min_votes = 0
+    if total:
+        quantile = settings.WEIGHTED_RATING['MIN_VOTES_QUANTILE']
+        min_votes = counts.order_by('review_count').values_list(
+            'review_count', flat=True)[int(quantile * (total - 1))]
+    prior = RatingPrior.objects.first() or RatingPrior()
+    prior.mean, prior.min_votes = mean, min_votes
+    prior.save()
+    return prior
+
+
+def update_weighted_ratings():
+    '''Пересчитывает параметры, взвешенный рейтинг всех произведений
+    и все рейтинги категорий и жанров.'''
+    with transaction.atomic():
+        prior = calculate_rating_prior()
+        Title.objects.update(weighted_rating=weighted_rating(prior))
+        LeaderboardEntry.objects.all().delete()
+        for category_id in Category.objects.values_list('id', flat=True):
+            rebuild_leaderboard(category_id=category_id)
+        for genre_id in Genre.objects.values_list('id', flat=True):
+            rebuild_leaderboard(genre_id=genre_id)
+    return prior
+
+
+def review_scores_changed(title_id, added=(), removed=(), trending=None,
+                          normalized=None):
+    '''Учитывает добавленные и удалённые оценки отзывов произведения:
+    гистограмма, сумма оценок, число отзывов, взвешенный рейтинг и, если
+    переданы вклад нового отзыва `trending` и его нормированная оценка
+    `normalized`, популярность и нормированный рейтинг обновляются
+    одним UPDATE.'''
+    score_delta = sum(added) - sum(removed)
+    count_delta = len(added) - len(removed)
+    buckets = defaultdict(int)
+    for score in added:
+        buckets[SCORE_FIELDS[score - 1]] += 1
+    for score in removed:
+        buckets[SCORE_FIELDS[score - 1]] -= 1
+    changes = {field: F(field) + delta
+               for field, delta in buckets.items() if delta}
+    if trending is not None:
+        changes['trending_score'] = trending_added(trending)
+    if normalized is not None:
+        changes['normalized_score_sum'] = (
+            F('normalized_score_sum') + normalized)
+        changes['normalized_rating'] = Case(
+            When(review_count=-count_delta, then=Value(None)),
+            default=ExpressionWrapper(
+                (F('normalized_score_sum') + normalized)
+                / (F('review_count') + count_delta),
+                output_field=FloatField()
+            ),
+            output_field=FloatField()
+        )
+    prior = rating_prior()
+    Title.objects.filter(pk=title_id).update(
+        score_sum=F('score_sum') + score_delta,
+        review_count=F('review_count') + count_delta,
+        weighted_rating=weighted_rating(prior, score_delta, count_delta),
+        **changes
+    )
+    leaderboards_changed([title_id])
+
+
+def trending_weight(score, pub_date):
+    '''Логарифм вклада отзыва в популярность: ln(score) + ln(2) * t / T,
+    где t - время от TRENDING['EPOCH'] до публикации, T - период
+    полураспада. Вклад растёт со временем публикации, и сумма вкладов
+    упорядочивает произведения так же, как сумма оценок, затухающих к
+    текущему моменту.'''
+    epoch = datetime.fromisoformat(settings.TRENDING['EPOCH'])
+    half_life = settings.TRENDING['HALF_LIFE_DAYS'] * 24 * 60 * 60
+    return (math.log(score)
+            + math.log(2) * (pub_date - epoch).total_seconds() / half_life)
+
+
+def log_sum_exp(weights):
+    '''ln(sum(exp(w))) без переполнения.'''
+    top = max(weights)
+    return top + math.log(sum(math.exp(weight - top) for weight in weights))
+
+
+def trending_added(weight):
+    '''Выражение популярности после добавления вклада `weight`:
+    ln(exp(trending_score) + exp(weight)).'''
+    current = F('trending_score')
+    return Case(
+        When(trending_score__isnull=True, then=Value(weight)),
+        default=Greatest(current, Value(weight)) + Ln(
+            Value(1.0) + Exp(-Abs(current - Value(weight)))),
+        output_field=FloatField()
+    )
+
+
+def update_trending_scores(title_ids=None):
+    '''Пересчитывает по отзывам популярность произведений.'''
+    if title_ids is None:
+        all_ids = list(Title.objects.order_by('id')
+                       .values_list('id', flat=True))
+        for start in range(0, len(all_ids), CHUNK_SIZE):
+            update_trending_scores(all_ids[start:start + CHUNK_SIZE])
+        return
+    save_trending_scores(trending_scores(title_ids))
+
+
+def trending_scores(title_ids):
+    '''Популярность произведений по их отзывам: {id: значение}. Только
+    читает, поэтому считается и в процессах команд.'''
+    weights = {title_id: [] for title_id in title_ids}
+    for title_id, score, pub_date in Review.objects.filter(
+            title_id__in=weights
+    ).order_by().values_list('title_id', 'score', 'pub_date'):
+        weights[title_id].append(trending_weight(score, pub_date))
+    return {title_id: log_sum_exp(values) if values else None
+            for title_id, values in weights.items()}
+
+
+def save_trending_scores(scores):
+    Title.objects.bulk_update(
+        [Title(id=title_id, trending_score=score)
+         for title_id, score in scores.items()],
+        ('trending_score',), batch_size=CHUNK_SIZE // 4)
+
+
+def rebuild_leaderboard(category_id=None, genre_id=None):
+    group = ({'category_id': category_id} if category_id
+             else {'genre_id': genre_id})
+    LeaderboardEntry.objects.filter(**group).delete()
+    titles = Title.objects.filter(
+        weighted_rating__isnull=False,
+        **({'category_id': category_id} if category_id
+           else {'genre': genre_id})
+    ).order_by('-weighted_rating', 'id').values_list('id', flat=True)
+    LeaderboardEntry.objects.bulk_create(
+        LeaderboardEntry(title_id=title_id, position=position, **group)
+        for position, title_id in enumerate(
+            titles[:settings.WEIGHTED_RATING['LEADERBOARD_SIZE']], 1)
+    )
+
+
+def leaderboards_changed(title_ids, category_ids=(), genre_ids=()):
+    '''Перестраивает рейтинги после фиксации транзакции - один раз на
+    все изменённые в ней произведения, категории и жанры.'''
+    on_commit_ids(update_leaderboards, title_ids,
+                  [pk for pk in category_ids if pk is not None], genre_ids)
+
+
+def update_leaderboards(title_ids, category_ids=(), genre_ids=()):
+    '''Перестраивает рейтинги категорий и жанров, в которые произведения
+    входят или могут войти после изменения их взвешенного рейтинга.'''
+    size = settings.WEIGHTED_RATING['LEADERBOARD_SIZE']
+    ratings = {}
+    candidates = defaultdict(set)
+    for title_id, category_id, rating in Title.objects.filter(
+            id__in=title_ids).values_list('id', 'category_id',
+                                          'weighted_rating'):
+        ratings[title_id] = rating
+        candidates['category', category_id].add(title_id)
+    for title_id, genre_id in GenreTitle.objects.filter(
+            title_id__in=title_ids).values_list('title_id', 'genre_id'):
+        candidates['genre', genre_id].add(title_id)
+    candidates.update({('category', pk): set() for pk in category_ids
+                       if ('category', pk) not in candidates})
+    candidates.update({('genre', pk): set() for pk in genre_ids
+                       if ('genre', pk) not in candidates})
+    candidates.pop(('category', None), None)
+    boards = defaultdict(dict)
+    for category_id, genre_id, title_id, rating in (
+            LeaderboardEntry.objects.filter(
+                Q(title_id__in=title_ids)
+                | Q(category_id__in=[pk for kind, pk in candidates
+                                     if kind == 'category'])
+                | Q(genre_id__in=[pk for kind, pk in candidates
+                                  if kind == 'genre'])
+            ).values_list('category_id', 'genre_id', 'title_id',
+                          'title__weighted_rating')):
+        group = (('category', category_id) if category_id
+                 else ('genre', genre_id))
+        boards[group][title_id] = rating
+        candidates.setdefault(group, set())
+    for (kind, pk), members in candidates.items():
+        board = boards[kind, pk]
+        if (len(board) < size or not board.keys().isdisjoint(title_ids)
+                or None in board.values()
+                or any(ratings[title_id] is not None
+                       and ratings[title_id] > min(board.values())
+                       for title_id in members)):
+            rebuild_leaderboard(**{f'{kind}_id': pk})
+
+
+def review_day(pub_date):
+    '''День публикации отзыва в часовом поясе проекта.'''
+    return timezone.localtime(pub_date).date()
+
+
+def title_groups(title_ids=None):
+    '''Группы сводок, в которых учитываются отзывы произведений:
+    само произведение, его категория и жанры.'''
+    titles = Title.objects.order_by()
+    links = GenreTitle.objects.order_by()
+    if title_ids is not None:
+        titles = titles.filter(id__in=title_ids)
+        links = links.filter(title_id__in=title_ids)
+    groups = defaultdict(list)
+    for title_id, category_id in titles.values_list('id', 'category_id'):
+        groups[title_id].append(('title', title_id))
+        if category_id is not None:
+            groups[title_id].append(('category', category_id))
+    for title_id, genre_id in links.values_list('title_id', 'genre_id'):
+        groups[title_id].append(('genre', genre_id))
+    return groups
+
+
+def add_rollup_deltas(deltas, groups, day, count, total):
+    '''Добавляет к `deltas` изменения сводок групп `groups` за день
+    `day` и его месяц.'''
+    for period, bucket in ((ReviewRollup.DAY, day),
+                           (ReviewRollup.MONTH, day.replace(day=1))):
+        for field, pk in groups:
+            delta = deltas[field, pk, period, bucket]
+            delta[0] += count
+            delta[1] += total
+
+
+def rollup_condition(keys):
+    return reduce(or_, (
+        Q(**{f'{field}_id': pk}, period=period, bucket=bucket)
+        for field, pk, period, bucket in keys
+    ))
+
+
+def rollup_key(title_id, category_id, genre_id, period, bucket):
+    if title_id is not None:
+        return 'title', title_id, period, bucket
+    if category_id is not None:
+        return 'category', category_id, period, bucket
+    return 'genre', genre_id, period, bucket
+
+
+def apply_rollups(deltas):
+    '''Применяет изменения сводок {(группа, id, период, начало):
+    [отзывов, сумма оценок]}: один UPDATE на каждое различающееся
+    изменение, недостающие строки создаются, опустевшие удаляются.'''
+    keys_by_delta = defaultdict(list)
+    for key, (count, total) in deltas.items():
+        if count or total:
+            keys_by_delta[count, total].append(key)
+    for (count, total), keys in keys_by_delta.items():
+        for start in range(0, len(keys), ROLLUP_BATCH):
+            apply_rollup_delta(keys[start:start + ROLLUP_BATCH],
+                               count, total)
+
+
+def apply_rollup_delta(keys, count, total):
+    condition = rollup_condition(keys)
+    updated = ReviewRollup.objects.filter(condition).update(
+        review_count=F('review_count') + count,
+        score_sum=F('score_sum') + total
+    )
+    if count < 0:
+        ReviewRollup.objects.filter(condition, review_count=0).delete()
+    if count <= 0 or updated == len(keys):
+        return
+    existing = {
+        rollup_key(*row) for row in ReviewRollup.objects.filter(
+            condition).values_list('title_id', 'category_id', 'genre_id',
+                                   'period', 'bucket')
+    }
+    missing = [key for key in keys if key not in existing]
+    try:
+        with transaction.atomic():
+            ReviewRollup.objects.bulk_create(
+                ReviewRollup(**{f'{field}_id': pk}, period=period,
+                             bucket=bucket, review_count=count,
+                             score_sum=total)
+                for field, pk, period, bucket in missing
+            )
+    except IntegrityError:
+        # Строку успели создать параллельно - повторяем UPDATE.
+        apply_rollup_delta(missing, count, total)
+
+
+def review_rollups_changed(title_id, pub_date, count, total):
+    '''Учитывает в сводках отзыв(ы) произведения, опубликованные
+    `pub_date`: `count` отзывов и `total` суммы оценок.'''
+    deltas = defaultdict(lambda: [0, 0])
+    add_rollup_deltas(deltas, title_groups([title_id])[title_id],
+                      review_day(pub_date), count, total)
+    apply_rollups(deltas)
+
+
+def review_day_totals(start=None, end=None, title_ids=None):
+    '''Число отзывов и сумма оценок по произведениям и дням публикации
+    ({(произведение, день): [отзывов, сумма]}) для отзывов с id из
+    [start, end) или отзывов произведений `title_ids`.'''
+    reviews = Review.objects.order_by()
+    if start is not None:
+        reviews = reviews.filter(id__gte=start, id__lt=end)
+    if title_ids is not None:
+        reviews = reviews.filter(title_id__in=title_ids)
+    totals = {}
+    for title_id, score, pub_date in reviews.values_list(
+            'title_id', 'score', 'pub_date').iterator(CHUNK_SIZE):
+        total = totals.setdefault((title_id, review_day(pub_date)), [0, 0])
+        total[0] += 1
+        total[1] += score
+    return totals
+
+
+def title_groups_changed(title_id, added=(), removed=()):
+    '''Переносит отзывы произведения в сводки групп `added` и убирает
+    из сводок групп `removed` (смена категории или жанров).'''
+    deltas = defaultdict(lambda: [0, 0])
+    for (_, day), (count, total) in review_day_totals(
+            title_ids=[title_id]).items():
+        add_rollup_deltas(deltas, added, day, count, total)
+        add_rollup_deltas(deltas, removed, day, -count, -total)
+    apply_rollups(deltas)
+
+
+def rebuild_review_rollups(day_totals):
+    '''Заменяет все сводки рассчитанными по итогам `day_totals`
+    (см. review_day_totals).'''
+    groups = title_groups()
+    deltas = defaultdict(lambda: [0, 0])
+    for (title_id, day), (count, total) in day_totals.items():
+        add_rollup_deltas(deltas, groups[title_id], day, count, total)
+    with transaction.atomic():
+        ReviewRollup.objects.all().delete()
+        ReviewRollup.objects.bulk_create(
+            (ReviewRollup(**{f'{field}_id': pk}, period=period,
+                          bucket=bucket, review_count=count,
+                          score_sum=total)
+             for (field, pk, period, bucket), (count, total)
+             in deltas.items()),
+            batch_size=CHUNK_SIZE // 4
+        )
+    return len(deltas)
+
+
+def normalized_score(score, mean, std):
+    '''Оценка, нормированная по средней и отклонению автора.'''
+    return (score - mean) / std if std > 0 else 0.0
+
+
+def reviewer_stats_changed(user_id, added=(), removed=()):
+    '''Учитывает добавленные и удалённые оценки пользователя в его
+    статистике; возвращает новые среднюю и отклонение.'''
+    count_delta = len(added) - len(removed)
+    score_delta = sum(added) - sum(removed)
+    square_delta = (sum(score * score for score in added)
+                    - sum(score * score for score in removed))
+    count = F('review_count') + count_delta
+    total = F('score_sum') + score_delta
+    squares = F('score_square_sum') + square_delta
+    # Отклонение как в normalization.deviation: sqrt(n * Σx² - (Σx)²) / n.
+    updated = ReviewerStats.objects.filter(user_id=user_id).update(
+        review_count=count,
+        score_sum=total,
+        score_square_sum=squares,
+        mean=Case(
+            When(review_count=-count_delta, then=Value(0.0)),
+            default=ExpressionWrapper(total * 1.0 / count,
+                                      output_field=FloatField()),
+            output_field=FloatField()
+        ),
+        std=Case(
+            When(review_count=-count_delta, then=Value(0.0)),
+            default=ExpressionWrapper(
+                Sqrt(Greatest(count * squares - total * total, 0) * 1.0)
+                / count,
+                output_field=FloatField()
+            ),
+            output_field=FloatField()
+        )
+    )
+    if not updated:
+        if count_delta <= 0:
+            return 0.0, 0.0
+        ReviewerStats.objects.get_or_create(user_id=user_id)
+        return reviewer_stats_changed(user_id, added, removed)
+    return ReviewerStats.objects.filter(user_id=user_id).values_list(
+        'mean', 'std').get()
+
+
+def latest_publication():
+    '''Выражение времени последнего отзыва или комментария пользователя
+    `user_id` - два поиска по индексам (author, pub_date).'''
+    review, comment = (
+        Subquery(model.objects.filter(author=OuterRef('user_id')).order_by(
+            '-pub_date').values('pub_date')[:1])
+        for model in (Review, Comment)
+    )
+    # GREATEST в SQLite возвращает NULL, если NULL хотя бы один аргумент.
+    return Greatest(Coalesce(review, comment), Coalesce(comment, review))
+
+
+def user_activity_changed(user_id, comment_delta=0, published=None):
+    '''Учитывает добавленные и удалённые комментарии пользователя и его
+    новую публикацию: `published` - время нового отзыва или комментария;
+    без него (после удаления) время последней публикации пересчитывается.'''
+    if published is None:
+        activity = latest_publication()
+    else:
+        activity = Greatest(Coalesce(F('last_activity'), Value(published)),
+                            Value(published))
+    updated = ReviewerStats.objects.filter(user_id=user_id).update(
+        comment_count=F('comment_count') + comment_delta,
+        last_activity=activity,
+    )
+    if not updated and published is not None:
+        ReviewerStats.objects.get_or_create(user_id=user_id)
+        user_activity_changed(user_id, comment_delta, published)
+
+
+def user_activity():
+    '''{id пользователя: [число комментариев, время последней публикации]}
+    по всем отзывам и комментариям.'''
+    activity = {}
+    for user_id, count, latest in Comment.objects.order_by().values_list(
+            'author_id').annotate(Count('id'), Max('pub_date')):
+        activity[user_id] = [count, latest]
+    for user_id, latest in Review.objects.order_by().values_list(
+            'author_id').annotate(Max('pub_date')):
+        stats = activity.setdefault(user_id, [0, latest])
+        stats[1] = max(stats[1], latest)
+    return activity
+
+
+def update_author_titles(user_ids):
+    '''Пересчитывает нормированный рейтинг всех произведений с отзывами
+    пользователей: после изменения средней и отклонения автора меняются
+    z-оценки всех его отзывов, а не только изменённого.'''
+    title_ids = list(Review.objects.filter(author_id__in=user_ids).order_by()
+                     .values_list('title_id', flat=True).distinct())
+    for start in range(0, len(title_ids), CHUNK_SIZE):
+        update_normalized_ratings(title_ids[start:start + CHUNK_SIZE])
+
+
+def update_normalized_ratings(title_ids):
+    '''Пересчитывает нормированный рейтинг произведений по текущей
+    статистике авторов их отзывов.'''
+    stats = 'author__reviewer_stats__'
+    normalized = Case(
+        When(**{f'{stats}std__gt': 0}, then=ExpressionWrapper(
+            (F('score') - F(f'{stats}mean')) / F(f'{stats}std'),
+            output_field=FloatField()
+        )),
+        default=Value(0.0),
+        output_field=FloatField()
+    )
+    sums = {
+        title_id: (count, total)
+        for title_id, count, total in Review.objects.filter(
+            title_id__in=title_ids
+        ).order_by().values('title_id').annotate(
+            count=Count('id'), total=Sum(normalized)
+        ).values_list('title_id', 'count', 'total')
+    }
+    titles = []
+    for title_id in title_ids:
+        count, total = sums.get(title_id, (0, 0.0))
+        titles.append(Title(
+            id=title_id, normalized_score_sum=total,
+            normalized_rating=total / count if count else None))
+    Title.objects.bulk_update(
+        titles, ('normalized_score_sum', 'normalized_rating'),
+        batch_size=CHUNK_SIZE // 4)
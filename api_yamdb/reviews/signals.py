@@ -0,0 +1,195 @@
+from django.db.models.signals import (m2m_changed, post_delete, post_save,
+                                      pre_delete, pre_save)
+from django.dispatch import receiver
+
+from reviews import services
+from reviews.models import Comment, GenreTitle, Review, SimilarTitle, Title
+
+
+@receiver(m2m_changed, sender=Title.genre.through)
+def genre_links_added(sender, instance, action, reverse, pk_set, **kwargs):
+    # Удаление связей вызывает post_delete для GenreTitle, а добавление
+    # через bulk_create - только m2m_changed.
+    if action != 'post_add':
+        return
+    title_ids = pk_set if reverse else [instance.pk]
+    genre_ids = [instance.pk] if reverse else pk_set
+    for title_id in title_ids:
+        services.title_groups_changed(
+            title_id, added=[('genre', genre_id) for genre_id in genre_ids])
+    services.update_genre_masks(title_ids)
+    services.on_commit_ids(services.update_similar_titles, title_ids)
+    services.leaderboards_changed(title_ids)
+
+
+@receiver(pre_save, sender=GenreTitle)
+def genre_link_saving(sender, instance, **kwargs):
+    instance._saved_link = (
+        None if instance._state.adding else
+        GenreTitle.objects.filter(pk=instance.pk)
+        .values_list('title_id', 'genre_id').first()
+    )
+
+
+@receiver(post_save, sender=GenreTitle)
+def genre_link_saved(sender, instance, **kwargs):
+    saved = getattr(instance, '_saved_link', None)
+    if saved == (instance.title_id, instance.genre_id):
+        return
+    if saved is not None:
+        services.title_groups_changed(saved[0], removed=[('genre', saved[1])])
+    services.title_groups_changed(
+        instance.title_id, added=[('genre', instance.genre_id)])
+    genre_link_changed(instance.title_id)
+
+
+@receiver(post_delete, sender=GenreTitle)
+def genre_link_deleted(sender, instance, **kwargs):
+    services.title_groups_changed(
+        instance.title_id, removed=[('genre', instance.genre_id)])
+    genre_link_changed(instance.title_id)
+
+
+def genre_link_changed(title_id):
+    services.update_genre_masks([title_id])
+    services.on_commit_ids(services.update_similar_titles, [title_id])
+    services.leaderboards_changed([title_id])
+
+
+@receiver(pre_delete, sender=Title)
+def title_deleted(sender, instance, **kwargs):
+    # Строки SimilarTitle удаляются каскадом, поэтому произведения, в чьих
+    # списках было удаляемое, запоминаются заранее: после фиксации их
+    # списки пересчитываются вместе с остальными изменениями жанров.
+    services.on_commit_ids(services.update_similar_titles, [instance.pk, *(
+        SimilarTitle.objects.filter(similar=instance)
+        .values_list('title_id', flat=True))])
+    # Места в рейтингах тоже удаляются каскадом: после удаления
+    # перестраиваются рейтинги категории и жанров произведения.
+    genre_ids = list(GenreTitle.objects.filter(title=instance)
+                     .values_list('genre_id', flat=True))
+    services.leaderboards_changed([], [instance.category_id], genre_ids)
+
+
+@receiver(pre_save, sender=Title)
+def title_saving(sender, instance, **kwargs):
+    instance._saved_category = (
+        None if instance._state.adding else
+        Title.objects.filter(pk=instance.pk)
+        .values_list('category_id', flat=True).first()
+    )
+
+
+@receiver(post_save, sender=Title)
+def title_saved(sender, instance, created, **kwargs):
+    saved = getattr(instance, '_saved_category', None)
+    if not created and saved != instance.category_id:
+        # Отзывы произведения переходят в сводки новой категории.
+        services.title_groups_changed(
+            instance.pk,
+            added=[('category', instance.category_id)]
+            if instance.category_id else [],
+            removed=[('category', saved)] if saved else [])
+    services.leaderboards_changed([instance.pk])
+
+
+@receiver(pre_save, sender=Review)
+def review_saving(sender, instance, **kwargs):
+    instance._saved_score = (
+        None if instance._state.adding else
+        Review.objects.filter(pk=instance.pk)
+        .values_list('title_id', 'score').first()
+    )
+
+
+@receiver(post_save, sender=Review)
+def review_saved(sender, instance, created, **kwargs):
+    saved = getattr(instance, '_saved_score', None)
+    if saved is None:
+        # Популярность и нормированная оценка нового отзыва добавляются к
+        # суммам произведения; при изменении и удалении отзыва они
+        # пересчитываются по отзывам.
+        mean, std = services.reviewer_stats_changed(
+            instance.author_id, [instance.score])
+        services.review_scores_changed(
+            instance.title_id, [instance.score],
+            trending=services.trending_weight(instance.score,
+                                              instance.pub_date),
+            normalized=services.normalized_score(instance.score, mean, std))
+        services.review_rollups_changed(
+            instance.title_id, instance.pub_date, 1, instance.score)
+        services.user_activity_changed(instance.author_id,
+                                       published=instance.pub_date)
+        author_stats_changed(instance.author_id)
+    elif saved[0] == instance.title_id:
+        if saved[1] != instance.score:
+            services.reviewer_stats_changed(
+                instance.author_id, [instance.score], [saved[1]])
+            services.review_scores_changed(
+                instance.title_id, [instance.score], [saved[1]])
+            services.update_trending_scores([instance.title_id])
+            services.review_rollups_changed(
+                instance.title_id, instance.pub_date, 0,
+                instance.score - saved[1])
+            author_stats_changed(instance.author_id)
+    else:
+        services.review_scores_changed(saved[0], removed=[saved[1]])
+        services.review_scores_changed(instance.title_id, [instance.score])
+        services.update_trending_scores([saved[0], instance.title_id])
+        services.reviewer_stats_changed(
+            instance.author_id, [instance.score], [saved[1]])
+        services.update_normalized_ratings([saved[0]])
+        services.review_rollups_changed(
+            saved[0], instance.pub_date, -1, -saved[1])
+        services.review_rollups_changed(
+            instance.title_id, instance.pub_date, 1, instance.score)
+        author_stats_changed(instance.author_id)
+
+
+@receiver(post_delete, sender=Review)
+def review_deleted(sender, instance, **kwargs):
+    services.review_scores_changed(instance.title_id,
+                                   removed=[instance.score])
+    services.update_trending_scores([instance.title_id])
+    services.reviewer_stats_changed(instance.author_id,
+                                    removed=[instance.score])
+    services.update_normalized_ratings([instance.title_id])
+    services.review_rollups_changed(
+        instance.title_id, instance.pub_date, -1, -instance.score)
+    services.user_activity_changed(instance.author_id)
+    author_stats_changed(instance.author_id)
+
+
+def author_stats_changed(user_id):
+    # Новые средняя и отклонение автора меняют z-оценки всех его отзывов:
+    # рейтинг его произведений пересчитывается один раз после фиксации.
+    services.on_commit_ids(services.update_author_titles, [user_id])
+
+
+@receiver(pre_save, sender=Comment)
+def comment_saving(sender, instance, **kwargs):
+    instance._saved_review = (
+        None if instance._state.adding else
+        Comment.objects.filter(pk=instance.pk)
+        .values_list('review_id', flat=True).first()
+    )
+
+
+@receiver(post_save, sender=Comment)
+def comment_saved(sender, instance, created, **kwargs):
+    saved = getattr(instance, '_saved_review', None)
+    if created:
+        services.review_comments_changed(instance.review_id, 1)
+        services.user_activity_changed(instance.author_id, 1,
+                                       instance.pub_date)
+    elif saved is not None and saved != instance.review_id:
+        services.review_comments_changed(saved, -1)
+        services.review_comments_changed(instance.review_id, 1)
+
+
+@receiver(post_delete, sender=Comment)
+def comment_deleted(sender, instance, **kwargs):
+    # При каскадном удалении отзыва или пользователя сигнал приходит для
+    # каждого комментария; UPDATE удаляемого отзыва ничего не портит.
+    services.review_comments_changed(instance.review_id, -1)
+    services.user_activity_changed(instance.author_id, -1)
@@ -0,0 +1,168 @@
+import re
+from collections import Counter
+from contextlib import contextmanager
+
+import pytest
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+SEED_TITLES = 12
+SEED_REVIEWS_PER_TITLE = 4
+SEED_COMMENTS_PER_REVIEW = 3
+
+PATTERN_LITERAL = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+PATTERN_FULL_SCAN = re.compile(r'^SCAN (?:TABLE )?(?P<table>\w+)(?P<rest>.*)')
+INDEXED_SCAN_MARKERS = ('USING INDEX', 'USING COVERING INDEX',
+                        'USING INTEGER PRIMARY KEY')
+TEMP_SORT = 'USE TEMP B-TREE FOR ORDER BY'
+
+
+def normalize_sql(sql):
+    '''Заменяет литералы на `?`, чтобы одинаковые по форме запросы
+    (типичный N+1) группировались вместе.'''
+    return PATTERN_LITERAL.sub('?', sql)
+
+
+def format_queries(queries):
+    shapes = Counter(normalize_sql(query['sql']) for query in queries)
+    lines = []
+    repeated = [(sql, count) for sql, count in shapes.items() if count > 1]
+    if repeated:
+        lines.append('Повторяющиеся запросы (возможен N+1):')
+        lines.extend(f'  x{count} {sql}' for sql, count in repeated)
+    lines.append('Выполненные запросы:')
+    lines.extend(
+        f'  {number}. {query["sql"]}'
+        for number, query in enumerate(queries, 1)
+    )
+    return '\n'.join(lines)
+
+
+def explain_query_plan(sql):
+    with connection.cursor() as cursor:
+        cursor.execute(f'EXPLAIN QUERY PLAN {sql}')
+        return [row[-1] for row in cursor.fetchall()]
+
+
+def find_full_scans(sql, tables, sorted_by_index=False):
+    '''Возвращает строки плана с полным сканированием таблиц `tables`
+    и, если `sorted_by_index`, с сортировкой во временном B-дереве.'''
+    scans = []
+    for detail in explain_query_plan(sql):
+        if sorted_by_index and detail == TEMP_SORT:
+            scans.append(detail)
+        match = PATTERN_FULL_SCAN.match(detail)
+        if (match and match.group('table') in tables
+                and not any(marker in match.group('rest')
+                            for marker in INDEXED_SCAN_MARKERS)):
+            scans.append(detail)
+    return scans
+
+
+@pytest.fixture
+def query_budget(request):
+    '''Контекстный менеджер, ограничивающий число SQL-запросов.
+
+    Бюджет берётся из аргумента или из маркера `max_queries`. При
+    превышении тест падает со списком запросов и сгруппированными
+    повторами.
+    '''
+    marker = request.node.get_closest_marker('max_queries')
+
+    @contextmanager
+    def check(max_queries=None, label=''):
+        if max_queries is None:
+            assert marker is not None, (
+                'Укажите бюджет запросов аргументом или маркером '
+                '`max_queries`.'
+            )
+            max_queries = marker.args[0]
+        with CaptureQueriesContext(connection) as context:
+            yield context
+        executed = len(context.captured_queries)
+        assert executed <= max_queries, (
+            f'{label}: выполнено {executed} SQL-запросов при бюджете '
+            f'{max_queries} (+{executed - max_queries}).\n'
+            f'{format_queries(context.captured_queries)}'
+        )
+
+    return check
+
+
+@pytest.fixture
+def assert_no_full_scan():
+    '''Проверяет через `EXPLAIN QUERY PLAN`, что захваченные запросы
+    к таблицам `tables` используют индексы, а не полный просмотр.'''
+
+    def check(captured_queries, tables, label='', sorted_by_index=False):
+        problems = []
+        for query in captured_queries:
+            if not query['sql'].lstrip().upper().startswith('SELECT'):
+                continue
+            scans = find_full_scans(query['sql'], tables, sorted_by_index)
+            if scans:
+                problems.append(f'  {query["sql"]}\n    -> '
+                                + '\n    -> '.join(scans))
+        assert not problems, (
+            f'{label}: запросы выполняют полный просмотр таблиц '
+            f'{", ".join(tables)}:\n' + '\n'.join(problems)
+        )
+
+    return check
+
+
+@pytest.fixture
+def seeded_catalog(django_user_model):
+    '''Набор данных для замеров: произведения с жанрами и категориями,
+    отзывы и комментарии от нескольких пользователей.'''
+    from reviews.models import (Category, Comment, Genre, GenreTitle,
+                                Review, Title)
+
+    users = [
+        django_user_model.objects.create_user(
+            username=f'seed_user_{number}',
+            email=f'seed_user_{number}@yamdb.fake',
+        )
+        for number in range(SEED_REVIEWS_PER_TITLE)
+    ]
+    categories = [
+        Category.objects.create(name=f'Категория {number}',
+                                slug=f'seed-category-{number}')
+        for number in range(3)
+    ]
+    genres = [
+        Genre.objects.create(name=f'Жанр {number}',
+                             slug=f'seed-genre-{number}')
+        for number in range(4)
+    ]
+    titles = []
+    for number in range(SEED_TITLES):
+        title = Title.objects.create(
+            name=f'Произведение {number:02}',
+            year=1950 + number,
+            description=f'Описание {number}',
+            category=categories[number % len(categories)],
+        )
+        GenreTitle.objects.create(title=title,
+                                  genre=genres[number % len(genres)])
+        GenreTitle.objects.create(title=title,
+                                  genre=genres[(number + 1) % len(genres)])
+        titles.append(title)
+    reviews = []
+    for title in titles:
+        for number, author in enumerate(users):
+            reviews.append(Review.objects.create(
+                title=title, author=author, text=f'Отзыв {number}',
+                score=number % 10 + 1,
+            ))
+    for review in reviews:
+        for number in range(SEED_COMMENTS_PER_REVIEW):
+            Comment.objects.create(review=review, author=users[number],
+                                   text=f'Комментарий {number}')
+    return {
+        'users': users,
+        'categories': categories,
+        'genres': genres,
+        'titles': titles,
+        'reviews': reviews,
+    }
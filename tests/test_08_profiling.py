@@ -0,0 +1,90 @@
+from http import HTTPStatus
+
+import pytest
+
+
+@pytest.mark.django_db(transaction=True)
+class Test08ProfilingAPI:
+
+    TITLES_URL = '/api/v1/titles/'
+    PROFILES_URL = '/api/v1/profiles/'
+
+    @pytest.fixture(autouse=True)
+    def profile_dir(self, settings, tmp_path):
+        settings.PROFILING = {**settings.PROFILING, 'DIR': str(tmp_path)}
+        return tmp_path
+
+    @pytest.mark.parametrize('mode,extension', (
+        ('cprofile', '.prof'), ('sampling', '.collapsed')
+    ))
+    def test_01_admin_profile(self, admin_client, mode, extension):
+        response = admin_client.get(
+            self.TITLES_URL, HTTP_X_PROFILE=mode
+        )
+        assert response.status_code == HTTPStatus.OK
+        name = response.get('X-Profile-Id')
+        assert name and name.endswith(extension), (
+            'Проверьте, что запрос администратора с заголовком `X-Profile` '
+            'профилируется и имя профиля возвращается в `X-Profile-Id`.'
+        )
+
+        response = admin_client.get(self.PROFILES_URL)
+        assert response.status_code == HTTPStatus.OK
+        assert name in [profile['name'] for profile in response.json()], (
+            f'Проверьте, что `{self.PROFILES_URL}` возвращает список '
+            'сохранённых профилей.'
+        )
+        response = admin_client.get(f'{self.PROFILES_URL}{name}/')
+        assert response.status_code == HTTPStatus.OK, (
+            f'Проверьте, что профиль доступен по `{self.PROFILES_URL}<name>/`.'
+        )
+
+    def test_02_profile_not_admin(self, client, user_client):
+        for request_client in (client, user_client):
+            response = request_client.get(
+                self.TITLES_URL, {'profile': 'cprofile'}
+            )
+            assert response.status_code == HTTPStatus.OK
+            assert 'X-Profile-Id' not in response, (
+                'Проверьте, что профилирование по запросу доступно '
+                'только администратору.'
+            )
+            response = request_client.get(self.PROFILES_URL)
+            assert response.status_code in (
+                HTTPStatus.UNAUTHORIZED, HTTPStatus.FORBIDDEN
+            )
+
+    def test_03_profile_not_found(self, admin_client):
+        response = admin_client.get(f'{self.PROFILES_URL}missing.prof/')
+        assert response.status_code == HTTPStatus.NOT_FOUND
+        response = admin_client.get(f'{self.PROFILES_URL}..%2Fsettings.py/')
+        assert response.status_code == HTTPStatus.NOT_FOUND
+
+    def test_04_random_sampling(self, settings, client):
+        settings.PROFILING = {**settings.PROFILING, 'SAMPLE_RATE': 1.0}
+        response = client.get(self.TITLES_URL)
+        assert response.get('X-Profile-Id', '').endswith('.collapsed'), (
+            'Проверьте, что при `SAMPLE_RATE` = 1 профилируется каждый '
+            'запрос.'
+        )
+
+    def test_05_profile_retention(self, settings, client, profile_dir):
+        import os
+        import time
+
+        settings.PROFILING = {**settings.PROFILING, 'SAMPLE_RATE': 1.0,
+                              'MAX_FILES': 2, 'MAX_AGE_DAYS': 1}
+        old = profile_dir / '20000101-000000-get-old-00000000.prof'
+        old.write_text('')
+        week_ago = time.time() - 7 * 24 * 60 * 60
+        os.utime(old, (week_ago, week_ago))
+        other = profile_dir / 'notes.txt'
+        other.write_text('')
+        names = [client.get(self.TITLES_URL)['X-Profile-Id']
+                 for _ in range(3)]
+        assert sorted(os.listdir(profile_dir)) == sorted(
+            [*names[1:], 'notes.txt']), (
+            'Проверьте, что сохраняются только `MAX_FILES` последних '
+            'профилей не старше `MAX_AGE_DAYS`, а чужие файлы не '
+            'удаляются.'
+        )
@@ -0,0 +1,295 @@
+from http import HTTPStatus
+
+import pytest
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+
+def endpoint(url, max_queries):
+    return pytest.param(url, marks=pytest.mark.max_queries(max_queries),
+                        id=url)
+
+
+@pytest.mark.django_db(transaction=True)
+class Test09QueryBudget:
+
+    @pytest.mark.parametrize('url', (
+        endpoint('/api/v1/categories/', 2),
+        endpoint('/api/v1/genres/', 2),
+        endpoint('/api/v1/titles/', 3),
+        endpoint('/api/v1/titles/?genre=seed-genre-1', 4),
+        endpoint('/api/v1/titles/?category=seed-category-1', 3),
+        endpoint('/api/v1/titles/?ordering=-weighted_rating', 3),
+        endpoint('/api/v1/titles/?ordering=-normalized_rating'
+                 '&expand=normalized_rating', 3),
+        endpoint('/api/v1/titles/trending/', 3),
+        endpoint('/api/v1/titles/{title_id}/', 2),
+        endpoint('/api/v1/titles/{title_id}/similar/', 2),
+        endpoint('/api/v1/categories/seed-category-1/leaderboard/', 3),
+        endpoint('/api/v1/genres/seed-genre-1/leaderboard/', 3),
+        endpoint('/api/v1/titles/{title_id}/reviews/', 3),
+        endpoint('/api/v1/titles/{title_id}/reviews/{review_id}/', 2),
+        endpoint('/api/v1/titles/{title_id}/reviews/{review_id}/comments/',
+                 3),
+    ))
+    def test_01_anonymous_endpoints(self, client, seeded_catalog,
+                                    query_budget, url):
+        url = url.format(title_id=seeded_catalog['titles'][0].id,
+                         review_id=seeded_catalog['reviews'][0].id)
+        with query_budget(label=f'GET {url}'):
+            response = client.get(url)
+        assert response.status_code == HTTPStatus.OK
+
+    @pytest.mark.parametrize('url', (
+        endpoint('/api/v1/users/', 3),
+        endpoint('/api/v1/users/seed_user_0/', 2),
+        endpoint('/api/v1/users/me/', 1),
+        endpoint('/api/v1/users/?expand=stats', 3),
+        endpoint('/api/v1/users/seed_user_0/?expand=stats', 2),
+        endpoint('/api/v1/users/me/?expand=stats', 2),
+        endpoint('/api/v1/analytics/titles/', 3),
+        endpoint('/api/v1/analytics/categories/?period=day', 3),
+        endpoint('/api/v1/analytics/genres/?genre=seed-genre-1', 3),
+    ))
+    def test_02_admin_endpoints(self, admin_client, seeded_catalog,
+                                query_budget, url):
+        with query_budget(label=f'GET {url}'):
+            response = admin_client.get(url)
+        assert response.status_code == HTTPStatus.OK
+
+    @pytest.mark.parametrize('url,tables,sorted_by_index', (
+        ('/api/v1/titles/{title_id}/', ('reviews_title', 'reviews_review'),
+         False),
+        ('/api/v1/titles/{title_id}/reviews/', ('reviews_review',), True),
+        ('/api/v1/titles/trending/', ('reviews_title',), False),
+        ('/api/v1/titles/{title_id}/similar/', ('reviews_similartitle',),
+         False),
+        ('/api/v1/genres/seed-genre-1/leaderboard/',
+         ('reviews_leaderboardentry',), False),
+        ('/api/v1/titles/{title_id}/reviews/{review_id}/comments/',
+         ('reviews_review', 'reviews_comment'), True),
+    ))
+    def test_03_key_queries_use_indexes(self, client, seeded_catalog,
+                                        query_budget, assert_no_full_scan,
+                                        url, tables, sorted_by_index):
+        url = url.format(title_id=seeded_catalog['titles'][0].id,
+                         review_id=seeded_catalog['reviews'][0].id)
+        with query_budget(max_queries=10, label=f'GET {url}') as context:
+            response = client.get(url)
+        assert response.status_code == HTTPStatus.OK
+        assert_no_full_scan(context.captured_queries, tables,
+                            label=f'GET {url}',
+                            sorted_by_index=sorted_by_index)
+
+    @pytest.mark.parametrize('url,keys,max_queries,absent', (
+        ('/api/v1/titles/?fields=id,name,rating', {'id', 'name', 'rating'},
+         2, ('reviews_genre', 'reviews_category', 'description')),
+        ('/api/v1/titles/?fields=id,name', {'id', 'name'},
+         2, ('reviews_review', 'reviews_genre', 'reviews_category')),
+        ('/api/v1/titles/?omit=genre,description', {
+            'id', 'name', 'year', 'rating', 'category'},
+         2, ('reviews_genre', 'description')),
+        ('/api/v1/titles/{title_id}/reviews/?omit=text', {
+            'id', 'title', 'author', 'score', 'pub_date'},
+         3, ('"reviews_review"."text"',)),
+        ('/api/v1/titles/{title_id}/reviews/?fields=id,score', {
+            'id', 'score'}, 3, ('users_user', '"reviews_review"."text"')),
+        ('/api/v1/titles/{title_id}/reviews/{review_id}/comments/'
+         '?fields=id,text', {'id', 'text'}, 3, ('users_user',)),
+    ))
+    def test_04_sparse_fields_narrow_queries(self, client, seeded_catalog,
+                                             query_budget, url, keys,
+                                             max_queries, absent):
+        url = url.format(title_id=seeded_catalog['titles'][0].id,
+                         review_id=seeded_catalog['reviews'][0].id)
+        with query_budget(max_queries, label=f'GET {url}') as context:
+            response = client.get(url)
+        assert response.status_code == HTTPStatus.OK
+        assert set(response.json()['results'][0]) == keys, (
+            'Проверьте, что `?fields=` и `?omit=` оставляют в ответе только '
+            'выбранные поля.'
+        )
+        queries = ' '.join(query['sql'] for query in context.captured_queries)
+        for fragment in absent:
+            assert fragment not in queries, (
+                f'GET {url}: запросы не должны читать {fragment} - '
+                'поле не выводится.'
+            )
+
+    @pytest.mark.parametrize('url,compiled', (
+        ('/api/v1/titles/', True),
+        ('/api/v1/titles/?page=2', True),
+        ('/api/v1/titles/?ordering=-normalized_rating'
+         '&expand=normalized_rating', True),
+        ('/api/v1/titles/?fields=id,genre,category,rating', True),
+        ('/api/v1/titles/?expand=score_histogram', False),
+        ('/api/v1/titles/trending/', True),
+        ('/api/v1/titles/{title_id}/reviews/', True),
+        ('/api/v1/titles/{title_id}/reviews/?omit=text', True),
+        ('/api/v1/titles/{title_id}/reviews/{review_id}/comments/', True),
+    ))
+    def test_05_compiled_lists_match_serializers(self, client,
+                                                 seeded_catalog,
+                                                 monkeypatch, url,
+                                                 compiled):
+        from api import compiled as compiled_path, mixins
+        from reviews.models import Title
+
+        Title.objects.create(name='Произведение без категории', year=2000)
+        url = url.format(title_id=seeded_catalog['titles'][0].id,
+                         review_id=seeded_catalog['reviews'][0].id)
+        results = []
+
+        def compile_serializer(serializer, queryset):
+            results.append(
+                compiled_path.compile_serializer(serializer, queryset))
+            return results[-1]
+
+        monkeypatch.setattr(mixins, 'compile_serializer', compile_serializer)
+        response = client.get(url)
+        assert response.status_code == HTTPStatus.OK
+        assert (results[-1] is not None) == compiled, (
+            f'GET {url}: проверьте, когда список строится через '
+            'api.compiled, а когда - сериализатором.'
+        )
+        monkeypatch.setattr(mixins, 'compile_serializer', lambda *args: None)
+        expected = client.get(url)
+        assert response.content == expected.content, (
+            f'GET {url}: ответ быстрого пути должен побайтно совпадать с '
+            'ответом сериализатора.'
+        )
+
+    @pytest.mark.parametrize('params', ('', '&fields=id,name,rating',
+                                        '&expand=score_histogram'))
+    def test_06_title_batch(self, client, seeded_catalog, query_budget,
+                            params):
+        titles = seeded_catalog['titles']
+        ids = [titles[5].id, titles[0].id, 999999, titles[11].id,
+               titles[0].id]
+        url = ('/api/v1/titles/batch/?ids='
+               + ','.join(map(str, ids)) + params)
+        with query_budget(2, label=f'GET {url}'):
+            response = client.get(url)
+        assert response.status_code == HTTPStatus.OK
+        data = response.json()
+        assert data['missing'] == [999999], (
+            'Проверьте, что отсутствующие id перечисляются в `missing`.'
+        )
+        assert data['results'] == [
+            client.get(f'/api/v1/titles/{pk}/?{params}').json()
+            for pk in (titles[5].id, titles[0].id, titles[11].id)
+        ], (
+            'Проверьте, что произведения возвращаются в порядке `ids` и '
+            'совпадают с ответом `/titles/{id}/`.'
+        )
+
+    @pytest.mark.parametrize('ids', ('', 'a,1', '-1', '1' * 19,
+                                     ','.join(map(str, range(1, 102)))))
+    def test_07_title_batch_invalid_ids(self, client, ids):
+        response = client.get(f'/api/v1/titles/batch/?ids={ids}')
+        assert response.status_code == HTTPStatus.BAD_REQUEST
+        assert 'ids' in response.json()
+
+    def test_08_title_overview(self, client, seeded_catalog, query_budget,
+                               monkeypatch):
+        from rest_framework.pagination import PageNumberPagination
+        from api import views
+        from api_yamdb.settings import CONST
+
+        monkeypatch.setattr(PageNumberPagination, 'page_size', 3)
+        monkeypatch.setitem(CONST, 'TITLE_OVERVIEW_COMMENTS', 2)
+        title = seeded_catalog['titles'][1]
+        reviews = title.reviews.order_by('pub_date', 'id')
+        reviews[1].comments.all().delete()
+        url = f'/api/v1/titles/{title.id}/overview/'
+        with query_budget(4, label=f'GET {url}'):
+            response = client.get(url)
+        assert response.status_code == HTTPStatus.OK
+        data = response.json()
+        assert data['title'] == client.get(
+            f'/api/v1/titles/{title.id}/').json()
+        page = client.get(f'/api/v1/titles/{title.id}/reviews/').json()
+        assert data['reviews']['count'] == page['count']
+        assert data['reviews']['next'] == page['next']
+        assert data['reviews']['previous'] is None
+        assert len(data['reviews']['results']) == 3
+        for review, expected in zip(data['reviews']['results'],
+                                    page['results']):
+            comments = client.get(
+                f'/api/v1/titles/{title.id}/reviews/{expected["id"]}'
+                '/comments/'
+            ).json()
+            assert review.pop('comment_count') == comments['count']
+            assert review.pop('comments') == comments['results'][-2:], (
+                'Проверьте, что к отзыву выводятся последние комментарии '
+                'в порядке публикации.'
+            )
+            assert review == expected, (
+                'Проверьте, что отзывы совпадают с первой страницей '
+                '`/titles/{title_id}/reviews/`.'
+            )
+        monkeypatch.setattr(views, 'compile_serializer', lambda *args: None)
+        assert client.get(url).content == response.content, (
+            'Проверьте, что без быстрого пути обзор строится '
+            'сериализаторами с тем же ответом.'
+        )
+        assert client.get(
+            '/api/v1/titles/999999/overview/'
+        ).status_code == HTTPStatus.NOT_FOUND
+
+    @pytest.mark.parametrize('kind', ('reviews', 'comments'))
+    def test_09_author_feeds(self, moderator_client, user_client,
+                             seeded_catalog, query_budget,
+                             assert_no_full_scan, kind):
+        from reviews.models import Comment, Review
+
+        model = Review if kind == 'reviews' else Comment
+        title = 'title' if kind == 'reviews' else 'review__title'
+        expected = list(model.objects.filter(
+            author__username='seed_user_0'
+        ).order_by('-pub_date', '-id').values_list('id', f'{title}__name'))
+        url = f'/api/v1/users/seed_user_0/{kind}/'
+        results = []
+        while url:
+            with query_budget(3, label=f'GET {url}') as context:
+                response = moderator_client.get(url)
+            assert response.status_code == HTTPStatus.OK
+            assert_no_full_scan(context.captured_queries,
+                                (model._meta.db_table,), label=f'GET {url}',
+                                sorted_by_index=True)
+            data = response.json()
+            assert 'count' not in data
+            results.extend(data['results'])
+            url = data['next']
+        assert [(item['id'], item['title']) for item in results] == expected, (
+            f'Проверьте, что `/users/{{username}}/{kind}/` возвращает все '
+            'публикации автора от новых к старым с названиями произведений.'
+        )
+        assert len(expected) > 10
+        assert {item['author'] for item in results} == {'seed_user_0'}
+        assert user_client.get(
+            f'/api/v1/users/seed_user_0/{kind}/'
+        ).status_code == HTTPStatus.FORBIDDEN
+        assert moderator_client.get(
+            f'/api/v1/users/missing/{kind}/'
+        ).status_code == HTTPStatus.NOT_FOUND
+
+    @pytest.mark.parametrize('url', (
+        '/api/v1/titles/',
+        '/api/v1/titles/{title_id}/',
+        '/api/v1/titles/{title_id}/similar/',
+        '/api/v1/genres/seed-genre-1/leaderboard/',
+        '/api/v1/categories/seed-category-1/leaderboard/',
+        '/api/v1/users/me/recommendations/',
+    ))
+    def test_10_rating_from_counters(self, user_client, seeded_catalog,
+                                     url):
+        url = url.format(title_id=seeded_catalog['titles'][0].id)
+        with CaptureQueriesContext(connection) as context:
+            response = user_client.get(url)
+        assert response.status_code == HTTPStatus.OK
+        assert not any('AVG(' in query['sql']
+                       for query in context.captured_queries), (
+            f'GET {url}: рейтинг должен считаться по счётчикам '
+            '`score_sum` и `review_count`, без JOIN отзывов и GROUP BY.'
+        )
@@ -0,0 +1,745 @@
+from http import HTTPStatus
+from io import StringIO
+
+import pytest
+from django.core.management import call_command
+
+from tests.utils import (create_single_comment, create_single_review,
+                         create_titles)
+
+
+@pytest.mark.django_db(transaction=True)
+class Test10Denormalization:
+
+    TITLES_URL = '/api/v1/titles/'
+    TITLES_DETAIL_URL_TEMPLATE = '/api/v1/titles/{title_id}/'
+
+    def get_title_names(self, client, **params):
+        response = client.get(self.TITLES_URL, params)
+        assert response.status_code == HTTPStatus.OK
+        return {title['name'] for title in response.json()['results']}
+
+    def test_01_genre_mask_follows_genre_changes(self, admin_client, client):
+        titles, _, genres = create_titles(admin_client)
+        terminator, die_hard = titles[0]['name'], titles[1]['name']
+        assert self.get_title_names(
+            client, genre=genres[2]['slug']) == {die_hard}
+
+        response = admin_client.patch(
+            self.TITLES_DETAIL_URL_TEMPLATE.format(title_id=titles[0]['id']),
+            data={'genre': [genres[2]['slug']]}
+        )
+        assert response.status_code == HTTPStatus.OK
+        assert self.get_title_names(
+            client, genre=genres[2]['slug']) == {terminator, die_hard}, (
+            'Проверьте, что фильтр по жанру учитывает изменение жанров '
+            'произведения.'
+        )
+        assert self.get_title_names(client, genre=genres[0]['slug']) == set()
+
+        response = admin_client.delete(f'/api/v1/genres/{genres[2]["slug"]}/')
+        assert response.status_code == HTTPStatus.NO_CONTENT
+        assert self.get_title_names(client, genre=genres[2]['slug']) == set()
+
+    def test_02_genre_filter_matches_part_of_slug(self, admin_client, client):
+        titles, _, _ = create_titles(admin_client)
+        assert self.get_title_names(client, genre='r') == {
+            title['name'] for title in titles
+        }
+        assert self.get_title_names(client, genre='missing') == set()
+
+    def test_03_similar_titles_follow_genre_changes(self, admin_client,
+                                                    client):
+        titles, _, genres = create_titles(admin_client)
+        terminator, die_hard = titles
+        url = self.TITLES_DETAIL_URL_TEMPLATE + 'similar/'
+        response = client.get(url.format(title_id=terminator['id']))
+        assert response.status_code == HTTPStatus.OK
+        assert response.json() == []
+
+        admin_client.patch(
+            self.TITLES_DETAIL_URL_TEMPLATE.format(title_id=die_hard['id']),
+            data={'genre': [genres[1]['slug']]}
+        )
+        response = client.get(url.format(title_id=terminator['id']))
+        assert [title['name'] for title in response.json()] == [
+            die_hard['name']], (
+            'Проверьте, что `/api/v1/titles/{title_id}/similar/` возвращает '
+            'произведения с общими жанрами.'
+        )
+        assert set(response.json()[0]) == {
+            'id', 'name', 'year', 'rating', 'description', 'genre',
+            'category'
+        }
+        response = client.get(url.format(title_id=die_hard['id']))
+        assert [title['name'] for title in response.json()] == [
+            terminator['name']]
+
+        response = client.get(url.format(title_id=die_hard['id'] + 100))
+        assert response.status_code == HTTPStatus.NOT_FOUND
+
+    def test_04_incremental_similarity_matches_rebuild(self, settings,
+                                                       seeded_catalog):
+        from reviews import services
+        from reviews.models import SimilarTitle
+
+        def similarity_table():
+            table = {}
+            for link in SimilarTitle.objects.all():
+                table.setdefault(link.title_id, []).append(
+                    round(link.score, 9))
+            return {title_id: sorted(scores)
+                    for title_id, scores in table.items()}
+
+        settings.SIMILAR_TITLES = {**settings.SIMILAR_TITLES, 'TOP_K': 3}
+        services.rebuild_similar_titles()
+        titles, genres = seeded_catalog['titles'], seeded_catalog['genres']
+        titles[0].genre.set([genres[3]])
+        titles[1].genre.add(genres[0])
+        titles[2].genre.clear()
+        titles[3].delete()
+        incremental = similarity_table()
+        services.rebuild_similar_titles()
+        assert incremental == similarity_table(), (
+            'Проверьте, что инкрементальное обновление похожих произведений '
+            'даёт тот же результат, что полный пересчёт.'
+        )
+        assert all(len(scores) == 3 for scores in incremental.values())
+
+    def check_weighted_ratings(self):
+        from django.db.models import Count, Sum
+
+        from reviews.models import RatingPrior, Title
+
+        prior = RatingPrior.objects.get()
+        ratings = {}
+        for title in Title.objects.annotate(
+                count=Count('reviews'), total=Sum('reviews__score')):
+            assert (title.review_count, title.score_sum) == (
+                title.count, title.total or 0), (
+                'Проверьте, что число отзывов и сумма оценок произведения '
+                'обновляются при создании, изменении и удалении отзывов.'
+            )
+            expected = None
+            if title.count:
+                expected = ((title.total + prior.mean * prior.min_votes)
+                            / (title.count + prior.min_votes))
+                assert title.weighted_rating == pytest.approx(expected)
+            else:
+                assert title.weighted_rating is None
+            ratings[title.name] = expected
+        return ratings
+
+    def test_05_weighted_rating_follows_reviews(self, admin_client,
+                                                user_client,
+                                                moderator_client, client):
+        titles, categories, genres = create_titles(admin_client)
+        terminator, die_hard = titles
+        create_single_review(admin_client, terminator['id'], 'Шедевр', 10)
+        for author_client in (admin_client, user_client, moderator_client):
+            create_single_review(author_client, die_hard['id'], 'Отзыв', 8)
+        call_command('update_weighted_ratings', stdout=StringIO())
+        ratings = self.check_weighted_ratings()
+
+        reviews_url = f'{self.TITLES_URL}{die_hard["id"]}/reviews/'
+        review = user_client.get(reviews_url).json()['results'][0]
+        user_client.patch(f'{reviews_url}{review["id"]}/', data={'score': 1})
+        self.check_weighted_ratings()
+        admin_client.delete(f'{reviews_url}{review["id"]}/')
+        ratings = self.check_weighted_ratings()
+
+        response = client.get(self.TITLES_URL,
+                              {'ordering': '-weighted_rating'})
+        assert [title['name'] for title in response.json()['results']] == (
+            sorted(ratings, key=lambda name: -ratings[name])), (
+            'Проверьте, что `?ordering=-weighted_rating` сортирует '
+            'произведения по взвешенному рейтингу.'
+        )
+
+    def test_06_leaderboards(self, admin_client, user_client, client):
+        titles, categories, genres = create_titles(admin_client)
+        terminator, die_hard = titles
+        create_single_review(user_client, terminator['id'], 'Отзыв', 7)
+        create_single_review(user_client, die_hard['id'], 'Отзыв', 9)
+
+        def leaderboard(url):
+            response = client.get(f'{url}leaderboard/')
+            assert response.status_code == HTTPStatus.OK
+            return [title['name'] for title in response.json()]
+
+        category_url = f'/api/v1/categories/{categories[0]["slug"]}/'
+        assert leaderboard(category_url) == [terminator['name']], (
+            'Проверьте, что `/api/v1/categories/{slug}/leaderboard/` '
+            'возвращает произведения категории с отзывами.'
+        )
+        admin_client.patch(
+            self.TITLES_DETAIL_URL_TEMPLATE.format(title_id=die_hard['id']),
+            data={'category': categories[0]['slug'],
+                  'genre': [genres[0]['slug']]}
+        )
+        assert leaderboard(category_url) == [die_hard['name'],
+                                             terminator['name']]
+        genre_url = f'/api/v1/genres/{genres[0]["slug"]}/'
+        assert leaderboard(genre_url) == [die_hard['name'],
+                                          terminator['name']]
+        assert leaderboard(f'/api/v1/genres/{genres[2]["slug"]}/') == []
+
+        reviews_url = f'{self.TITLES_URL}{die_hard["id"]}/reviews/'
+        review = client.get(reviews_url).json()['results'][0]
+        admin_client.delete(f'{reviews_url}{review["id"]}/')
+        assert leaderboard(genre_url) == [terminator['name']]
+        admin_client.delete(
+            self.TITLES_DETAIL_URL_TEMPLATE.format(title_id=terminator['id']))
+        assert leaderboard(genre_url) == []
+        response = client.get('/api/v1/categories/missing/leaderboard/')
+        assert response.status_code == HTTPStatus.NOT_FOUND
+
+    def test_07_score_histogram(self, admin_client, user_client,
+                                moderator_client, client):
+        titles, _, _ = create_titles(admin_client)
+        title_id = titles[0]['id']
+        url = self.TITLES_DETAIL_URL_TEMPLATE.format(title_id=title_id)
+        for author_client, score in ((admin_client, 10), (user_client, 7),
+                                     (moderator_client, 7)):
+            create_single_review(author_client, title_id, 'Отзыв', score)
+
+        assert 'score_histogram' not in client.get(url).json(), (
+            'Поле `score_histogram` должно выводиться только по запросу '
+            '`?expand=score_histogram`.'
+        )
+        histogram = client.get(url, {'expand': 'score_histogram'}).json()[
+            'score_histogram']
+        assert histogram == {**{str(score): 0 for score in range(1, 11)},
+                             '7': 2, '10': 1}, (
+            'Проверьте, что гистограмма оценок обновляется при создании '
+            'отзывов.'
+        )
+        reviews_url = f'{url}reviews/'
+        reviews = {review['author']: review['id']
+                   for review in client.get(reviews_url).json()['results']}
+        user_client.patch(f'{reviews_url}{reviews["TestUser"]}/',
+                          data={'score': 1})
+        admin_client.delete(f'{reviews_url}{reviews["TestAdmin"]}/')
+        response = client.get(self.TITLES_URL, {'expand': 'score_histogram'})
+        histogram = {title['id']: title['score_histogram']
+                     for title in response.json()['results']}[title_id]
+        assert (histogram['1'], histogram['7'], histogram['10']) == (1, 1, 0)
+
+    def test_08_backfill_review_stats(self, seeded_catalog):
+        from reviews.models import SCORE_FIELDS, Title
+
+        expected = list(Title.objects.order_by('id').values_list(
+            'review_count', 'score_sum', *SCORE_FIELDS))
+        Title.objects.update(review_count=0, score_sum=0,
+                             **dict.fromkeys(SCORE_FIELDS, 0))
+        call_command('backfill_review_stats', '--workers', '1',
+                     '--chunk-size', '5', stdout=StringIO())
+        assert list(Title.objects.order_by('id').values_list(
+            'review_count', 'score_sum', *SCORE_FIELDS)) == expected
+        assert sum(row[0] for row in expected) == len(
+            seeded_catalog['reviews'])
+
+    def test_09_trending_titles(self, admin_client, user_client, client):
+        from datetime import timedelta
+
+        from django.utils import timezone
+        from reviews import services
+        from reviews.models import Review, Title
+
+        titles, _, _ = create_titles(admin_client)
+        first, second = titles[0]['id'], titles[1]['id']
+        create_single_review(admin_client, first, 'Отзыв', 10)
+        create_single_review(user_client, first, 'Отзыв', 3)
+        review = create_single_review(user_client, second, 'Отзыв', 8)
+
+        def get_trending():
+            response = client.get('/api/v1/titles/trending/')
+            assert response.status_code == HTTPStatus.OK
+            return [title['id'] for title in response.json()['results']]
+
+        assert get_trending() == [first, second], (
+            'Проверьте, что `/api/v1/titles/trending/` возвращает '
+            'произведения с отзывами по убыванию популярности.'
+        )
+        incremental = dict(Title.objects.values_list('id', 'trending_score'))
+        services.update_trending_scores()
+        recomputed = dict(Title.objects.values_list('id', 'trending_score'))
+        assert incremental[first] == pytest.approx(recomputed[first])
+        assert incremental[second] == pytest.approx(recomputed[second])
+
+        Review.objects.filter(title_id=first).update(
+            pub_date=timezone.now() - timedelta(days=30))
+        services.update_trending_scores([first])
+        assert get_trending() == [second, first], (
+            'Проверьте, что вклад отзыва в популярность убывает со временем.'
+        )
+        response = user_client.delete(
+            f'/api/v1/titles/{second}/reviews/{review.json()["id"]}/')
+        assert response.status_code == HTTPStatus.NO_CONTENT
+        assert get_trending() == [first]
+
+    def test_10_review_rollups_follow_changes(self, admin_client, user_client,
+                                              moderator_client):
+        from datetime import timedelta
+
+        from django.utils import timezone
+        from reviews.models import Review, ReviewRollup
+
+        def get_rollups():
+            return sorted(ReviewRollup.objects.values_list(
+                'period', 'bucket', 'title_id', 'category_id', 'genre_id',
+                'review_count', 'score_sum'), key=str)
+
+        def assert_matches_backfill(action):
+            incremental = get_rollups()
+            call_command('backfill_review_rollups', '--workers', '1',
+                         '--chunk-size', '2', stdout=StringIO())
+            assert incremental == get_rollups(), (
+                f'Проверьте, что сводки отзывов обновляются, когда {action}.'
+            )
+
+        titles, categories, genres = create_titles(admin_client)
+        first, second = titles[0]['id'], titles[1]['id']
+        reviews = [
+            create_single_review(author_client, title_id, 'Отзыв', score)
+            .json()['id']
+            for author_client, title_id, score in (
+                (admin_client, first, 10), (user_client, first, 4),
+                (moderator_client, second, 7), (user_client, second, 2))
+        ]
+        Review.objects.filter(id=reviews[0]).update(
+            pub_date=timezone.now() - timedelta(days=40))
+        call_command('backfill_review_rollups', '--workers', '1',
+                     stdout=StringIO())
+        assert_matches_backfill('отзывы создаются')
+
+        user_client.patch(f'/api/v1/titles/{first}/reviews/{reviews[1]}/',
+                          data={'score': 9})
+        assert_matches_backfill('меняется оценка')
+        admin_client.patch(f'/api/v1/titles/{first}/',
+                           data={'category': categories[1]['slug'],
+                                 'genre': [genres[2]['slug']]})
+        assert_matches_backfill('меняются категория и жанры произведения')
+        admin_client.delete(f'/api/v1/titles/{first}/reviews/{reviews[0]}/')
+        assert_matches_backfill('отзыв удаляется')
+        admin_client.delete(f'/api/v1/titles/{second}/')
+        assert_matches_backfill('произведение удаляется')
+        admin_client.delete(f'/api/v1/genres/{genres[2]["slug"]}/')
+        assert_matches_backfill('жанр удаляется')
+
+    def test_11_analytics_endpoints(self, admin_client, user_client, client):
+        titles, categories, genres = create_titles(admin_client)
+        create_single_review(admin_client, titles[0]['id'], 'Отзыв', 10)
+        create_single_review(user_client, titles[0]['id'], 'Отзыв', 5)
+        url = '/api/v1/analytics/categories/'
+        assert client.get(url).status_code == HTTPStatus.UNAUTHORIZED
+        assert user_client.get(url).status_code == HTTPStatus.FORBIDDEN
+
+        response = admin_client.get(url)
+        assert response.status_code == HTTPStatus.OK
+        [row] = response.json()['results']
+        assert row['category'] == categories[0]['slug']
+        assert row['period'] == 'month'
+        assert (row['review_count'], row['average_score']) == (2, 7.5)
+
+        response = admin_client.get('/api/v1/analytics/genres/', {
+            'period': 'day', 'genre': genres[1]['slug']})
+        assert [(row['genre'], row['period'], row['review_count'])
+                for row in response.json()['results']] == [
+            (genres[1]['slug'], 'day', 2)]
+        response = admin_client.get('/api/v1/analytics/titles/', {
+            'since': '2000-01-01', 'until': '2000-12-31'})
+        assert response.json()['results'] == []
+
+    def test_12_normalized_rating(self, admin_client, user_client,
+                                  moderator_client, client):
+        from reviews.models import ReviewerStats
+
+        titles, _, _ = create_titles(admin_client)
+        first, second = titles[0]['id'], titles[1]['id']
+        for author_client, title_id, score in (
+                (admin_client, first, 3), (admin_client, second, 1),
+                (user_client, first, 10), (user_client, second, 8)):
+            create_single_review(author_client, title_id, 'Отзыв', score)
+        review = create_single_review(
+            moderator_client, second, 'Отзыв', 9).json()['id']
+        call_command('update_reviewer_stats', stdout=StringIO())
+
+        def get_ratings():
+            response = client.get(self.TITLES_URL, {
+                'ordering': '-normalized_rating',
+                'expand': 'normalized_rating'})
+            assert response.status_code == HTTPStatus.OK
+            return [(title['id'], title['normalized_rating'])
+                    for title in response.json()['results']]
+
+        assert 'normalized_rating' not in client.get(
+            self.TITLES_URL).json()['results'][0]
+        assert get_ratings() == [(first, pytest.approx(1)),
+                                 (second, pytest.approx(-2 / 3))], (
+            'Проверьте, что нормированный рейтинг - средняя оценок, '
+            'нормированных по средней и отклонению их авторов, и что по '
+            'нему можно сортировать произведения.'
+        )
+        stats = ReviewerStats.objects.get(user__username='TestAdmin')
+        assert (stats.review_count, stats.mean, stats.std) == (2, 2, 1)
+
+        # Оценка нового отзыва нормируется по обновлённой статистике автора.
+        create_single_review(moderator_client, first, 'Отзыв', 5)
+        assert dict(get_ratings())[first] == pytest.approx(1 / 3)
+        moderator_client.delete(
+            f'{self.TITLES_URL}{second}/reviews/{review}/')
+        assert dict(get_ratings())[second] == pytest.approx(-1)
+        stats = ReviewerStats.objects.get(user__username='TestModerator')
+        assert (stats.review_count, stats.mean, stats.std) == (1, 5, 0)
+
+    def test_13_comment_and_review_counters(self, admin_client, user_client,
+                                            moderator_client, client,
+                                            moderator):
+        from reviews.models import Review, Title
+
+        titles, _, _ = create_titles(admin_client)
+        first, second = titles[0]['id'], titles[1]['id']
+        review = create_single_review(
+            admin_client, first, 'Отзыв', 7).json()['id']
+        other = create_single_review(
+            moderator_client, second, 'Отзыв', 4).json()['id']
+        for author_client in (user_client, moderator_client, user_client):
+            create_single_comment(author_client, first, review, 'Текст')
+        create_single_comment(user_client, second, other, 'Текст')
+        comment = create_single_comment(
+            moderator_client, second, other, 'Текст').json()['id']
+
+        def get_counts():
+            return dict(Review.objects.values_list('id', 'comment_count'))
+
+        url = f'{self.TITLES_URL}{first}/reviews/'
+        response = client.get(url, {'expand': 'comment_count'})
+        assert response.json()['results'][0]['comment_count'] == 3, (
+            'Проверьте, что `?expand=comment_count` выводит число '
+            'комментариев к отзыву.'
+        )
+        assert 'comment_count' not in client.get(url).json()['results'][0]
+        response = client.get(self.TITLES_URL, {'expand': 'review_count'})
+        assert {title['id']: title['review_count']
+                for title in response.json()['results']} == {
+            first: 1, second: 1}
+
+        moderator_client.delete(
+            f'{self.TITLES_URL}{second}/reviews/{other}/comments/{comment}/')
+        assert get_counts() == {review: 3, other: 1}
+        # Каскадное удаление комментариев пользователя.
+        moderator.delete()
+        assert get_counts() == {review: 2}, (
+            'Проверьте, что счётчики учитывают каскадное удаление.'
+        )
+        assert dict(Title.objects.values_list('id', 'review_count')) == {
+            first: 1, second: 0}
+        admin_client.delete(f'{url}{review}/')
+        assert Title.objects.get(pk=first).review_count == 0
+
+    def test_14_verify_counters(self, seeded_catalog):
+        from reviews import services
+        from reviews.models import SCORE_FIELDS, Comment, Review, Title
+
+        def get_titles():
+            return sorted(Title.objects.values_list(
+                'id', 'review_count', 'score_sum', 'weighted_rating',
+                *SCORE_FIELDS))
+
+        reviews = seeded_catalog['reviews']
+        titles = get_titles()
+        comments = dict(Review.objects.values_list('id', 'comment_count'))
+        Title.objects.filter(pk=seeded_catalog['titles'][3].pk).update(
+            review_count=0, score_sum=0, score_1=5)
+        Review.objects.filter(pk__in=[reviews[0].pk, reviews[7].pk]).update(
+            comment_count=10)
+        output = StringIO()
+        call_command('verify_counters', '--workers', '1',
+                     '--chunk-size', '5', stdout=output)
+        assert output.getvalue().startswith(
+            'Расхождений: произведений 1, отзывов 2,'
+        ), 'Проверьте, что verify_counters находит расхождения счётчиков.'
+        assert Review.objects.get(pk=reviews[0].pk).comment_count == 10
+
+        call_command('verify_counters', '--workers', '1', '--repair',
+                     '--chunk-size', '5', stdout=StringIO())
+        assert get_titles() == titles
+        assert dict(
+            Review.objects.values_list('id', 'comment_count')) == comments
+        output = StringIO()
+        call_command('verify_counters', '--workers', '1', stdout=output)
+        assert output.getvalue().startswith(
+            'Расхождений: произведений 0, отзывов 0')
+
+        # Комментарий, записанный между сверкой и исправлением, не теряется.
+        Review.objects.filter(pk=reviews[0].pk).update(comment_count=10)
+        drift = services.review_counter_drift(reviews[0].pk,
+                                              reviews[0].pk + 1)
+        Comment.objects.create(review=reviews[0], author=reviews[1].author,
+                               text='Новый комментарий')
+        services.repair_counters(review_ids=drift)
+        assert Review.objects.get(pk=reviews[0].pk).comment_count == (
+            comments[reviews[0].pk] + 1
+        ), 'Проверьте, что --repair считает значения в момент исправления.'
+
+    def test_15_user_activity_stats(self, admin_client, user_client,
+                                    moderator_client, moderator):
+        from reviews import batch
+        from reviews.models import Comment, ReviewerStats
+
+        titles, _, _ = create_titles(admin_client)
+        first, second = titles[0]['id'], titles[1]['id']
+        review = create_single_review(
+            user_client, first, 'Отзыв', 8).json()['id']
+        create_single_review(user_client, second, 'Отзыв', 5)
+        for author_client in (user_client, moderator_client):
+            create_single_comment(author_client, first, review, 'Текст')
+        comment = create_single_comment(
+            moderator_client, first, review, 'Текст').json()
+
+        def get_stats(username):
+            response = admin_client.get(f'/api/v1/users/{username}/',
+                                        {'expand': 'stats'})
+            assert response.status_code == HTTPStatus.OK
+            return response.json()['stats']
+
+        assert 'stats' not in admin_client.get(
+            '/api/v1/users/TestUser/').json()
+        stats = get_stats('TestUser')
+        assert (stats['review_count'], stats['comment_count'],
+                stats['average_score']) == (2, 1, 6.5), (
+            'Проверьте, что `?expand=stats` выводит число отзывов и '
+            'комментариев пользователя и среднюю выставленную оценку.'
+        )
+        assert get_stats('TestModerator') == {
+            'review_count': 0, 'comment_count': 2, 'average_score': None,
+            'last_activity': comment['pub_date']}
+        assert get_stats('TestAdmin') == {
+            'review_count': 0, 'comment_count': 0, 'average_score': None,
+            'last_activity': None}
+        response = moderator_client.get('/api/v1/users/me/',
+                                        {'expand': 'stats'})
+        assert response.json()['stats']['comment_count'] == 2
+
+        moderator_client.delete(
+            f'{self.TITLES_URL}{first}/reviews/{review}/comments/'
+            f'{comment["id"]}/')
+        earlier = admin_client.get(
+            f'{self.TITLES_URL}{first}/reviews/{review}/comments/'
+            f'{Comment.objects.get(author=moderator).id}/').json()
+        assert get_stats('TestModerator')['last_activity'] == (
+            earlier['pub_date']
+        ), 'Проверьте, что после удаления пересчитывается время публикации.'
+
+        def get_rows():
+            return sorted(ReviewerStats.objects.values_list(
+                'user_id', 'review_count', 'score_sum', 'comment_count',
+                'last_activity'))
+
+        # Удаление отзыва удаляет каскадом и комментарии к нему.
+        user_client.delete(f'{self.TITLES_URL}{first}/reviews/{review}/')
+        incremental = get_rows()
+        batch.update_reviewer_stats()
+        assert get_rows() == [
+            row for row in incremental if row[1] or row[3]
+        ], 'Проверьте, что статистика совпадает с полным пересчётом.'
+
+    def test_16_counters_share_write_transaction(self, admin_client,
+                                                 user_client, monkeypatch):
+        from reviews import services
+        from reviews.models import Review, Title
+
+        titles, _, _ = create_titles(admin_client)
+        title_id = titles[0]['id']
+
+        def fail(*args, **kwargs):
+            raise RuntimeError('Сбой при обновлении сводок')
+
+        monkeypatch.setattr(services, 'review_rollups_changed', fail)
+        user_client.raise_request_exception = False
+        response = user_client.post(
+            f'{self.TITLES_URL}{title_id}/reviews/',
+            data={'text': 'Отзыв', 'score': 7})
+        assert response.status_code == HTTPStatus.INTERNAL_SERVER_ERROR
+        assert not Review.objects.filter(title_id=title_id).exists(), (
+            'Проверьте, что отзыв и обновление счётчиков записываются '
+            'одной транзакцией.'
+        )
+        title = Title.objects.get(pk=title_id)
+        assert (title.review_count, title.score_sum, title.score_7) == (
+            0, 0, 0)
+
+    def test_17_author_titles_follow_author_stats(self, admin_client,
+                                                  user_client,
+                                                  moderator_client):
+        from reviews import batch
+        from reviews.models import Title
+
+        titles, _, _ = create_titles(admin_client)
+        first, second = titles[0]['id'], titles[1]['id']
+        create_single_review(admin_client, first, 'Отзыв', 2)
+        create_single_review(user_client, first, 'Отзыв', 6)
+        create_single_review(moderator_client, first, 'Отзыв', 9)
+        review = create_single_review(
+            admin_client, second, 'Отзыв', 10).json()['id']
+
+        def get_ratings():
+            return dict(Title.objects.values_list('id', 'normalized_rating'))
+
+        def assert_matches_batch(action):
+            incremental = get_ratings()
+            batch.update_reviewer_stats()
+            assert incremental == pytest.approx(get_ratings()), (
+                'Проверьте, что после изменения статистики автора '
+                f'пересчитываются все его произведения ({action}).'
+            )
+
+        assert_matches_batch('новый отзыв')
+        admin_client.patch(f'{self.TITLES_URL}{second}/reviews/{review}/',
+                           data={'score': 4})
+        assert_matches_batch('изменение оценки')
+        admin_client.delete(f'{self.TITLES_URL}{second}/reviews/{review}/')
+        assert_matches_batch('удаление отзыва')
+
+    def test_18_web_process_does_not_import_numpy(self):
+        import os
+        import subprocess
+        import sys
+
+        code = (
+            'import sys, django; django.setup(); '
+            'from django.urls import resolve; '
+            'resolve("/api/v1/titles/"); import api.views, reviews.signals; '
+            'print("numpy" in sys.modules)'
+        )
+        output = subprocess.run(
+            [sys.executable, '-c', code], capture_output=True, text=True,
+            cwd=os.path.join(os.path.dirname(os.path.dirname(__file__)),
+                             'api_yamdb'),
+            env={**os.environ, 'DJANGO_SETTINGS_MODULE': 'api_yamdb.settings'},
+            check=True).stdout
+        assert output.strip() == 'False', (
+            'NumPy нужен только командам управления (reviews/batch.py) и '
+            'не должен загружаться в веб-процессе.'
+        )
+
+    def test_19_similar_titles_update_after_commit(self, monkeypatch,
+                                                   seeded_catalog):
+        from django.db import transaction
+
+        from reviews import services
+
+        calls = []
+        monkeypatch.setattr(services, 'update_similar_titles', calls.append)
+        titles, genres = seeded_catalog['titles'], seeded_catalog['genres']
+        with transaction.atomic():
+            titles[0].genre.set(genres[:3])
+            titles[1].genre.clear()
+            assert calls == [], (
+                'Проверьте, что похожие произведения пересчитываются только '
+                'после фиксации транзакции.'
+            )
+        assert calls == [sorted({titles[0].pk, titles[1].pk})], (
+            'Проверьте, что изменения жанров за транзакцию пересчитываются '
+            'одним вызовом `update_similar_titles`.'
+        )
+
+    def test_20_stale_instance_keeps_counters(self, seeded_catalog,
+                                              django_user_model):
+        from reviews.models import Comment, Review, Title
+
+        title = seeded_catalog['titles'][0]
+        stale = Title.objects.get(pk=title.pk)
+        author = django_user_model.objects.create_user(
+            username='late_reviewer', email='late_reviewer@yamdb.fake')
+        review = Review.objects.create(
+            title=title, author=author, text='Отзыв', score=4)
+        stale_review = Review.objects.get(pk=review.pk)
+        Comment.objects.create(review=review, author=review.author,
+                               text='Комментарий')
+        expected = Title.objects.values().get(pk=title.pk)
+
+        stale.name = 'Новое название'
+        stale.save()
+        stale_review.text = 'Исправленный отзыв'
+        stale_review.save()
+        assert Title.objects.values().get(pk=title.pk) == {
+            **expected, 'name': 'Новое название'}, (
+            'Проверьте, что сохранение произведения не перезаписывает '
+            'счётчики, обновлённые после его загрузки.'
+        )
+        assert Review.objects.get(pk=review.pk).comment_count == 1
+        review.delete()
+        assert Title.objects.get(pk=title.pk).review_count == (
+            expected['review_count'] - 1)
+
+    def test_21_leaderboards_rebuilt_once_per_transaction(
+            self, monkeypatch, seeded_catalog, django_user_model):
+        from django.db import transaction
+
+        from reviews import services
+        from reviews.models import Review
+
+        calls = []
+        monkeypatch.setattr(services, 'update_leaderboards',
+                            lambda *ids: calls.append(ids))
+        titles = seeded_catalog['titles']
+        deleted = titles[3]
+        title_ids = sorted(title.pk for title in titles[:4])
+        genre_ids = sorted(deleted.genre.values_list('id', flat=True))
+        author = django_user_model.objects.create_user(
+            username='bulk_reviewer', email='bulk_reviewer@yamdb.fake')
+        with transaction.atomic():
+            for title in titles[:3]:
+                Review.objects.create(title=title, author=author,
+                                      text='Отзыв', score=9)
+            deleted.delete()
+            assert calls == []
+        assert calls == [(title_ids, [deleted.category_id], genre_ids)], (
+            'Проверьте, что рейтинги перестраиваются один раз за '
+            'транзакцию по объединённым id.'
+        )
+
+    def test_22_genre_bit_taken_concurrently(self, monkeypatch):
+        from reviews.models import Genre
+
+        taken = Genre.objects.create(name='Драма', slug='drama')
+        free_bit = Genre.free_bit
+        # Первый выбор устарел: тот же бит уже занял параллельный запрос.
+        picks = [taken.bit]
+        monkeypatch.setattr(Genre, 'free_bit', staticmethod(
+            lambda: picks.pop() if picks else free_bit()))
+        genre = Genre.objects.create(name='Комедия', slug='comedy')
+        assert genre.bit is not None and genre.bit != taken.bit, (
+            'Проверьте, что при занятом параллельно бите жанр получает '
+            'другой свободный бит.'
+        )
+        assert Genre.objects.get(pk=genre.pk).bit == genre.bit
+
+    def test_23_genres_without_free_bits(self, admin_client, client):
+        from reviews.models import GENRE_MASK_BITS, Genre
+
+        titles, _, genres = create_titles(admin_client)
+        used = Genre.objects.count()
+        Genre.objects.bulk_create(
+            Genre(name=f'Жанр {bit}', slug=f'filler-{bit}', bit=bit)
+            for bit in range(used, GENRE_MASK_BITS)
+        )
+        response = admin_client.post('/api/v1/genres/', data={
+            'name': 'Нуар', 'slug': 'noir'})
+        assert response.status_code == HTTPStatus.CREATED
+        assert Genre.objects.get(slug='noir').bit is None, (
+            'Проверьте, что жанр без свободного бита сохраняется без бита.'
+        )
+        response = admin_client.patch(
+            self.TITLES_DETAIL_URL_TEMPLATE.format(title_id=titles[0]['id']),
+            data={'genre': [genres[0]['slug'], 'noir']}
+        )
+        assert response.status_code == HTTPStatus.OK
+        assert self.get_title_names(client, genre='noir') == {
+            titles[0]['name']}, (
+            'Проверьте, что фильтр по жанру без бита работает через JOIN.'
+        )
+        assert self.get_title_names(client, genre=genres[0]['slug']) == {
+            titles[0]['name']}
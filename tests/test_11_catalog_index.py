@@ -0,0 +1,208 @@
+from http import HTTPStatus
+from io import StringIO
+
+import pytest
+
+from django.core.management import call_command
+
+from tests.utils import create_reviews, create_single_review
+
+QUERY_VARIANTS = (
+    {},
+    {'page': 2},
+    {'name': 'ПРОИЗВЕДЕНИЕ 0'},
+    {'name': 'изведение 1'},
+    {'year': 1955},
+    {'genre': 'genre-1'},
+    {'genre': 'seed'},
+    {'category': 'category-2', 'genre': 'genre-3'},
+    {'category': 'missing'},
+)
+
+
+def get_both(settings, client, url, params):
+    '''Ответы из базы данных и из включённого индекса каталога.'''
+    backend = settings.CATALOG_INDEX['BACKEND']
+    settings.CATALOG_INDEX = {**settings.CATALOG_INDEX, 'BACKEND': None}
+    expected = client.get(url, params)
+    settings.CATALOG_INDEX = {**settings.CATALOG_INDEX, 'BACKEND': backend}
+    actual = client.get(url, params)
+    return expected, actual
+
+
+@pytest.mark.django_db(transaction=True)
+class Test11CatalogIndex:
+
+    TITLES_URL = '/api/v1/titles/'
+
+    @pytest.fixture
+    def catalog_index(self, settings, tmp_path):
+        from api import catalog
+
+        settings.CATALOG_INDEX = {
+            **settings.CATALOG_INDEX, 'BACKEND': 'memory',
+            'VERSION_PATH': str(tmp_path / 'catalog.version'),
+        }
+        index = catalog.get_index()
+        index.invalidate()
+        yield index
+        index.invalidate()
+
+    def get_both(self, settings, client, params):
+        return get_both(settings, client, self.TITLES_URL, params)
+
+    def test_01_same_response_as_database(self, settings, client,
+                                          seeded_catalog, catalog_index):
+        for params in QUERY_VARIANTS:
+            expected, actual = self.get_both(settings, client, params)
+            assert actual.status_code == expected.status_code
+            assert actual.json() == expected.json(), (
+                f'Ответ индекса каталога для {params} отличается от ответа '
+                'из базы данных.'
+            )
+
+    def test_02_no_queries_when_warm(self, client, seeded_catalog,
+                                     catalog_index, query_budget):
+        client.get(self.TITLES_URL)
+        with query_budget(max_queries=0, label='GET /titles/ из индекса'):
+            response = client.get(self.TITLES_URL, {'genre': 'genre-2'})
+        assert response.status_code == HTTPStatus.OK
+
+    def test_03_incremental_refresh(self, settings, admin_client, client,
+                                    admin, user_client, catalog_index):
+        reviews, titles = create_reviews(admin_client, {admin: admin_client})
+        client.get(self.TITLES_URL)
+        admin_client.patch(f'{self.TITLES_URL}{titles[1]["id"]}/',
+                           data={'name': 'Аватар', 'genre': ['comedy']})
+        create_single_review(user_client, titles[0]['id'], 'Отзыв', 10)
+        admin_client.delete(f'{self.TITLES_URL}{titles[0]["id"]}/reviews/'
+                            f'{reviews[0]["id"]}/')
+        self.check_same_responses(settings, client)
+        assert catalog_index.catalog is not None
+
+        admin_client.delete('/api/v1/genres/horror/')
+        self.check_same_responses(settings, client)
+
+    def check_same_responses(self, settings, client):
+        for params in ({}, {'genre': 'comedy'}, {'name': 'Аватар'}):
+            expected, actual = self.get_both(settings, client, params)
+            assert actual.json() == expected.json(), (
+                'Проверьте, что индекс каталога обновляется после изменения '
+                'произведений и отзывов.'
+            )
+
+    def test_04_unsupported_params_fall_back(self, client, seeded_catalog,
+                                             catalog_index):
+        response = client.get(self.TITLES_URL, {'year': 'дветыщи'})
+        assert response.status_code == HTTPStatus.BAD_REQUEST
+
+    def test_05_version_shared_between_processes(self, client,
+                                                 seeded_catalog,
+                                                 catalog_index):
+        import multiprocessing
+
+        from api import catalog
+        from reviews.models import Title
+
+        title = seeded_catalog['titles'][0]
+        client.get(self.TITLES_URL)
+        # Изменение без сигналов: о нём сообщает другой воркер.
+        Title.objects.filter(pk=title.pk).update(name='Изменено')
+        worker = multiprocessing.get_context('fork').Process(
+            target=catalog.bump_shared_version)
+        worker.start()
+        worker.join()
+        names = [row['name'] for row in client.get(
+            self.TITLES_URL, {'name': 'Изменено'}).json()['results']]
+        assert names == ['Изменено'], (
+            'Проверьте, что индекс каталога замечает изменения, о которых '
+            'сообщил другой процесс.'
+        )
+
+
+@pytest.mark.django_db(transaction=True)
+class Test11CatalogSnapshot:
+
+    URLS = {
+        '/api/v1/titles/': QUERY_VARIANTS,
+        '/api/v1/categories/': ({}, {'search': 'Категория 1'}, {'search': 'рия,1'}),
+        '/api/v1/genres/': ({}, {'search': 'Жанр'}, {'search': 'нет'}),
+    }
+
+    @pytest.fixture
+    def snapshot(self, settings, tmp_path):
+        from api.snapshot import snapshot_catalog
+
+        settings.CATALOG_INDEX = {
+            **settings.CATALOG_INDEX, 'BACKEND': 'snapshot',
+            'SNAPSHOT_PATH': str(tmp_path / 'catalog.snapshot'),
+            'VERSION_PATH': str(tmp_path / 'catalog.version'),
+        }
+        yield snapshot_catalog
+        snapshot_catalog.snapshot = snapshot_catalog.identity = None
+
+    def test_01_same_response_as_database(self, settings, client,
+                                          seeded_catalog, snapshot):
+        call_command('build_catalog_snapshot', stdout=StringIO())
+        for url, variants in self.URLS.items():
+            for params in variants:
+                expected, actual = get_both(settings, client, url, params)
+                assert actual.json() == expected.json(), (
+                    f'Ответ снимка каталога для {url} {params} отличается '
+                    'от ответа из базы данных.'
+                )
+
+    @pytest.mark.parametrize('url,max_queries', (
+        # Рейтинги страницы - один запрос по первичному ключу.
+        ('/api/v1/titles/', 1),
+        ('/api/v1/categories/', 0),
+        ('/api/v1/genres/', 0),
+    ))
+    def test_02_no_queries(self, client, seeded_catalog, snapshot,
+                           query_budget, url, max_queries):
+        call_command('build_catalog_snapshot', stdout=StringIO())
+        with query_budget(max_queries=max_queries,
+                          label=f'GET {url} из снимка'):
+            response = client.get(url)
+        assert response.status_code == HTTPStatus.OK
+
+    def test_03_stale_snapshot_is_not_used(self, settings, admin_client,
+                                           client, seeded_catalog, snapshot):
+        call_command('build_catalog_snapshot', stdout=StringIO())
+        title = client.get('/api/v1/titles/').json()['results'][0]
+        admin_client.patch(f'/api/v1/titles/{title["id"]}/',
+                           data={'name': 'Аватар'})
+        assert snapshot.ready() is None, (
+            'Снимок, собранный до изменения каталога, не должен '
+            'использоваться.'
+        )
+        response = client.get('/api/v1/titles/', {'name': 'Аватар'})
+        assert response.json()['count'] == 1
+
+        call_command('build_catalog_snapshot', stdout=StringIO())
+        assert snapshot.ready() is not None, (
+            'Проверьте, что пересобранный снимок подхватывается без '
+            'перезапуска процесса.'
+        )
+        expected, actual = get_both(settings, client, '/api/v1/titles/',
+                                    {'name': 'Аватар'})
+        assert actual.json() == expected.json()
+
+    def test_04_reviews_keep_snapshot_fresh(self, settings, user_client,
+                                            client, seeded_catalog,
+                                            snapshot):
+        call_command('build_catalog_snapshot', stdout=StringIO())
+        title = seeded_catalog['titles'][0]
+        title.reviews.all().delete()
+        create_single_review(user_client, title.id, 'Отзыв', 10)
+        assert snapshot.ready() is not None, (
+            'Отзывы не меняют снимок каталога: он должен использоваться '
+            'и после записи отзывов.'
+        )
+        expected, actual = get_both(settings, client, '/api/v1/titles/',
+                                    {'name': title.name})
+        assert actual.json() == expected.json(), (
+            'Проверьте, что рейтинг в ответе из снимка учитывает новые '
+            'отзывы.'
+        )
+        assert actual.json()['results'][0]['rating'] == 10
@@ -0,0 +1,84 @@
+from http import HTTPStatus
+from io import StringIO
+
+import pytest
+from django.core.management import call_command
+
+URL = '/api/v1/users/me/recommendations/'
+
+
+@pytest.mark.django_db(transaction=True)
+class Test12Recommendations:
+
+    @pytest.fixture
+    def score_matrix(self, django_user_model, user):
+        '''Две группы пользователей с противоположными вкусами; `user`
+        оценил часть произведений как первая группа.'''
+        from reviews.models import Review, Title
+
+        titles = [Title.objects.create(name=f'Произведение {number}',
+                                       year=2000)
+                  for number in range(6)]
+        for number in range(6):
+            author = django_user_model.objects.create_user(
+                username=f'critic_{number}', email=f'critic_{number}@y.fake')
+            liked = titles[:3] if number < 3 else titles[3:]
+            for title in titles:
+                score = 9 + number % 2 if title in liked else 1 + number % 2
+                Review.objects.create(title=title, author=author,
+                                      text='Отзыв', score=score)
+        for title, score in zip(titles, (10, 9, None, 2, 1, None)):
+            if score:
+                Review.objects.create(title=title, author=user,
+                                      text='Отзыв', score=score)
+        return titles
+
+    def build(self, *args):
+        call_command('build_recommendations', '--rank', '2', *args,
+                     stdout=StringIO())
+
+    def test_01_recommendations_follow_similar_users(self, user_client,
+                                                     score_matrix):
+        self.build()
+        response = user_client.get(URL)
+        assert response.status_code == HTTPStatus.OK
+        names = [title['name'] for title in response.json()]
+        assert names == [score_matrix[2].name, score_matrix[5].name], (
+            'Проверьте, что `/api/v1/users/me/recommendations/` возвращает '
+            'неоценённые произведения по убыванию прогноза.'
+        )
+        assert set(response.json()[0]) == {
+            'id', 'name', 'year', 'rating', 'description', 'genre',
+            'category'
+        }
+
+    def test_02_reviewed_titles_are_hidden(self, user_client, user,
+                                           score_matrix):
+        from reviews.models import Review
+
+        self.build('--top-n', '1')
+        Review.objects.create(title=score_matrix[2], author=user,
+                              text='Отзыв', score=10)
+        assert user_client.get(URL).json() == []
+
+    def test_03_parallel_workers_give_same_result(self, monkeypatch,
+                                                  score_matrix):
+        from reviews import recommender
+        from reviews.models import Recommendation
+
+        def recommendations():
+            return sorted(
+                (user_id, title_id, round(score, 4))
+                for user_id, title_id, score in
+                Recommendation.objects.values_list('user', 'title', 'score')
+            )
+
+        self.build('--workers', '1')
+        expected = recommendations()
+        monkeypatch.setattr(recommender, 'BLOCK_CELLS', 6)
+        self.build('--workers', '2', '--chunk-size', '5')
+        assert recommendations() == expected
+        assert len(expected) == 2
+
+    def test_04_anonymous_gets_unauthorized(self, client):
+        assert client.get(URL).status_code == HTTPStatus.UNAUTHORIZED
@@ -0,0 +1,99 @@
+from io import StringIO
+
+import numpy as np
+import pytest
+from django.core.management import call_command
+
+
+@pytest.mark.django_db(transaction=True)
+class Test13ReviewColumns:
+
+    def export(self, directory, *args):
+        call_command('export_review_columns', '--output', str(directory),
+                     '--chunk-size', '7', *args, stdout=StringIO())
+
+    def test_01_columns_match_reviews(self, tmp_path, seeded_catalog):
+        from reviews import columns
+        from reviews.models import Review
+
+        self.export(tmp_path)
+        exported = columns.load_columns(tmp_path)
+        assert isinstance(exported['score'], np.memmap), (
+            'Проверьте, что `load_columns` отображает колонки в память '
+            'без копирования.'
+        )
+        rows = list(Review.objects.order_by('id').values_list(
+            'id', 'title_id', 'author_id', 'score', 'pub_date'))
+        assert exported['id'].tolist() == [row[0] for row in rows]
+        assert exported['title_id'].tolist() == [row[1] for row in rows]
+        assert exported['author_id'].tolist() == [row[2] for row in rows]
+        assert exported['score'].tolist() == [row[3] for row in rows]
+        assert exported['pub_date'].tolist() == [
+            int(row[4].timestamp()) for row in rows]
+
+    def test_02_incremental_append(self, tmp_path, seeded_catalog):
+        from reviews import columns
+        from reviews.models import Review
+
+        self.export(tmp_path)
+        path = columns.column_path(tmp_path, 'reviews', 'score')
+        with open(path, 'rb') as column:
+            scores = column.read()
+        review = seeded_catalog['reviews'][0]
+        Review.objects.filter(pk=review.pk).delete()
+        title = seeded_catalog['titles'][0]
+        created = Review.objects.create(
+            title=title, author=review.author, text='Отзыв', score=3)
+        # Прерванная дозапись: колонка оценок длиннее остальных.
+        columns.append_column(path, np.array([1], dtype=np.int8))
+        self.export(tmp_path)
+
+        exported = columns.load_columns(tmp_path)
+        total = len(seeded_catalog['reviews']) + 1
+        assert len(exported['id']) == len(exported['score']) == total, (
+            'Проверьте, что выгрузка дописывает только отзывы с id больше '
+            'последнего выгруженного.'
+        )
+        assert exported['id'][-1] == created.pk
+        assert exported['score'][-1] == 3
+        # Заголовок .npy изменился только в поле размера.
+        header = len(scores) - total + 1
+        with open(path, 'rb') as column:
+            assert column.read()[header:-1] == scores[header:], (
+                'Проверьте, что выгруженные данные не переписываются.'
+            )
+
+        self.export(tmp_path, '--full')
+        assert len(columns.load_columns(tmp_path)['id']) == total - 1
+
+    def test_03_average_score_by_category(self, tmp_path, seeded_catalog):
+        from django.db.models import Avg
+        from reviews import columns
+        from reviews.models import Review
+
+        self.export(tmp_path)
+        expected = dict(Review.objects.order_by().values_list(
+            'title__category').annotate(Avg('score')))
+        assert columns.average_score_by_category(tmp_path) == (
+            pytest.approx(expected))
+
+    def test_04_big_ids(self, tmp_path, seeded_catalog):
+        from reviews import columns
+        from reviews.models import Review, Title
+
+        big_id = 2 ** 31 + 7
+        review = seeded_catalog['reviews'][0]
+        title = Title.objects.create(
+            id=big_id, name='Большой id', year=2000,
+            category=review.title.category)
+        Review.objects.create(id=big_id, title=title, author=review.author,
+                              text='Отзыв', score=7)
+        self.export(tmp_path)
+
+        exported = columns.load_columns(tmp_path)
+        assert exported['id'][-1] == big_id
+        assert exported['title_id'][-1] == big_id, (
+            'Проверьте, что id в выгрузке не обрезаются до 32 бит: '
+            'первичные ключи - BigAutoField.'
+        )
+        assert columns.load_columns(tmp_path, 'titles')['id'][-1] == big_id
@@ -0,0 +1,124 @@
+import datetime
+import io
+from collections import OrderedDict
+from decimal import Decimal
+from http import HTTPStatus
+
+import pytest
+from django.utils import timezone
+from django.utils.translation import gettext_lazy
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+
+SAMPLE = OrderedDict((
+    ('id', 1),
+    ('name', 'Произведение\u2028«1»\u2029'),
+    ('pub_date', datetime.datetime(2023, 5, 1, 12, 30, 15, 123456,
+                                   tzinfo=datetime.timezone.utc)),
+    ('local_date', datetime.datetime(2023, 5, 1, 12, 30,
+                                     tzinfo=timezone.get_fixed_timezone(180))),
+    ('day', datetime.date(2023, 5, 1)),
+    ('price', Decimal('10.50')),
+    ('label', gettext_lazy('Категория')),
+    ('scores', {1: 2, 10: 0}),
+    ('genre', [OrderedDict((('name', 'Жанр'), ('slug', 'genre')))]),
+    ('category', None),
+))
+
+
+@pytest.mark.django_db(transaction=True)
+class Test14Renderers:
+
+    def test_01_fast_json_matches_json_renderer(self):
+        from api.renderers import FastJSONRenderer
+
+        assert FastJSONRenderer().render(SAMPLE) == JSONRenderer().render(
+            SAMPLE
+        ), (
+            'Проверьте, что FastJSONRenderer кодирует даты, Decimal и '
+            'ленивые строки так же, как JSONRenderer.'
+        )
+        assert FastJSONRenderer().render(
+            SAMPLE, 'application/json; indent=4'
+        ) == JSONRenderer().render(SAMPLE, 'application/json; indent=4')
+        assert FastJSONRenderer().render(None) == b''
+
+    def test_02_fast_json_parser(self):
+        from api.parsers import FastJSONParser
+
+        content = '{"text": "Отзыв", "score": 7, "tags": [null, true]}'
+        assert FastJSONParser().parse(
+            io.BytesIO(content.encode())
+        ) == JSONParser().parse(io.BytesIO(content.encode()))
+        assert FastJSONParser().parse(
+            io.BytesIO(content.encode('cp1251')),
+            parser_context={'encoding': 'cp1251'}
+        ) == {'text': 'Отзыв', 'score': 7, 'tags': [None, True]}
+        for invalid in (b'{"score": NaN}', b'{"score": 1', b'\xff'):
+            with pytest.raises(ParseError):
+                FastJSONParser().parse(io.BytesIO(invalid))
+
+    def test_03_api_uses_fast_json(self, user_client, seeded_catalog):
+        title = seeded_catalog['titles'][0]
+        url = f'/api/v1/titles/{title.id}/reviews/'
+        response = user_client.post(
+            url, data='{"text": "Отзыв\u2028текст", "score": 8}',
+            content_type='application/json'
+        )
+        assert response.status_code == HTTPStatus.CREATED, (
+            'Проверьте, что тело запроса в JSON разбирается FastJSONParser.'
+        )
+        assert b'\\u2028' in response.content
+        assert response.json()['text'] == 'Отзыв\u2028текст'
+        response = user_client.post(
+            url, data='{"text": ', content_type='application/json'
+        )
+        assert response.status_code == HTTPStatus.BAD_REQUEST
+
+    @pytest.mark.parametrize('url', (
+        '/api/v1/categories/',
+        '/api/v1/genres/',
+        '/api/v1/titles/',
+        '/api/v1/titles/{title_id}/',
+        '/api/v1/titles/{title_id}/reviews/',
+        '/api/v1/titles/{title_id}/reviews/{review_id}/comments/',
+        '/api/v1/users/',
+        '/api/v1/analytics/titles/',
+    ))
+    def test_04_msgpack_negotiation(self, admin_client, seeded_catalog,
+                                    url):
+        import msgpack
+
+        url = url.format(title_id=seeded_catalog['titles'][0].id,
+                         review_id=seeded_catalog['reviews'][0].id)
+        response = admin_client.get(url, HTTP_ACCEPT='application/msgpack')
+        assert response.status_code == HTTPStatus.OK
+        assert response['Content-Type'] == 'application/msgpack', (
+            f'GET {url}: проверьте, что формат ответа выбирается по Accept.'
+        )
+        expected = admin_client.get(url)
+        assert expected['Content-Type'] == 'application/json'
+        assert msgpack.unpackb(response.content) == expected.json()
+        browser = admin_client.get(url, HTTP_ACCEPT='text/html')
+        assert browser['Content-Type'].startswith('text/html')
+
+    def test_05_msgpack_request_body(self, user_client, seeded_catalog):
+        import msgpack
+
+        title = seeded_catalog['titles'][0]
+        url = f'/api/v1/titles/{title.id}/reviews/'
+        response = user_client.post(
+            url, data=msgpack.packb({'text': 'Отзыв', 'score': 9}),
+            content_type='application/msgpack',
+            HTTP_ACCEPT='application/msgpack'
+        )
+        assert response.status_code == HTTPStatus.CREATED, (
+            'Проверьте, что тело запроса в MessagePack разбирается.'
+        )
+        review = msgpack.unpackb(response.content)
+        assert (review['text'], review['score']) == ('Отзыв', 9)
+        assert review['pub_date'].endswith('Z')
+        response = user_client.post(url, data=b'\xc1',
+                                    content_type='application/msgpack')
+        assert response.status_code == HTTPStatus.BAD_REQUEST
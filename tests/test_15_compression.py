@@ -0,0 +1,161 @@
+import gzip
+import importlib
+import os
+import shutil
+from http import HTTPStatus
+from io import StringIO
+
+import pytest
+from django.core.management import call_command
+from django.http import HttpResponse, StreamingHttpResponse
+from django.test import RequestFactory
+from django.urls import Resolver404, clear_url_caches, resolve
+from django.utils.http import http_date
+
+STATIC_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)),
+                          'api_yamdb', 'static')
+
+
+def compress(response, accept_encoding='gzip, deflate'):
+    from api.middleware import CompressionMiddleware
+
+    request = RequestFactory().get('/', HTTP_ACCEPT_ENCODING=accept_encoding)
+    return CompressionMiddleware(lambda request: response)(request)
+
+
+def reload_urls():
+    import api_yamdb.urls
+
+    clear_url_caches()
+    importlib.reload(api_yamdb.urls)
+
+
+@pytest.fixture
+def debug_urls(settings):
+    settings.DEBUG = True
+    reload_urls()
+    yield
+    settings.DEBUG = False
+    reload_urls()
+
+
+@pytest.mark.django_db(transaction=True)
+class Test15Compression:
+
+    def test_01_api_responses_are_compressed(self, client, seeded_catalog):
+        url = '/api/v1/titles/'
+        plain = client.get(url)
+        response = client.get(url, HTTP_ACCEPT_ENCODING='gzip')
+        assert response.status_code == HTTPStatus.OK
+        assert response['Content-Encoding'] == 'gzip', (
+            'Проверьте, что CompressionMiddleware сжимает ответы API.'
+        )
+        assert 'Accept-Encoding' in response['Vary']
+        assert gzip.decompress(response.content) == plain.content
+        assert not plain.has_header('Content-Encoding')
+        refused = client.get(url, HTTP_ACCEPT_ENCODING='gzip;q=0, br')
+        assert not refused.has_header('Content-Encoding')
+
+    def test_02_skipped_responses(self, settings):
+        settings.COMPRESSION = {**settings.COMPRESSION, 'MIN_SIZE': 100}
+        body = 'Длинный текст отзыва. ' * 20
+        assert not compress(HttpResponse(
+            body[:40], content_type='text/plain')).has_header(
+            'Content-Encoding'), 'Короткие ответы не сжимаются.'
+        assert not compress(HttpResponse(
+            body, content_type='application/octet-stream'
+        )).has_header('Content-Encoding'), (
+            'Сжимаются только типы из COMPRESSION["CONTENT_TYPES"].'
+        )
+        assert not compress(HttpResponse(
+            body, content_type='text/html; charset=utf-8'
+        )).has_header('Content-Encoding'), (
+            'HTML с CSRF-токеном не должен сжиматься (BREACH).'
+        )
+        not_modified = HttpResponse(body, content_type='text/plain',
+                                    status=HTTPStatus.NOT_MODIFIED)
+        assert not compress(not_modified).has_header('Content-Encoding'), (
+            'Ответ 304 не должен сжиматься.'
+        )
+        response = compress(HttpResponse(body, content_type='text/plain'),
+                            'identity')
+        assert not response.has_header('Content-Encoding')
+        assert 'Accept-Encoding' in response['Vary']
+        response = compress(HttpResponse(body, content_type='text/plain'))
+        assert response['Content-Encoding'] == 'gzip'
+        assert gzip.decompress(response.content).decode() == body
+        assert response['Content-Length'] == str(len(response.content))
+
+    def test_03_streaming_responses(self, settings):
+        settings.COMPRESSION = {**settings.COMPRESSION, 'MIN_SIZE': 100}
+        consumed = []
+
+        def chunks():
+            for number in range(50):
+                consumed.append(number)
+                yield f'{{"id": {number}, "text": "Отзыв"}},'.encode()
+
+        response = compress(StreamingHttpResponse(
+            chunks(), content_type='application/json'))
+        assert response['Content-Encoding'] == 'gzip'
+        assert not consumed, (
+            'Потоковый ответ должен сжиматься по мере чтения, а не целиком.'
+        )
+        content = b''.join(response.streaming_content)
+        assert gzip.decompress(content) == b''.join(
+            f'{{"id": {number}, "text": "Отзыв"}},'.encode()
+            for number in range(50))
+        short = StreamingHttpResponse([b'{}'],
+                                      content_type='application/json')
+        short['Content-Length'] = '2'
+        assert not compress(short).has_header('Content-Encoding')
+
+    def test_04_precompressed_static(self, client, settings, tmp_path,
+                                     debug_urls):
+        settings.STATIC_ROOT = str(tmp_path)
+        shutil.copy(os.path.join(STATIC_DIR, 'redoc.yaml'), tmp_path)
+        with open(tmp_path / 'small.css', 'w') as small:
+            small.write('body {}')
+        call_command('compress_static', stdout=StringIO())
+        assert (tmp_path / 'redoc.yaml.gz').exists()
+        assert not (tmp_path / 'small.css.gz').exists(), (
+            'Файлы короче COMPRESSION["MIN_SIZE"] не сжимаются.'
+        )
+        original = (tmp_path / 'redoc.yaml').read_bytes()
+
+        response = client.get('/static/redoc.yaml',
+                              HTTP_ACCEPT_ENCODING='gzip')
+        assert response.status_code == HTTPStatus.OK
+        assert response['Content-Encoding'] == 'gzip', (
+            'Проверьте, что сжатая копия отдаётся с Content-Encoding: gzip.'
+        )
+        content = b''.join(response.streaming_content)
+        assert content == (tmp_path / 'redoc.yaml.gz').read_bytes()
+        assert gzip.decompress(content) == original
+        assert response['Content-Type'] == 'application/yaml'
+
+        response = client.get('/static/redoc.yaml')
+        assert not response.has_header('Content-Encoding')
+        assert b''.join(response.streaming_content) == original
+
+        response = client.get(
+            '/static/redoc.yaml', HTTP_ACCEPT_ENCODING='gzip',
+            HTTP_IF_MODIFIED_SINCE=http_date(
+                os.stat(tmp_path / 'redoc.yaml').st_mtime))
+        assert response.status_code == HTTPStatus.NOT_MODIFIED
+
+        # Файл изменился после сжатия - копия больше не отдаётся.
+        with open(tmp_path / 'redoc.yaml', 'ab') as changed:
+            changed.write(b'\n# changed\n')
+        os.utime(tmp_path / 'redoc.yaml',
+                 ns=(0, os.stat(tmp_path / 'redoc.yaml').st_mtime_ns + 1))
+        response = client.get('/static/redoc.yaml',
+                              HTTP_ACCEPT_ENCODING='gzip')
+        assert gzip.decompress(
+            b''.join(response.streaming_content)
+        ).endswith(b'# changed\n')
+
+    def test_05_static_route_only_in_debug(self):
+        # Без DEBUG статику отдаёт веб-сервер, маршрута /static/ нет.
+        with pytest.raises(Resolver404):
+            resolve('/static/redoc.yaml')
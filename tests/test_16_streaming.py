@@ -0,0 +1,81 @@
+import json
+from http import HTTPStatus
+
+import pytest
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+
+def read_pages(client, url):
+    results = []
+    while url:
+        data = client.get(url).json()
+        results.extend(data['results'])
+        url = data['next']
+    return results
+
+
+@pytest.mark.django_db(transaction=True)
+class Test16Streaming:
+
+    @pytest.mark.parametrize('url,table', (
+        ('/api/v1/users/', 'users_user'),
+        ('/api/v1/titles/{title_id}/reviews/', 'reviews_review'),
+        ('/api/v1/titles/{title_id}/reviews/?fields=id,author',
+         'reviews_review'),
+    ))
+    def test_01_streamed_list_matches_pages(self, admin_client,
+                                            seeded_catalog, monkeypatch,
+                                            url, table):
+        from api.mixins import StreamingListMixin
+
+        monkeypatch.setattr(StreamingListMixin, 'stream_chunk_size', 3)
+        url = url.format(title_id=seeded_catalog['titles'][0].id)
+        separator = '&' if '?' in url else '?'
+        with CaptureQueriesContext(connection) as context:
+            response = admin_client.get(f'{url}{separator}stream=1')
+        assert response.status_code == HTTPStatus.OK
+        assert response.streaming, (
+            'Проверьте, что `?stream=1` возвращает StreamingHttpResponse.'
+        )
+        assert response['Content-Type'] == 'application/json'
+        # Запросы с LIMIT - аутентификация и поиск произведения.
+        assert not any(f'FROM "{table}"' in query['sql']
+                       and 'LIMIT' not in query['sql']
+                       for query in context.captured_queries), (
+            'Строки списка должны читаться при отдаче ответа, а не до неё.'
+        )
+        with CaptureQueriesContext(connection) as context:
+            content = b''.join(response.streaming_content)
+        assert len(context.captured_queries) == 1, (
+            'Весь список должен читаться одним запросом через iterator().'
+        )
+        assert json.loads(content) == read_pages(admin_client, url)
+
+    def test_02_stream_permissions_and_empty_list(self, admin_client,
+                                                  user_client):
+        from reviews.models import Title
+
+        title = Title.objects.create(name='Без отзывов', year=2000)
+        url = f'/api/v1/titles/{title.id}/reviews/?stream=1'
+        response = admin_client.get(url)
+        assert response.status_code == HTTPStatus.OK
+        assert b''.join(response.streaming_content) == b'[]'
+        assert user_client.get(url).status_code == HTTPStatus.FORBIDDEN, (
+            'Потоковый список доступен только администраторам.'
+        )
+        assert user_client.get(
+            url.replace('?stream=1', '')
+        ).status_code == HTTPStatus.OK
+
+    def test_03_stream_only_json(self, admin_client, seeded_catalog):
+        url = (f'/api/v1/titles/{seeded_catalog["titles"][0].id}/reviews/'
+               '?stream=1')
+        response = admin_client.get(url, HTTP_ACCEPT='application/msgpack')
+        assert response.status_code == HTTPStatus.NOT_ACCEPTABLE, (
+            'Проверьте, что `?stream=1` с `Accept: application/msgpack` '
+            'возвращает 406, а не JSON.'
+        )
+        response = admin_client.get(url, HTTP_ACCEPT='application/json')
+        assert response.status_code == HTTPStatus.OK
+        assert response['Content-Type'] == 'application/json'